@@ -12,6 +12,12 @@ from flask_cors import CORS
 import os
 from dotenv import load_dotenv
 from utils.activity_middleware import ActivityTrackingMiddleware
+from utils.activity_buffer import ActivityLogBuffer
+from chat.message_queue import message_queue_options
+from chat.presence import PresenceRegistry
+from chat.room_access import RoomAccessCache
+from chat.dispatch import SupportDispatcher
+from tasks.inventory_alerts import StockAlertHook
 
 # Load environment variables
 load_dotenv()
@@ -22,6 +28,11 @@ migrate = Migrate()
 socketio = SocketIO()
 cors = CORS()
 activity_tracker = ActivityTrackingMiddleware()
+activity_log_buffer = ActivityLogBuffer()
+chat_presence = PresenceRegistry()
+chat_room_access = RoomAccessCache()
+chat_dispatcher = SupportDispatcher()
+stock_alert_hook = StockAlertHook()
 
 def create_app():
     """Application factory pattern"""
@@ -34,9 +45,14 @@ def create_app():
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(app, cors_allowed_origins="*", **message_queue_options(app.config))
     cors.init_app(app)
+    activity_log_buffer.init_app(app)  # before the tracker so its atexit drain runs last
     activity_tracker.init_app(app)
+    chat_presence.init_app(app)
+    chat_room_access.init_app(app)
+    chat_dispatcher.init_app(app)
+    stock_alert_hook.init_app(app)
     
     # Configure login manager
     login_manager.login_view = 'auth.login'
@@ -2,7 +2,7 @@
 Admin Blueprint
 Administrative portal for managing users, services, staff assignments, and analytics
 """
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context, send_file, current_app
 from flask_login import login_required, current_user
 from models.user import User
 from models.loan import LoanApplication
@@ -11,14 +11,16 @@ from models.hotel import HotelServiceRequest
 from models.activity_tracking import ActivityLog, UsageStatistics, UserRegistration, StaffOnboarding, LoginSession
 from models.inventory import InventoryLocation, InventoryItem, StockMovement, LowStockAlert, StaffLocationAssignment
 from models.ecommerce import Product, ProductCategory
+from models.admin import BackgroundJob
 from models.jewelry import JewelryItem
 from models.automobile import Vehicle
 from utils.activity_logger import ActivityLogger
+from tasks.stock_import import StockImportService
+from tasks.jobs import BackgroundJobService
 from database import db
 from datetime import datetime, timedelta
 from utils.decorators import admin_required
 from sqlalchemy import func, and_, or_
-import pandas as pd
 import csv
 import io
 import os
@@ -87,16 +89,17 @@ def dashboard():
             ActivityLog.timestamp.desc()
         ).limit(10).all()
         
-        # Get today's statistics
+        # Get today's statistics (range predicates so activity_logs partitions are pruned)
         today = datetime.now().date()
+        today_start = datetime.combine(today, datetime.min.time())
         new_registrations_today = UserRegistration.query.filter(
-            func.date(UserRegistration.registration_date) == today
+            UserRegistration.registration_date >= today_start
         ).count()
         
         failed_logins = ActivityLog.query.filter(
             ActivityLog.activity_type == 'login',
             ActivityLog.success == False,
-            func.date(ActivityLog.timestamp) == today
+            ActivityLog.timestamp >= today_start
         ).count()
         
         # Get recent low stock alerts (last 5)
@@ -977,32 +980,18 @@ def monitoring():
     else:
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
     
-    # Get comprehensive activity data
-    all_activities = ActivityLogger.get_admin_monitoring_data(
+    # Summary statistics computed in the database
+    summary = ActivityLogger.get_activity_summary(
         start_date=start_date,
         end_date=end_date
     )
     
-    # Summary statistics
-    total_activities = len(all_activities)
-    unique_users = len(set(activity.user_id for activity in all_activities if activity.user_id))
-    failed_activities = len([a for a in all_activities if not a.success])
-    
-    # Activity breakdown by type
-    activity_types = {}
-    category_breakdown = {}
-    hourly_distribution = {}
-    
-    for activity in all_activities:
-        # By type
-        activity_types[activity.activity_type] = activity_types.get(activity.activity_type, 0) + 1
-        
-        # By category
-        category_breakdown[activity.category] = category_breakdown.get(activity.category, 0) + 1
-        
-        # By hour
-        hour = activity.timestamp.hour
-        hourly_distribution[hour] = hourly_distribution.get(hour, 0) + 1
+    # Only the most recent page of rows is rendered
+    recent_activities = ActivityLogger.get_admin_monitoring_data(
+        start_date=start_date,
+        end_date=end_date,
+        limit=100
+    )
     
     # Recent registrations
     recent_registrations = UserRegistration.query.filter(
@@ -1018,13 +1007,13 @@ def monitoring():
     active_sessions = LoginSession.query.filter_by(is_active=True).count()
     
     return render_template('admin/monitoring.html',
-                         activities=all_activities[:100],  # Limit to 100 most recent
-                         total_activities=total_activities,
-                         unique_users=unique_users,
-                         failed_activities=failed_activities,
-                         activity_types=activity_types,
-                         category_breakdown=category_breakdown,
-                         hourly_distribution=hourly_distribution,
+                         activities=recent_activities,
+                         total_activities=summary['total_activities'],
+                         unique_users=summary['unique_users'],
+                         failed_activities=summary['failed_activities'],
+                         activity_types=summary['activity_types'],
+                         category_breakdown=summary['category_breakdown'],
+                         hourly_distribution=summary['hourly_distribution'],
                          recent_registrations=recent_registrations,
                          recent_onboardings=recent_onboardings,
                          active_sessions=active_sessions,
@@ -1082,19 +1071,11 @@ def monitor_staff():
     # Get staff activities from last 7 days
     start_date = datetime.now() - timedelta(days=7)
     
-    staff_activities = {}
-    for staff in staff_members:
-        activities = ActivityLog.query.filter(
-            ActivityLog.performed_by_id == staff.id,
-            ActivityLog.timestamp >= start_date
-        ).order_by(ActivityLog.timestamp.desc()).limit(50).all()
-        
-        staff_activities[staff.id] = {
-            'staff': staff,
-            'activities': activities,
-            'total_count': len(activities),
-            'onboarding_record': StaffOnboarding.query.filter_by(staff_user_id=staff.id).first()
-        }
+    staff_activities = ActivityLogger.get_staff_activity_summaries(
+        staff_members,
+        start_date=start_date,
+        per_staff_limit=50
+    )
     
     return render_template('admin/staff_monitoring.html',
                          staff_activities=staff_activities)
@@ -1103,7 +1084,7 @@ def monitor_staff():
 @login_required
 @admin_required
 def usage_statistics():
-    """Usage statistics dashboard"""
+    """Usage statistics dashboard (reads rows precomputed by the usage rollup)"""
     # Get date range
     days = request.args.get('days', 30, type=int)
     start_date = datetime.now().date() - timedelta(days=days)
@@ -1129,15 +1110,28 @@ def usage_statistics():
         func.count(UserRegistration.id)
     ).group_by(UserRegistration.registration_method).all()
     
-    # Most active users
-    most_active_users = db.session.query(
-        User.id, User.first_name, User.last_name, User.email, User.role,
-        func.count(ActivityLog.id).label('activity_count')
-    ).join(ActivityLog, User.id == ActivityLog.user_id).filter(
-        ActivityLog.timestamp >= datetime.now() - timedelta(days=days)
-    ).group_by(User.id, User.first_name, User.last_name, User.email, User.role).order_by(
-        func.count(ActivityLog.id).desc()
-    ).limit(10).all()
+    # Most active users, merged from the per-day rollup
+    activity_counts = {}
+    for stat in daily_stats:
+        for user_id, count in stat.top_users.items():
+            activity_counts[user_id] = activity_counts.get(user_id, 0) + count
+    
+    top_user_ids = sorted(activity_counts, key=activity_counts.get, reverse=True)[:10]
+    users_by_id = {
+        user.id: user for user in User.query.filter(User.id.in_(top_user_ids)).all()
+    } if top_user_ids else {}
+    
+    most_active_users = [
+        {
+            'id': user_id,
+            'first_name': users_by_id[user_id].first_name,
+            'last_name': users_by_id[user_id].last_name,
+            'email': users_by_id[user_id].email,
+            'role': users_by_id[user_id].role,
+            'activity_count': activity_counts[user_id]
+        }
+        for user_id in top_user_ids if user_id in users_by_id
+    ]
     
     return render_template('admin/usage_statistics.html',
                          daily_stats=daily_stats,
@@ -1185,6 +1179,27 @@ def api_admin_activities():
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
         query = query.filter(ActivityLog.timestamp <= end_date)
     
+    # Cursor mode: keyset pagination on (timestamp, id), no COUNT(*) or OFFSET
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            activities, next_cursor = ActivityLogger.get_activities_page(
+                query, cursor=cursor, limit=per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = {
+            'activities': [activity.to_dict() for activity in activities],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        
+        if request.args.get('estimate_total', '').lower() in ('1', 'true', 'on'):
+            response['estimated_total'] = ActivityLogger.estimate_count(query)
+        
+        return jsonify(response)
+    
     # Paginate results
     activities = query.order_by(ActivityLog.timestamp.desc()).paginate(
         page=page, per_page=per_page, error_out=False
@@ -1203,58 +1218,64 @@ def api_admin_activities():
 @login_required
 @admin_required
 def export_activity_data():
-    """Export activity data for admin analysis"""
+    """Export activity data for admin analysis (streamed, no row cap)"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    format_type = request.args.get('format', 'json')  # json, csv
-    
-    query = ActivityLog.query
+    format_type = request.args.get('format', 'json')  # json, ndjson, csv
+    use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'on')
     
     if start_date:
         start_date = datetime.strptime(start_date, '%Y-%m-%d')
-        query = query.filter(ActivityLog.timestamp >= start_date)
     
     if end_date:
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
-        query = query.filter(ActivityLog.timestamp <= end_date)
-    
-    activities = query.order_by(ActivityLog.timestamp.desc()).limit(10000).all()
-    
-    if format_type == 'csv':
-        # Return CSV format
-        import csv
-        import io
-        
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Header
-        writer.writerow([
-            'ID', 'User ID', 'Activity Type', 'Action', 'Category', 
-            'Success', 'Timestamp', 'IP Address', 'Description'
-        ])
-        
-        # Data
-        for activity in activities:
-            writer.writerow([
-                activity.id, activity.user_id, activity.activity_type,
-                activity.action, activity.category, activity.success,
-                activity.timestamp, activity.ip_address, activity.description
-            ])
-        
-        output.seek(0)
-        return output.getvalue(), 200, {
-            'Content-Type': 'text/csv',
-            'Content-Disposition': f'attachment; filename=activity_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-        }
     
-    else:
-        # Return JSON format
-        return jsonify({
-            'activities': [activity.to_dict() for activity in activities],
-            'exported_at': datetime.utcnow().isoformat(),
-            'total_records': len(activities)
-        })
+    # Background mode: a job worker writes the file, the client polls the job for it
+    if request.args.get('background', '').lower() in ('1', 'true', 'on'):
+        job = BackgroundJobService.enqueue('activity_export', {
+            'start_date': start_date.isoformat() if start_date else None,
+            'end_date': end_date.isoformat() if end_date else None,
+            'format': format_type,
+            'gzip': bool(use_gzip)
+        }, requested_by_id=current_user.id)
+        return jsonify(dict(
+            job.to_dict(),
+            status_url=url_for('admin.job_status', job_id=job.job_id),
+            download_url=url_for('admin.download_job_file', job_id=job.job_id)
+        )), 202
+    
+    activities = ActivityLogger.export_query(start_date, end_date)
+    chunks, content_type, extension = ActivityLogger.export_chunks(activities, format_type, use_gzip)
+    filename = f'activity_log_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+    
+    return Response(stream_with_context(chunks), content_type=content_type, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'X-Accel-Buffering': 'no'  # let nginx pass chunks straight through
+    })
+
+@admin_bp.route('/api/jobs/<job_id>')
+@login_required
+@admin_required
+def job_status(job_id):
+    """Status and progress of a background job (polled by the admin UI)"""
+    job = BackgroundJob.query.filter_by(job_id=job_id).first_or_404()
+    return jsonify(job.to_dict())
+
+@admin_bp.route('/api/jobs/<job_id>/download')
+@login_required
+@admin_required
+def download_job_file(job_id):
+    """Download the file written by a completed background job"""
+    job = BackgroundJob.query.filter_by(job_id=job_id).first_or_404()
+    if job.status != 'completed' or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'error': 'No file available for this job', 'status': job.status}), 404
+    
+    return send_file(
+        os.path.abspath(job.file_path),
+        mimetype=(job.result or {}).get('content_type'),
+        as_attachment=True,
+        download_name=os.path.basename(job.file_path)
+    )
 
 # ============================================
 # INVENTORY MANAGEMENT ROUTES
@@ -1328,113 +1349,61 @@ def upload_stock():
                 flash('Please upload a CSV or Excel file', 'error')
                 return redirect(request.url)
             
-            # Read the file
-            if file.filename.lower().endswith('.csv'):
-                # Read CSV
-                df = pd.read_csv(file)
-            else:
-                # Read Excel
-                df = pd.read_excel(file)
-            
-            # Validate required columns
-            required_columns = ['name', 'sku', 'category', 'unit_cost', 'selling_price', 'current_stock', 'reorder_point']
-            missing_columns = [col for col in required_columns if col not in df.columns]
-            if missing_columns:
-                flash(f'Missing required columns: {", ".join(missing_columns)}', 'error')
+            locations = InventoryLocation.query.filter_by(is_active=True).order_by(InventoryLocation.id).all()
+            location_id = request.form.get('location_id', type=int) or (locations[0].id if locations else None)
+            if location_id is None:
+                flash('Create an inventory location before uploading stock', 'error')
                 return redirect(request.url)
             
-            success_count = 0
-            error_count = 0
-            errors = []
-            
-            # Process each row
-            for index, row in df.iterrows():
-                try:
-                    # Check if item already exists
-                    existing_item = InventoryItem.query.filter_by(sku=row['sku']).first()
-                    if existing_item:
-                        # Update existing item
-                        existing_item.name = row['name']
-                        existing_item.category = row['category']
-                        existing_item.unit_cost = float(row['unit_cost'])
-                        existing_item.selling_price = float(row['selling_price'])
-                        existing_item.current_stock += int(row['current_stock'])  # Add to existing stock
-                        existing_item.reorder_point = int(row['reorder_point'])
-                        existing_item.updated_at = datetime.utcnow()
-                        
-                        # Create stock movement record
-                        movement = StockMovement(
-                            item_id=existing_item.id,
-                            movement_type='adjustment',
-                            quantity=int(row['current_stock']),
-                            unit_cost=float(row['unit_cost']),
-                            reference_number=f'UPLOAD-{datetime.now().strftime("%Y%m%d%H%M%S")}',
-                            reason='Stock upload - file import',
-                            performed_by_id=current_user.id
-                        )
-                        db.session.add(movement)
-                    else:
-                        # Create new item
-                        new_item = InventoryItem(
-                            name=row['name'],
-                            sku=row['sku'],
-                            category=row['category'],
-                            description=row.get('description', ''),
-                            unit_cost=float(row['unit_cost']),
-                            selling_price=float(row['selling_price']),
-                            current_stock=int(row['current_stock']),
-                            reorder_point=int(row['reorder_point']),
-                            supplier=row.get('supplier', ''),
-                            status='active',
-                            created_by_id=current_user.id
-                        )
-                        db.session.add(new_item)
-                        db.session.flush()  # Get the ID
-                        
-                        # Create initial stock movement
-                        movement = StockMovement(
-                            item_id=new_item.id,
-                            movement_type='initial_stock',
-                            quantity=int(row['current_stock']),
-                            unit_cost=float(row['unit_cost']),
-                            reference_number=f'UPLOAD-{datetime.now().strftime("%Y%m%d%H%M%S")}',
-                            reason='Initial stock - file import',
-                            performed_by_id=current_user.id
-                        )
-                        db.session.add(movement)
-                    
-                    success_count += 1
-                    
-                except Exception as e:
-                    error_count += 1
-                    errors.append(f'Row {index + 2}: {str(e)}')
-                    continue
+            if current_app.config.get('BACKGROUND_JOBS_ENABLED'):
+                # Large files outlive the request timeout; a job worker imports the saved upload
+                job_id = BackgroundJob.generate_job_id()
+                file_path = os.path.join(BackgroundJobService.job_dir('uploads'), f'{job_id}_{secure_filename(file.filename)}')
+                file.save(file_path)
+                job = BackgroundJobService.enqueue('stock_import', {
+                    'file_path': file_path,
+                    'filename': file.filename,
+                    'location_id': location_id
+                }, requested_by_id=current_user.id, max_attempts=1, job_id=job_id)
+                
+                flash(f'Stock upload queued as job {job.job_id}. Progress is shown below.', 'info')
+                return render_template('admin/inventory/upload_stock.html', locations=locations, job=job)
             
-            # Commit all changes
-            db.session.commit()
+            df = StockImportService.read_file(file, file.filename)
+            report = StockImportService.import_stock(df, current_user.id, location_id)
             
             # Log the activity
             ActivityLogger.log_activity(
                 user_id=current_user.id,
                 action='bulk_stock_upload',
-                description=f'Uploaded stock from file: {file.filename} - {success_count} successful, {error_count} errors',
-                metadata={'filename': file.filename, 'success_count': success_count, 'error_count': error_count}
+                description=f'Uploaded stock from file: {file.filename} - {report["imported"]} successful, {report["failed"]} errors',
+                metadata={
+                    'filename': file.filename,
+                    'location_id': location_id,
+                    'reference_id': report['reference_id'],
+                    'success_count': report['imported'],
+                    'error_count': report['failed']
+                }
             )
             
-            flash(f'Stock upload completed! {success_count} items processed successfully.', 'success')
-            if error_count > 0:
-                flash(f'{error_count} items had errors. Check the format and try again.', 'warning')
-                for error in errors[:5]:  # Show first 5 errors
-                    flash(error, 'error')
+            flash(f'Stock upload completed! {report["imported"]} items processed successfully '
+                  f'({report["created"]} new, {report["updated"]} updated).', 'success')
+            if report['failed'] > 0:
+                flash(f'{report["failed"]} rows had errors and were skipped. See the report below.', 'warning')
+                return render_template('admin/inventory/upload_stock.html', locations=locations, report=report)
             
             return redirect(url_for('admin.inventory_items'))
             
+        except ValueError as e:
+            flash(str(e), 'error')
+            return redirect(request.url)
         except Exception as e:
             db.session.rollback()
             flash(f'Error processing file: {str(e)}', 'error')
             return redirect(request.url)
     
-    return render_template('admin/inventory/upload_stock.html')
+    locations = InventoryLocation.query.filter_by(is_active=True).order_by(InventoryLocation.id).all()
+    return render_template('admin/inventory/upload_stock.html', locations=locations)
 
 @admin_bp.route('/inventory/add-item', methods=['GET', 'POST'])
 @login_required
@@ -1678,35 +1647,7 @@ def adjust_stock(item_id):
         )
         
         db.session.add(movement)
-        db.session.commit()
-        
-        # Check if low stock alert needs to be created or resolved
-        if item.is_low_stock:
-            # Create alert if none exists
-            existing_alert = LowStockAlert.query.filter_by(
-                inventory_item_id=item_id,
-                status='active'
-            ).first()
-            
-            if not existing_alert:
-                alert = LowStockAlert(
-                    inventory_item_id=item_id,
-                    alert_level='critical' if item.current_stock < 2 else 'low',
-                    current_stock=item.current_stock,
-                    reorder_point=item.reorder_point
-                )
-                db.session.add(alert)
-                db.session.commit()
-        else:
-            # Resolve any active alerts
-            LowStockAlert.query.filter_by(
-                inventory_item_id=item_id,
-                status='active'
-            ).update({
-                'status': 'resolved',
-                'resolved_at': datetime.utcnow()
-            })
-            db.session.commit()
+        db.session.commit()  # the stock alert hook creates or resolves the item's alert
         
         flash(f'Stock adjusted successfully. New stock level: {item.current_stock}', 'success')
         
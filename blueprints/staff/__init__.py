@@ -322,27 +322,35 @@ def monitoring():
     else:
         end_date = datetime.strptime(end_date, '%Y-%m-%d')
     
-    # Get user activities that staff can monitor
-    user_activities = ActivityLogger.get_staff_monitoring_data(
-        staff_user_id=current_user.id,
+    # Summary statistics computed in the database
+    summary = ActivityLogger.get_activity_summary(
         start_date=start_date,
         end_date=end_date
     )
     
-    # Get summary statistics
-    total_activities = len(user_activities)
-    unique_users = len(set(activity.user_id for activity in user_activities if activity.user_id))
+    # Get the most recent user activities that staff can monitor
+    user_activities = ActivityLogger.get_staff_monitoring_data(
+        staff_user_id=current_user.id,
+        start_date=start_date,
+        end_date=end_date,
+        limit=50
+    )
     
-    # Activity breakdown by type
-    activity_types = {}
-    for activity in user_activities:
-        activity_types[activity.activity_type] = activity_types.get(activity.activity_type, 0) + 1
+    # The signed-in staff member's own recent actions
+    own_summary = ActivityLogger.get_staff_activity_summaries(
+        [current_user],
+        start_date=start_date,
+        end_date=end_date
+    )[current_user.id]
     
     return render_template('staff/monitoring.html',
-                         activities=user_activities[:50],  # Limit to 50 most recent
-                         total_activities=total_activities,
-                         unique_users=unique_users,
-                         activity_types=activity_types,
+                         activities=user_activities,
+                         own_activities=own_summary['activities'],
+                         own_activity_count=own_summary['total_count'],
+                         onboarding_record=own_summary['onboarding_record'],
+                         total_activities=summary['total_activities'],
+                         unique_users=summary['unique_users'],
+                         activity_types=summary['activity_types'],
                          start_date=start_date.strftime('%Y-%m-%d'),
                          end_date=end_date.strftime('%Y-%m-%d'))
 
@@ -397,6 +405,27 @@ def api_monitoring_activities():
     if end_date:
         query = query.filter(ActivityLog.timestamp <= end_date)
     
+    # Cursor mode: keyset pagination on (timestamp, id), no COUNT(*) or OFFSET
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        try:
+            activities, next_cursor = ActivityLogger.get_activities_page(
+                query, cursor=cursor, limit=per_page
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        response = {
+            'activities': [activity.to_dict() for activity in activities],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        
+        if request.args.get('estimate_total', '').lower() in ('1', 'true', 'on'):
+            response['estimated_total'] = ActivityLogger.estimate_count(query)
+        
+        return jsonify(response)
+    
     # Paginate results
     activities = query.order_by(ActivityLog.timestamp.desc()).paginate(
         page=page, per_page=per_page, error_out=False
@@ -895,24 +924,7 @@ def adjust_inventory_stock(item_id):
         )
         
         db.session.add(movement)
-        db.session.commit()
-        
-        # Check if low stock alert needs to be created
-        if item.is_low_stock:
-            existing_alert = LowStockAlert.query.filter_by(
-                inventory_item_id=item_id,
-                status='active'
-            ).first()
-            
-            if not existing_alert:
-                alert = LowStockAlert(
-                    inventory_item_id=item_id,
-                    alert_level='critical' if item.current_stock < 2 else 'low',
-                    current_stock=item.current_stock,
-                    reorder_point=item.reorder_point
-                )
-                db.session.add(alert)
-                db.session.commit()
+        db.session.commit()  # the stock alert hook creates or resolves the item's alert
         
         flash(f'Stock adjusted successfully. New stock level: {item.current_stock}', 'success')
         
@@ -0,0 +1,209 @@
+"""
+Chat Room Archive
+Moves the messages of long-closed rooms out of chat_messages into per-room gzip files,
+leaving the room row as an 'archived' stub that can be rehydrated on demand
+"""
+from models.chat import ChatRoom, ChatMessage
+from database import db
+from flask import current_app
+from sqlalchemy import select, insert, update, delete, or_
+from datetime import datetime, timedelta
+import gzip
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+class ChatArchiveService:
+    """Service for moving closed chat rooms to cold storage and back"""
+    
+    @staticmethod
+    def archive_closed_rooms(older_than_days=None, archive_dir=None, limit=None):
+        """
+        Archive every room closed more than older_than_days ago (CHAT_ARCHIVE_AFTER_DAYS by default).
+        Rehydrated rooms are left alone until the same time has passed since they were restored.
+        Each room is written, verified and emptied in its own transaction.
+        """
+        if older_than_days is None:
+            older_than_days = current_app.config.get('CHAT_ARCHIVE_AFTER_DAYS', 90)
+        if archive_dir is None:
+            archive_dir = current_app.config.get('CHAT_ARCHIVE_DIR', 'logs/chat_archive')
+        os.makedirs(archive_dir, exist_ok=True)
+        
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        query = db.session.query(ChatRoom.id).filter(
+            ChatRoom.status == 'closed',
+            ChatRoom.closed_at < cutoff,
+            or_(ChatRoom.rehydrated_at.is_(None), ChatRoom.rehydrated_at < cutoff)
+        ).order_by(ChatRoom.id)
+        if limit:
+            query = query.limit(limit)
+        room_ids = [room_id for (room_id,) in query.all()]
+        
+        rooms_archived = 0
+        messages_archived = 0
+        failed_room_ids = []
+        for room_id in room_ids:
+            try:
+                count = ChatArchiveService.archive_room(room_id, archive_dir)
+                if count is not None:
+                    rooms_archived += 1
+                    messages_archived += count
+            except Exception as e:
+                failed_room_ids.append(room_id)
+                logger.error(f"Failed to archive chat room {room_id}: {str(e)}")
+        
+        return {
+            'rooms_archived': rooms_archived,
+            'messages_archived': messages_archived,
+            'failed_room_ids': failed_room_ids,
+            'archive_dir': archive_dir
+        }
+    
+    @staticmethod
+    def archive_room(room_id, archive_dir):
+        """
+        Move one closed room's messages to <archive_dir>/chat_room_<id>.jsonl.gz.
+        Returns the number of messages archived, or None if the room is not closed.
+        """
+        room = ChatRoom.query.filter_by(id=room_id).with_for_update().first()
+        if room is None or room.status != 'closed':
+            db.session.rollback()
+            return None
+        
+        archive_path = os.path.join(archive_dir, f'chat_room_{room_id}.jsonl.gz')
+        count = ChatArchiveService._write_room_archive(room_id, archive_path)
+        
+        try:
+            db.session.execute(
+                update(ChatRoom).where(ChatRoom.id == room_id).values(last_message_id=None)
+                .execution_options(synchronize_session=False)
+            )
+            deleted = db.session.execute(
+                delete(ChatMessage).where(ChatMessage.room_id == room_id)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if deleted != count:
+                raise RuntimeError(f"{deleted} messages to delete but {count} archived; room changed while archiving")
+            
+            room.status = 'archived'
+            room.archived_at = datetime.utcnow()
+            room.archive_path = archive_path
+            room.archived_message_count = count
+            db.session.commit()
+        
+        except Exception:
+            db.session.rollback()
+            os.remove(archive_path)
+            raise
+        
+        logger.info(f"Archived {count} messages of chat room {room_id} to {archive_path}")
+        return count
+    
+    @staticmethod
+    def _write_room_archive(room_id, archive_path):
+        """Dump every message row of a room, deleted ones included, and return the row count"""
+        temp_path = f'{archive_path}.part'
+        rows = db.session.execute(
+            select(ChatMessage.__table__).where(ChatMessage.room_id == room_id)
+            .order_by(ChatMessage.id).execution_options(yield_per=BATCH_SIZE)
+        )
+        
+        count = 0
+        try:
+            with gzip.open(temp_path, 'wt', encoding='utf-8') as archive_file:
+                for row in rows:
+                    archive_file.write(json.dumps({name: _encode(value) for name, value in row._asdict().items()}) + '\n')
+                    count += 1
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        os.replace(temp_path, archive_path)
+        return count
+    
+    @staticmethod
+    def read_archived_rows(archive_path):
+        """Yield the chat_messages rows stored in an archive file, typed for insert"""
+        datetime_columns = [
+            column.name for column in ChatMessage.__table__.columns
+            if isinstance(column.type, db.DateTime)
+        ]
+        
+        with gzip.open(archive_path, 'rt', encoding='utf-8') as archive_file:
+            for line in archive_file:
+                row = json.loads(line)
+                for name in datetime_columns:
+                    if row.get(name):
+                        row[name] = datetime.fromisoformat(row[name])
+                yield row
+    
+    @staticmethod
+    def rehydrate_room(room_id):
+        """
+        Load an archived room's messages back into chat_messages and make it a closed room again.
+        Returns the number of messages restored, or None if the room is not archived.
+        """
+        room = ChatRoom.query.filter_by(id=room_id).with_for_update().first()
+        if room is None or room.status != 'archived':
+            db.session.rollback()
+            return None
+        
+        archive_path = room.archive_path
+        count = 0
+        try:
+            batch = []
+            for row in ChatArchiveService.read_archived_rows(archive_path):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    db.session.execute(insert(ChatMessage.__table__), batch)
+                    count += len(batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(ChatMessage.__table__), batch)
+                count += len(batch)
+            
+            room.last_message_id = db.session.query(ChatMessage.id).filter(
+                ChatMessage.room_id == room_id
+            ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(1).scalar()
+            room.status = 'closed'
+            room.archived_at = None
+            room.archive_path = None
+            room.archived_message_count = None
+            room.rehydrated_at = datetime.utcnow()
+            db.session.commit()
+        
+        except Exception:
+            db.session.rollback()
+            raise
+        
+        os.remove(archive_path)
+        logger.info(f"Rehydrated {count} messages of chat room {room_id} from {archive_path}")
+        return count
+    
+    @staticmethod
+    def ensure_rehydrated(room):
+        """Bring an archived room's messages back before they are read from chat_messages"""
+        if room.status == 'archived':
+            ChatArchiveService.rehydrate_room(room.id)
+            db.session.refresh(room)
+
+def schedule_chat_archive():
+    """Archive long-closed chat rooms (call this from your task scheduler)"""
+    try:
+        result = ChatArchiveService.archive_closed_rooms(
+            limit=current_app.config.get('CHAT_ARCHIVE_BATCH_LIMIT')
+        )
+        logger.info(f"Scheduled chat archive: {result['rooms_archived']} rooms, "
+                    f"{result['messages_archived']} messages")
+        return result
+    except Exception as e:
+        logger.error(f"Error in scheduled chat archive: {str(e)}")
+        return {'error': str(e)}
@@ -0,0 +1,282 @@
+"""
+Support Room Dispatch
+Assigns waiting support rooms to the least-loaded online staff member, scored by
+active rooms and recent response time
+"""
+from models.chat import ChatRoom, ChatMessage
+from models.user import User
+from chat.presence import user_room
+from database import db
+from flask import current_app
+from sqlalchemy import func, update
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class StaffLoadQueue:
+    """
+    Min-heap of staff members ordered by load score.
+    Updating a staff member pushes a fresh entry; superseded entries are skipped when
+    they reach the top (lazy deletion), so every update is O(log n).
+    """
+    
+    def __init__(self, response_weight=120.0, smoothing=0.3):
+        self.response_weight = response_weight  # seconds of average response time worth one active room
+        self.smoothing = smoothing
+        self.heap = []
+        self.loads = {}  # staff_id -> [active rooms, average response seconds, current entry id]
+        self.entry_ids = itertools.count()
+        self.lock = threading.Lock()
+    
+    def score(self, active_rooms, avg_response):
+        return active_rooms + (avg_response or 0) / self.response_weight
+    
+    def _push(self, staff_id):
+        load = self.loads[staff_id]
+        load[2] = next(self.entry_ids)
+        heapq.heappush(self.heap, (self.score(load[0], load[1]), load[2], staff_id))
+        
+        # Drop superseded entries once they dominate the heap
+        if len(self.heap) > 4 * len(self.loads) + 64:
+            self.heap = [entry for entry in self.heap
+                         if entry[2] in self.loads and self.loads[entry[2]][2] == entry[1]]
+            heapq.heapify(self.heap)
+    
+    def staff_ids(self):
+        with self.lock:
+            return list(self.loads)
+    
+    def set_load(self, staff_id, active_rooms, avg_response=None):
+        with self.lock:
+            load = self.loads.setdefault(staff_id, [0, None, None])
+            load[0] = max(active_rooms, 0)
+            if avg_response is not None:
+                load[1] = avg_response
+            self._push(staff_id)
+    
+    def adjust_active_rooms(self, staff_id, delta):
+        with self.lock:
+            load = self.loads.setdefault(staff_id, [0, None, None])
+            load[0] = max(load[0] + delta, 0)
+            self._push(staff_id)
+    
+    def record_response(self, staff_id, seconds):
+        """Fold one response time into the staff member's moving average"""
+        with self.lock:
+            load = self.loads.setdefault(staff_id, [0, None, None])
+            load[1] = seconds if load[1] is None else (1 - self.smoothing) * load[1] + self.smoothing * seconds
+            self._push(staff_id)
+    
+    def remove(self, staff_id):
+        with self.lock:
+            self.loads.pop(staff_id, None)
+    
+    def least_loaded(self, eligible_ids, max_active_rooms):
+        """Lowest-scored staff id among eligible_ids with room for another chat, or None"""
+        with self.lock:
+            popped = []
+            chosen = None
+            while self.heap:
+                entry = heapq.heappop(self.heap)
+                load = self.loads.get(entry[2])
+                if load is None or load[2] != entry[1]:
+                    continue  # superseded
+                
+                popped.append(entry)
+                if entry[2] in eligible_ids and load[0] < max_active_rooms:
+                    chosen = entry[2]
+                    break
+            
+            for entry in popped:
+                heapq.heappush(self.heap, entry)
+            return chosen
+
+class SupportDispatcher:
+    """
+    Routes unassigned support rooms to online staff.
+    Active room counts are updated from chat events and re-read from the database every
+    CHAT_DISPATCH_REFRESH_SECONDS, so assignments made by other workers are picked up.
+    Waiting rooms are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so concurrent
+    dispatchers never assign the same room twice.
+    """
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        self.max_rooms_per_staff = 5
+        self.batch_size = 20
+        self.refresh_interval = 60
+        self.response_window = timedelta(minutes=60)
+        self.queue = StaffLoadQueue()
+        self.awaiting_reply = {}  # room_id -> monotonic time of the first unanswered customer message
+        self.refreshed_at = None
+        self.refresh_lock = threading.Lock()
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.enabled = app.config.get('CHAT_DISPATCH_ENABLED', True)
+        self.max_rooms_per_staff = app.config.get('CHAT_DISPATCH_MAX_ROOMS_PER_STAFF', 5)
+        self.batch_size = app.config.get('CHAT_DISPATCH_BATCH_SIZE', 20)
+        self.refresh_interval = app.config.get('CHAT_DISPATCH_REFRESH_SECONDS', 60)
+        self.response_window = timedelta(minutes=app.config.get('CHAT_DISPATCH_RESPONSE_WINDOW_MINUTES', 60))
+        self.queue = StaffLoadQueue(response_weight=app.config.get('CHAT_DISPATCH_RESPONSE_WEIGHT', 120))
+        app.extensions['chat_dispatcher'] = self
+    
+    def refresh_loads(self, force=False):
+        """Reload active staff, their active room counts and recent response times"""
+        # Held while loading so concurrent dispatches never see a half-filled queue
+        with self.refresh_lock:
+            now = time.monotonic()
+            if not force and self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+                return
+            
+            staff_ids = [staff_id for (staff_id,) in db.session.query(User.id).filter(
+                User.role == 'staff',
+                User.is_active == True
+            )]
+            active_rooms = dict(db.session.query(ChatRoom.staff_id, func.count(ChatRoom.id)).filter(
+                ChatRoom.status == 'active',
+                ChatRoom.staff_id.isnot(None)
+            ).group_by(ChatRoom.staff_id).all())
+            response_times = self._recent_response_times()
+            
+            for staff_id in set(self.queue.staff_ids()) - set(staff_ids):
+                self.queue.remove(staff_id)
+            for staff_id in staff_ids:
+                self.queue.set_load(staff_id, active_rooms.get(staff_id, 0), response_times.get(staff_id))
+            self.refreshed_at = now
+    
+    def _recent_response_times(self):
+        """Average seconds from a customer message to the staff reply, per staff, in active rooms"""
+        ordering = (ChatMessage.created_at, ChatMessage.id)
+        messages = db.session.query(
+            ChatRoom.staff_id.label('staff_id'),
+            ChatRoom.customer_id.label('customer_id'),
+            ChatMessage.sender_id.label('sender_id'),
+            ChatMessage.created_at.label('created_at'),
+            func.lag(ChatMessage.sender_id).over(
+                partition_by=ChatMessage.room_id, order_by=ordering
+            ).label('previous_sender_id'),
+            func.lag(ChatMessage.created_at, type_=db.DateTime).over(
+                partition_by=ChatMessage.room_id, order_by=ordering
+            ).label('previous_created_at')
+        ).join(ChatRoom, ChatRoom.id == ChatMessage.room_id).filter(
+            ChatRoom.status == 'active',
+            ChatRoom.staff_id.isnot(None),
+            ChatMessage.created_at >= datetime.utcnow() - self.response_window
+        ).subquery()
+        
+        replies = db.session.query(
+            messages.c.staff_id, messages.c.created_at, messages.c.previous_created_at
+        ).filter(
+            messages.c.sender_id == messages.c.staff_id,
+            messages.c.previous_sender_id == messages.c.customer_id
+        )
+        
+        totals = {}
+        for staff_id, created_at, previous_created_at in replies:
+            total, count = totals.get(staff_id, (0.0, 0))
+            totals[staff_id] = (total + (created_at - previous_created_at).total_seconds(), count + 1)
+        return {staff_id: total / count for staff_id, (total, count) in totals.items()}
+    
+    def dispatch(self):
+        """
+        Assign waiting support rooms, oldest first, to the least-loaded online staff.
+        Returns a list of (room_id, customer_id, staff_id) assignments.
+        """
+        if not self.enabled:
+            return []
+        
+        self.refresh_loads()
+        online_staff_ids = current_app.extensions['chat_presence'].online_user_ids(self.queue.staff_ids())
+        if not online_staff_ids:
+            return []
+        
+        assignments = []
+        try:
+            waiting = db.session.query(ChatRoom.id, ChatRoom.customer_id).filter(
+                ChatRoom.room_type == 'support',
+                ChatRoom.staff_id.is_(None),
+                ChatRoom.status == 'active'
+            ).order_by(ChatRoom.created_at, ChatRoom.id).limit(self.batch_size).with_for_update(
+                skip_locked=True
+            ).all()
+            
+            for room_id, customer_id in waiting:
+                staff_id = self.queue.least_loaded(online_staff_ids, self.max_rooms_per_staff)
+                if staff_id is None:
+                    break
+                
+                db.session.execute(
+                    update(ChatRoom).where(ChatRoom.id == room_id, ChatRoom.staff_id.is_(None))
+                    .values(staff_id=staff_id).execution_options(synchronize_session=False)
+                )
+                self.queue.adjust_active_rooms(staff_id, 1)
+                assignments.append((room_id, customer_id, staff_id))
+            
+            db.session.commit()
+        
+        except Exception as e:
+            db.session.rollback()
+            for _, _, staff_id in assignments:
+                self.queue.adjust_active_rooms(staff_id, -1)
+            logger.error(f"Support room dispatch failed: {str(e)}")
+            return []
+        
+        if assignments:
+            self._announce(assignments)
+        return assignments
+    
+    def _announce(self, assignments):
+        from chat.utils import invalidate_room_access
+        
+        socketio = current_app.extensions['socketio']
+        staff_names = {
+            user.id: user.full_name
+            for user in User.query.filter(User.id.in_({staff_id for _, _, staff_id in assignments}))
+        }
+        
+        for room_id, customer_id, staff_id in assignments:
+            invalidate_room_access(room_id)
+            socketio.emit('room_assigned', {'room_id': room_id, 'customer_id': customer_id},
+                          room=user_room(staff_id))
+            socketio.emit('staff_assigned', {
+                'room_id': room_id,
+                'staff_id': staff_id,
+                'staff_name': staff_names.get(staff_id)
+            }, room=user_room(customer_id))
+    
+    def room_assigned(self, staff_id):
+        """A room was assigned outside the dispatcher"""
+        self.queue.adjust_active_rooms(staff_id, 1)
+    
+    def room_closed(self, room_id, staff_id):
+        """A room stopped counting against its staff member; waiting rooms may now fit"""
+        with self.lock:
+            self.awaiting_reply.pop(room_id, None)
+        if staff_id:
+            self.queue.adjust_active_rooms(staff_id, -1)
+            self.dispatch()
+    
+    def record_message(self, room_id, sender_id, customer_id, staff_id):
+        """Track customer messages awaiting a reply and time the staff response"""
+        room_id = int(room_id)
+        now = time.monotonic()
+        
+        with self.lock:
+            if sender_id == customer_id:
+                self.awaiting_reply.setdefault(room_id, now)
+                if len(self.awaiting_reply) > 10000:
+                    self.awaiting_reply.pop(next(iter(self.awaiting_reply)))
+                return
+            
+            asked_at = self.awaiting_reply.pop(room_id, None) if sender_id == staff_id else None
+        
+        if asked_at is not None:
+            self.queue.record_response(staff_id, now - asked_at)
@@ -2,23 +2,48 @@
 Chat Events Handler
 Real-time chat functionality using Flask-SocketIO
 """
-from flask_socketio import emit, join_room, leave_room, close_room
+from flask import request, current_app
+from flask_socketio import emit, join_room, leave_room, close_room, rooms
 from flask_login import current_user
 from models.chat import ChatRoom, ChatMessage
 from models.user import User
+from chat.room_summary import ChatRoomSummaryService
+from chat.archive import ChatArchiveService
+from chat.presence import user_room
+from chat.utils import get_message_page, search_messages
 from database import db
 from datetime import datetime
+import functools
 import json
 
 def register_chat_events(socketio):
     """Register all chat-related SocketIO events"""
     
+    def on(event):
+        """socketio.on for handlers whose events also count as a presence heartbeat"""
+        def register(handler):
+            @functools.wraps(handler)
+            def handle(*args):
+                if current_user.is_authenticated:
+                    get_presence().seen(request.sid, current_user.id)
+                return handler(*args)
+            return socketio.on(event)(handle)
+        return register
+    
     @socketio.on('connect')
     def handle_connect():
         """Handle client connection"""
         if current_user.is_authenticated:
             print(f'User {current_user.full_name} connected to chat')
+            get_presence().connect(request.sid, current_user.id)
+            
+            # Personal room for notifications about rooms the user has not joined
+            join_room(user_room(current_user.id))
             emit('status', {'msg': f'{current_user.first_name} has connected'})
+            
+            # A staff member coming online can take waiting support rooms
+            if current_user.is_staff():
+                get_dispatcher().dispatch()
         else:
             print('Anonymous user connected')
     
@@ -27,8 +52,26 @@ def register_chat_events(socketio):
         """Handle client disconnection"""
         if current_user.is_authenticated:
             print(f'User {current_user.full_name} disconnected from chat')
+            get_room_access().forget(request.sid)
+            presence = get_presence()
+            presence.disconnect(request.sid)
+            
+            # Clear typing indicators this user left behind
+            for room_id in presence.typing.typing_rooms(current_user.id):
+                presence.typing.clear(room_id, current_user.id)
+                emit('user_typing', {
+                    'user_name': current_user.full_name,
+                    'user_id': current_user.id,
+                    'is_typing': False
+                }, room=str(room_id))
     
-    @socketio.on('join_room')
+    @socketio.on('presence_heartbeat')
+    def handle_presence_heartbeat(data=None):
+        """Keep this socket counted as online (clients send one every ~CHAT_PRESENCE_TTL / 3)"""
+        if current_user.is_authenticated:
+            get_presence().heartbeat(request.sid, current_user.id)
+    
+    @on('join_room')
     def handle_join_room(data):
         """Handle user joining a chat room"""
         if not current_user.is_authenticated:
@@ -53,26 +96,31 @@ def register_chat_events(socketio):
             emit('error', {'message': 'Access denied'})
             return
         
+        # Archived rooms are loaded back from cold storage on first open
+        ChatArchiveService.ensure_rehydrated(chat_room)
+        
         join_room(str(room_id))
+        get_room_access().grant(request.sid, room_id)
+        get_presence().join_room(request.sid, room_id)
         
         # Mark messages as read for this user
-        chat_room.mark_messages_as_read(current_user.id)
-        
-        # Get recent messages
-        messages = ChatMessage.query.filter_by(
-            room_id=room_id,
-            is_deleted=False
-        ).order_by(ChatMessage.created_at.desc()).limit(50).all()
-        
-        # Reverse to show oldest first
-        messages.reverse()
+        read_message_ids = chat_room.mark_messages_as_read(current_user.id)
+        if read_message_ids:
+            emit('messages_read', {
+                'user_id': current_user.id,
+                'room_id': room_id,
+                'message_ids': read_message_ids
+            }, room=str(room_id), include_self=False)
         
-        message_data = [msg.to_dict() for msg in messages]
+        # Newest page only; older messages are fetched with load_history
+        messages, has_more = get_message_page(room_id, limit=50)
         
         emit('joined_room', {
             'room_id': room_id,
             'room_name': chat_room.name or f'Chat with {chat_room.customer.full_name if current_user.id == chat_room.staff_id else chat_room.staff_member.full_name if chat_room.staff_member else "Support"}',
-            'messages': message_data
+            'messages': [msg.to_compact_dict() for msg in messages],
+            'has_more': has_more,
+            'online_user_ids': sorted(get_presence().room_user_ids(room_id))
         })
         
         # Notify other participants
@@ -81,7 +129,47 @@ def register_chat_events(socketio):
             'user_role': current_user.role
         }, room=str(room_id), include_self=False)
     
-    @socketio.on('leave_room')
+    @on('load_history')
+    def handle_load_history(data):
+        """Send the page of messages before a given message id (scroll-back)"""
+        if not current_user.is_authenticated:
+            emit('error', {'message': 'Authentication required'})
+            return
+        
+        room_id = data.get('room_id')
+        if not room_id:
+            emit('error', {'message': 'Room ID required'})
+            return
+        
+        if not has_cached_room_access(room_id):
+            chat_room = ChatRoom.query.get(room_id)
+            if not chat_room:
+                emit('error', {'message': 'Room not found'})
+                return
+            
+            if (current_user.id != chat_room.customer_id and 
+                current_user.id != chat_room.staff_id and 
+                not current_user.is_admin()):
+                emit('error', {'message': 'Access denied'})
+                return
+        
+        try:
+            before_id = int(data['before_id']) if data.get('before_id') else None
+            limit = int(data.get('limit', 50))
+        except (TypeError, ValueError):
+            emit('error', {'message': 'Invalid before_id or limit'})
+            return
+        
+        messages, has_more = get_message_page(room_id, before_id=before_id, limit=limit)
+        
+        emit('history', {
+            'room_id': room_id,
+            'before_id': before_id,
+            'messages': [msg.to_compact_dict() for msg in messages],
+            'has_more': has_more
+        })
+    
+    @on('leave_room')
     def handle_leave_room(data):
         """Handle user leaving a chat room"""
         if not current_user.is_authenticated:
@@ -90,12 +178,14 @@ def register_chat_events(socketio):
         room_id = data.get('room_id')
         if room_id:
             leave_room(str(room_id))
+            get_room_access().revoke(request.sid, room_id)
+            get_presence().leave_room(request.sid, room_id)
             emit('user_left', {
                 'user_name': current_user.full_name,
                 'user_role': current_user.role
             }, room=str(room_id))
     
-    @socketio.on('send_message')
+    @on('send_message')
     def handle_send_message(data):
         """Handle sending a message"""
         if not current_user.is_authenticated:
@@ -111,17 +201,18 @@ def register_chat_events(socketio):
             emit('error', {'message': 'Room ID and message are required'})
             return
         
-        # Verify room access
-        chat_room = ChatRoom.query.get(room_id)
-        if not chat_room:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        if (current_user.id != chat_room.customer_id and 
-            current_user.id != chat_room.staff_id and 
-            not current_user.is_admin()):
-            emit('error', {'message': 'Access denied'})
-            return
+        # Verify room access (joined rooms are authorized already)
+        if not has_cached_room_access(room_id):
+            chat_room = ChatRoom.query.get(room_id)
+            if not chat_room:
+                emit('error', {'message': 'Room not found'})
+                return
+            
+            if (current_user.id != chat_room.customer_id and 
+                current_user.id != chat_room.staff_id and 
+                not current_user.is_admin()):
+                emit('error', {'message': 'Access denied'})
+                return
         
         # Create new message
         new_message = ChatMessage(
@@ -134,41 +225,49 @@ def register_chat_events(socketio):
         
         try:
             db.session.add(new_message)
+            db.session.flush()
             
-            # Update room last activity
-            chat_room.last_activity = datetime.utcnow()
+            # Last message, last activity and unread counters, in the same transaction
+            participants = ChatRoom.record_message(room_id, new_message)
+            if participants is None:
+                db.session.rollback()
+                emit('error', {'message': 'Room not found'})
+                return
             
+            message_data = new_message.to_dict()
             db.session.commit()
             
+            get_dispatcher().record_message(room_id, message_data['sender_id'], *participants)
+            
             # Emit message to all room participants
-            message_data = new_message.to_dict()
             emit('new_message', message_data, room=str(room_id))
             
             # Send notification to offline participants
-            send_message_notification(chat_room, new_message)
+            send_message_notification(room_id, participants, message_data)
             
         except Exception as e:
             db.session.rollback()
             emit('error', {'message': 'Failed to send message'})
             print(f'Error sending message: {e}')
     
-    @socketio.on('typing')
+    @on('typing')
     def handle_typing(data):
         """Handle typing indicators"""
         if not current_user.is_authenticated:
             return
         
         room_id = data.get('room_id')
-        is_typing = data.get('is_typing', False)
+        is_typing = bool(data.get('is_typing', False))
         
-        if room_id:
+        # Forward state changes only, at most one per user and room per interval
+        if room_id and get_presence().typing.should_emit(str(room_id), current_user.id, is_typing):
             emit('user_typing', {
                 'user_name': current_user.full_name,
                 'user_id': current_user.id,
                 'is_typing': is_typing
             }, room=str(room_id), include_self=False)
     
-    @socketio.on('mark_messages_read')
+    @on('mark_messages_read')
     def handle_mark_messages_read(data):
         """Handle marking messages as read"""
         if not current_user.is_authenticated:
@@ -178,17 +277,18 @@ def register_chat_events(socketio):
         if not room_id:
             return
         
-        chat_room = ChatRoom.query.get(room_id)
-        if chat_room:
-            chat_room.mark_messages_as_read(current_user.id)
+        if has_cached_room_access(room_id) or ChatRoom.query.get(room_id):
+            user_id = current_user.id
+            read_message_ids = ChatRoom.mark_room_read(room_id, user_id)
             
             # Notify other participants that messages were read
             emit('messages_read', {
-                'user_id': current_user.id,
-                'room_id': room_id
+                'user_id': user_id,
+                'room_id': room_id,
+                'message_ids': read_message_ids
             }, room=str(room_id), include_self=False)
     
-    @socketio.on('edit_message')
+    @on('edit_message')
     def handle_edit_message(data):
         """Handle message editing"""
         if not current_user.is_authenticated:
@@ -232,7 +332,7 @@ def register_chat_events(socketio):
             emit('error', {'message': 'Failed to edit message'})
             print(f'Error editing message: {e}')
     
-    @socketio.on('delete_message')
+    @on('delete_message')
     def handle_delete_message(data):
         """Handle message deletion"""
         if not current_user.is_authenticated:
@@ -267,50 +367,44 @@ def register_chat_events(socketio):
             emit('error', {'message': 'Failed to delete message'})
             print(f'Error deleting message: {e}')
     
-    @socketio.on('get_user_rooms')
+    @on('get_user_rooms')
     def handle_get_user_rooms(data):
         """Get list of user's chat rooms"""
         if not current_user.is_authenticated:
             emit('error', {'message': 'Authentication required'})
             return
         
-        if current_user.is_customer():
-            # Customer sees their own rooms
-            rooms = ChatRoom.query.filter_by(
-                customer_id=current_user.id,
-                status='active'
-            ).order_by(ChatRoom.last_activity.desc()).all()
-        
-        elif current_user.is_staff() or current_user.is_admin():
-            # Staff sees assigned rooms or all rooms for admin
-            if current_user.is_admin():
-                rooms = ChatRoom.query.filter_by(
-                    status='active'
-                ).order_by(ChatRoom.last_activity.desc()).all()
-            else:
-                rooms = ChatRoom.query.filter_by(
-                    staff_id=current_user.id,
-                    status='active'
-                ).order_by(ChatRoom.last_activity.desc()).all()
-        
-        room_data = []
-        for room in rooms:
-            last_message = room.get_last_message()
-            unread_count = room.get_unread_count(current_user.id)
-            
-            room_info = {
-                'id': room.id,
-                'name': room.name or f'Chat with {room.customer.full_name if current_user.id == room.staff_id else room.staff_member.full_name if room.staff_member else "Support"}',
-                'last_message': last_message.to_dict() if last_message else None,
-                'unread_count': unread_count,
-                'last_activity': room.last_activity.isoformat() if room.last_activity else None,
-                'participants': [p.to_dict() for p in room.get_participants()]
-            }
-            room_data.append(room_info)
+        # Last messages, unread counts and participants for all rooms in a few queries
+        room_data = ChatRoomSummaryService.get_room_summaries(current_user)
         
         emit('user_rooms', {'rooms': room_data})
     
-    @socketio.on('create_support_room')
+    @on('search_messages')
+    def handle_search_messages(data):
+        """Full-text search across chat history (staff and admin)"""
+        if not current_user.is_authenticated or not (current_user.is_staff() or current_user.is_admin()):
+            emit('error', {'message': 'Only staff can search chat history'})
+            return
+        
+        query = (data.get('query') or '').strip()
+        if not query:
+            emit('error', {'message': 'Search query required'})
+            return
+        
+        try:
+            room_id = int(data['room_id']) if data.get('room_id') else None
+            sender_id = int(data['sender_id']) if data.get('sender_id') else None
+            limit = max(1, min(int(data.get('limit', 20)), 100))
+        except (TypeError, ValueError):
+            emit('error', {'message': 'Invalid search filters'})
+            return
+        
+        emit('search_results', {
+            'query': query,
+            'results': search_messages(query, room_id=room_id, user_id=sender_id, limit=limit)
+        })
+    
+    @on('create_support_room')
     def handle_create_support_room(data):
         """Create a new support chat room"""
         if not current_user.is_authenticated or not current_user.is_customer():
@@ -353,13 +447,86 @@ def register_chat_events(socketio):
             emit('error', {'message': 'Failed to create support room'})
             print(f'Error creating support room: {e}')
 
-def send_message_notification(chat_room, message):
-    """Send notification for new message to offline participants"""
-    # This would integrate with your notification system
-    # For now, just print the notification
-    print(f'New message notification: {message.sender.full_name} sent a message in room {chat_room.id}')
+def get_presence():
+    """The app's chat PresenceRegistry"""
+    return current_app.extensions['chat_presence']
+
+def get_dispatcher():
+    """The app's SupportDispatcher"""
+    return current_app.extensions['chat_dispatcher']
+
+def get_room_access():
+    """The app's chat RoomAccessCache"""
+    return current_app.extensions['chat_room_access']
+
+def has_cached_room_access(room_id):
+    """True if this connection joined room_id (passing the access check) and is still in it"""
+    try:
+        return get_room_access().allows(request.sid, room_id, rooms())
+    except (TypeError, ValueError):
+        return False
+
+def send_message_notification(room_id, participant_ids, message_data):
+    """Notify participants who are not in the room: by socket if online, stored notification if offline"""
+    recipients = set(participant_ids) - {None, message_data['sender_id']}
+    if not recipients:
+        return
+    
+    presence = get_presence()
+    in_room = presence.room_user_ids(room_id)
+    online = presence.online_user_ids(recipients)
+    sender_name = message_data['sender_name'] or 'System'
+    preview = message_data['message'][:200]
+    
+    for user_id in recipients - in_room:
+        if user_id in online:
+            emit('chat_notification', {
+                'room_id': int(room_id),
+                'message_id': message_data['id'],
+                'sender_name': sender_name,
+                'preview': preview
+            }, room=user_room(user_id))
+        else:
+            store_offline_notification(user_id, room_id, sender_name, preview)
+
+def store_offline_notification(user_id, room_id, sender_name, preview):
+    """Keep one unread notification per user and room, updated as more messages arrive"""
+    from models.admin import AdminNotification
+    
+    try:
+        notification = AdminNotification.query.filter_by(
+            user_id=user_id,
+            notification_type='chat_message',
+            related_model='ChatRoom',
+            related_id=room_id,
+            is_read=False
+        ).first()
+        
+        if notification is None:
+            notification = AdminNotification(
+                user_id=user_id,
+                notification_type='chat_message',
+                priority='normal',
+                related_model='ChatRoom',
+                related_id=room_id
+            )
+            db.session.add(notification)
+        
+        notification.title = f'New message from {sender_name}'
+        notification.message = preview
+        db.session.commit()
+        
+    except Exception as e:
+        db.session.rollback()
+        print(f'Error storing chat notification: {e}')
 
 def notify_staff_new_support_room(chat_room):
-    """Notify available staff about new support room"""
-    # This would notify staff members about new support requests
-    print(f'New support room created: {chat_room.id} by {chat_room.customer.full_name}')
\ No newline at end of file
+    """Route a new support room to the least-loaded online staff, or tell online staff it is waiting"""
+    room_id = chat_room.id
+    dispatcher = get_dispatcher()
+    assignments = dispatcher.dispatch()
+    if any(assigned_room_id == room_id for assigned_room_id, _, _ in assignments):
+        return
+    
+    for staff_id in get_presence().online_user_ids(dispatcher.queue.staff_ids()):
+        emit('support_room_waiting', {'room_id': room_id}, room=user_room(staff_id))
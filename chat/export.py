@@ -0,0 +1,242 @@
+"""
+Chat Export
+Streams chat history as JSON, JSON Lines or text in batches, and writes many rooms
+to one compressed archive
+"""
+from models.chat import ChatRoom, ChatMessage
+from models.user import User
+from chat.archive import ChatArchiveService
+from database import db
+from utils.export_stream import ndjson_chunks, json_array_chunks, gzip_chunks
+from flask import current_app
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from datetime import datetime
+from itertools import chain
+import os
+
+BATCH_SIZE = 1000
+
+def _full_name(first_name, last_name):
+    if first_name is None and last_name is None:
+        return None
+    return f"{first_name} {last_name}"
+
+class ChatExportService:
+    """Service for exporting chat rooms without holding their messages in memory"""
+    
+    @staticmethod
+    def room_records(*criteria):
+        """Rooms matching criteria as export records, participant names joined in"""
+        customer = aliased(User)
+        staff = aliased(User)
+        
+        rows = db.session.query(
+            ChatRoom.id, ChatRoom.name, ChatRoom.room_type, ChatRoom.status,
+            ChatRoom.customer_id, customer.first_name, customer.last_name,
+            ChatRoom.staff_id, staff.first_name, staff.last_name,
+            ChatRoom.service_request_id, ChatRoom.created_at, ChatRoom.closed_at
+        ).outerjoin(customer, customer.id == ChatRoom.customer_id).outerjoin(
+            staff, staff.id == ChatRoom.staff_id
+        ).filter(*criteria).order_by(ChatRoom.id).yield_per(BATCH_SIZE)
+        
+        for (room_id, name, room_type, status, customer_id, customer_first, customer_last,
+             staff_id, staff_first, staff_last, service_request_id, created_at, closed_at) in rows:
+            yield {
+                'record_type': 'room',
+                'id': room_id,
+                'name': name,
+                'room_type': room_type,
+                'status': status,
+                'customer_id': customer_id,
+                'customer_name': _full_name(customer_first, customer_last),
+                'staff_id': staff_id,
+                'staff_name': _full_name(staff_first, staff_last),
+                'service_request_id': service_request_id,
+                'created_at': created_at.isoformat() if created_at else None,
+                'closed_at': closed_at.isoformat() if closed_at else None
+            }
+    
+    @staticmethod
+    def message_records(*criteria):
+        """
+        Non-deleted messages matching criteria as export records, by room then time.
+        Rows are fetched BATCH_SIZE at a time with sender names joined in (no per-row lookups).
+        """
+        rows = db.session.query(
+            ChatMessage.id, ChatMessage.room_id, ChatMessage.sender_id,
+            User.first_name, User.last_name, ChatMessage.message, ChatMessage.message_type,
+            ChatMessage.file_url, ChatMessage.reply_to_message_id, ChatMessage.is_edited,
+            ChatMessage.created_at
+        ).outerjoin(User, User.id == ChatMessage.sender_id).filter(
+            ChatMessage.is_deleted == False,
+            *criteria
+        ).order_by(ChatMessage.room_id, ChatMessage.created_at, ChatMessage.id).yield_per(BATCH_SIZE)
+        
+        for row in rows:
+            yield ChatExportService._message_record(row._mapping, _full_name(row.first_name, row.last_name))
+    
+    @staticmethod
+    def archived_message_records(room_id):
+        """Message records of an archived room, read from its archive file instead of chat_messages"""
+        archive_path = db.session.query(ChatRoom.archive_path).filter(ChatRoom.id == room_id).scalar()
+        if not archive_path:
+            return
+        
+        # First pass collects the senders so their names load in one query
+        sender_ids = {row['sender_id'] for row in ChatArchiveService.read_archived_rows(archive_path)}
+        sender_names = {
+            user_id: _full_name(first_name, last_name)
+            for user_id, first_name, last_name in db.session.query(
+                User.id, User.first_name, User.last_name
+            ).filter(User.id.in_(sender_ids - {None}))
+        }
+        
+        # Archives are written in id order
+        for row in ChatArchiveService.read_archived_rows(archive_path):
+            if not row['is_deleted']:
+                yield ChatExportService._message_record(row, sender_names.get(row['sender_id']))
+    
+    @staticmethod
+    def _message_record(values, sender_name):
+        return {
+            'record_type': 'message',
+            'id': values['id'],
+            'room_id': values['room_id'],
+            'sender_id': values['sender_id'],
+            'sender_name': sender_name or 'System',
+            'message': values['message'],
+            'message_type': values['message_type'],
+            'file_url': values['file_url'],
+            'reply_to_message_id': values['reply_to_message_id'],
+            'is_edited': values['is_edited'],
+            'created_at': values['created_at'].isoformat() if values['created_at'] else None
+        }
+    
+    @staticmethod
+    def export_room(room_id, format='json'):
+        """
+        Chat history of one room as a generator of text chunks.
+        format is 'json' (one document), 'jsonl' (room record, then one message per line)
+        or 'txt'. Returns None if the room does not exist or the format is unknown.
+        """
+        room = next(ChatExportService.room_records(ChatRoom.id == room_id), None)
+        if room is None or format not in ('json', 'jsonl', 'txt'):
+            return None
+        
+        if room['status'] == 'archived':
+            messages = ChatExportService.archived_message_records(room_id)
+        else:
+            messages = ChatExportService.message_records(ChatMessage.room_id == room_id)
+        exported_at = datetime.utcnow()
+        
+        if format == 'jsonl':
+            return ndjson_chunks(chain([dict(room, exported_at=exported_at.isoformat())], messages))
+        
+        if format == 'json':
+            exported = {'count': 0}
+            
+            def records():
+                for message in messages:
+                    exported['count'] += 1
+                    yield message
+            
+            return json_array_chunks(records(), 'messages', extra=lambda: {
+                'room': room,
+                'exported_at': exported_at.isoformat(),
+                'total_messages': exported['count']
+            })
+        
+        return ChatExportService._text_chunks(room, messages, exported_at)
+    
+    @staticmethod
+    def _text_chunks(room, messages, exported_at):
+        yield '\n'.join([
+            f"Chat History - {room['name'] or 'Support Chat'}",
+            f"Exported: {exported_at.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Room ID: {room['id']}",
+            "-" * 50
+        ])
+        
+        for message in messages:
+            timestamp = message['created_at'][:19].replace('T', ' ') if message['created_at'] else ''
+            yield f"\n[{timestamp}] {message['sender_name']}: {message['message']}"
+    
+    @staticmethod
+    def archive_chunks(*room_criteria, counts=None):
+        """
+        gzip-compressed JSON Lines for every room matching room_criteria:
+        a manifest line, one line per room, then one line per message.
+        Messages of archived rooms are read from their archive files.
+        Pass a dict as counts to receive the number of records written per record_type.
+        """
+        room_ids = select(ChatRoom.id).where(*room_criteria)
+        
+        manifest = {
+            'record_type': 'manifest',
+            'exported_at': datetime.utcnow().isoformat(),
+            'format': 'gm-chat-archive/1'
+        }
+        records = chain(
+            [manifest],
+            ChatExportService.room_records(*room_criteria),
+            ChatExportService.message_records(ChatMessage.room_id.in_(room_ids)),
+            ChatExportService._archived_rooms_message_records(room_criteria)
+        )
+        if counts is not None:
+            records = ChatExportService._counted(records, counts)
+        return gzip_chunks(ndjson_chunks(records))
+    
+    @staticmethod
+    def _archived_rooms_message_records(room_criteria):
+        archived_room_ids = db.session.query(ChatRoom.id).filter(
+            ChatRoom.status == 'archived',
+            *room_criteria
+        ).order_by(ChatRoom.id).all()
+        
+        for (room_id,) in archived_room_ids:
+            yield from ChatExportService.archived_message_records(room_id)
+    
+    @staticmethod
+    def _counted(records, counts):
+        for record in records:
+            counts[record['record_type']] = counts.get(record['record_type'], 0) + 1
+            yield record
+    
+    @staticmethod
+    def write_closed_rooms_archive(start_date, end_date, export_dir=None):
+        """
+        Write rooms closed in [start_date, end_date) to <export_dir>/chat_rooms_closed_<start>_<end>.jsonl.gz.
+        The file appears only once it is complete. Returns the path and record counts.
+        """
+        if export_dir is None:
+            export_dir = current_app.config.get('CHAT_EXPORT_DIR', 'logs/chat_exports')
+        os.makedirs(export_dir, exist_ok=True)
+        
+        criteria = (
+            ChatRoom.status.in_(('closed', 'archived')),
+            ChatRoom.closed_at >= start_date,
+            ChatRoom.closed_at < end_date
+        )
+        archive_path = os.path.join(
+            export_dir,
+            f"chat_rooms_closed_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.jsonl.gz"
+        )
+        temp_path = f'{archive_path}.part'
+        counts = {}
+        
+        try:
+            with open(temp_path, 'wb') as archive_file:
+                for chunk in ChatExportService.archive_chunks(*criteria, counts=counts):
+                    archive_file.write(chunk)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        
+        os.replace(temp_path, archive_path)
+        return {
+            'archive_path': archive_path,
+            'rooms': counts.get('room', 0),
+            'messages': counts.get('message', 0)
+        }
@@ -0,0 +1,198 @@
+"""
+Chat Message Queue
+Cross-process fan-out for Socket.IO events: Redis when available, or a small
+in-repo broker for tests and single-host deployments
+"""
+from socketio import PubSubManager
+from urllib.parse import urlparse
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BROKER_PORT = 6380
+
+# First line a client sends: publishers are never relayed to, subscribers never publish
+PUBLISH_HANDSHAKE = b'PUB\n'
+SUBSCRIBE_HANDSHAKE = b'SUB\n'
+
+# Seconds a subscriber may block the relay before it is disconnected
+SEND_TIMEOUT = 5
+
+class LocalBrokerManager(PubSubManager):
+    """
+    Socket.IO client manager that relays events through a LocalBroker.
+    
+    Every worker publishes JSON lines to the broker over TCP and keeps a
+    second connection open to receive what the other workers publish; each
+    connection announces its role with a handshake line.
+    URL format: local://host:port
+    """
+    
+    name = 'local'
+    
+    def __init__(self, url='local://127.0.0.1:6380', channel='socketio', write_only=False, logger=None):
+        parsed = urlparse(url)
+        if parsed.scheme != 'local':
+            raise ValueError(f'unexpected connection string: {url}')
+        
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_BROKER_PORT)
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+    
+    def _connect(self, handshake):
+        connection = socket.create_connection(self.address, timeout=5)
+        connection.sendall(handshake)
+        return connection
+    
+    def _publish(self, data):
+        frame = (json.dumps({'channel': self.channel, 'data': data}) + '\n').encode('utf-8')
+        
+        with self._publish_lock:
+            # One reconnect attempt, e.g. after the broker restarted
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect(PUBLISH_HANDSHAKE)
+                    self._publisher.sendall(frame)
+                    return
+                except OSError as e:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                        self._publisher = None
+                    if attempt:
+                        logger.error(f"Failed to publish Socket.IO event to {self.address}: {str(e)}")
+    
+    def _listen(self):
+        retry_delay = 1
+        while True:
+            try:
+                connection = self._connect(SUBSCRIBE_HANDSHAKE)
+                connection.settimeout(None)
+                retry_delay = 1
+                
+                with connection, connection.makefile('rb') as stream:
+                    for line in stream:
+                        message = json.loads(line)
+                        if message.get('channel') == self.channel:
+                            yield message['data']
+                
+                logger.warning("Socket.IO broker closed the connection, reconnecting")
+            
+            except (OSError, ValueError) as e:
+                logger.warning(f"Socket.IO broker unavailable ({str(e)}), retrying in {retry_delay}s")
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    """
+    Serves one client connection. A publisher's lines are relayed to every subscriber;
+    a subscriber is only written to, and is dropped if it stops reading.
+    """
+    
+    def handle(self):
+        role = self.rfile.readline()
+        if role == PUBLISH_HANDSHAKE:
+            self._relay()
+        elif role == SUBSCRIBE_HANDSHAKE:
+            self._subscribe()
+        else:
+            logger.warning(f"Rejected Socket.IO broker client {self.client_address}: bad handshake")
+    
+    def _relay(self):
+        broker = self.server
+        for line in self.rfile:
+            with broker.clients_lock:
+                clients = list(broker.clients.items())
+            
+            for connection, client_lock in clients:
+                try:
+                    with client_lock:
+                        connection.sendall(line)
+                except OSError as e:
+                    # Includes send timeouts: a stalled subscriber must not stall publishing
+                    logger.warning(f"Dropping Socket.IO broker subscriber: {str(e)}")
+                    broker.drop(connection)
+    
+    def _subscribe(self):
+        broker = self.server
+        self.connection.settimeout(SEND_TIMEOUT)
+        with broker.clients_lock:
+            broker.clients[self.connection] = threading.Lock()
+        
+        try:
+            # Subscribers send nothing after the handshake; wait for them to hang up
+            while True:
+                try:
+                    if not self.connection.recv(4096):
+                        break
+                except socket.timeout:
+                    continue
+        except OSError:
+            pass
+        finally:
+            broker.drop(self.connection)
+
+class LocalBroker(socketserver.ThreadingTCPServer):
+    """
+    Minimal pub/sub relay for LocalBrokerManager.
+    Binds to localhost by default; do not expose it on a public interface.
+    """
+    
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, host='127.0.0.1', port=DEFAULT_BROKER_PORT):
+        super().__init__((host, port), _BrokerHandler)
+        self.clients = {}  # subscriber connection -> send lock
+        self.clients_lock = threading.Lock()
+    
+    def drop(self, connection):
+        """Disconnect a subscriber; its manager reconnects"""
+        with self.clients_lock:
+            if self.clients.pop(connection, None) is None:
+                return
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    
+    def start(self):
+        """Serve in a daemon thread (tests, single-process development)"""
+        thread = threading.Thread(target=self.serve_forever, name='socketio-local-broker', daemon=True)
+        thread.start()
+        return thread
+
+def message_queue_options(config):
+    """
+    Keyword arguments for socketio.init_app from SOCKETIO_MESSAGE_QUEUE.
+    redis:// (or any URL Flask-SocketIO understands) is passed through;
+    local:// uses LocalBrokerManager; unset keeps the in-process manager.
+    """
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    
+    if not url:
+        return {}
+    
+    if url.startswith('local://'):
+        return {'client_manager': LocalBrokerManager(url, channel=channel)}
+    
+    return {'message_queue': url, 'channel': channel}
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Run the local Socket.IO message broker')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_BROKER_PORT)
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    logger.info(f"Socket.IO broker listening on {args.host}:{args.port}")
+    LocalBroker(args.host, args.port).serve_forever()
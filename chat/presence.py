@@ -0,0 +1,265 @@
+"""
+Chat Presence
+Tracks connected sockets per user and room with heartbeat TTLs, and throttles
+typing indicators
+"""
+import threading
+import time
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+def user_room(user_id):
+    """Socket.IO room holding every connection of one user"""
+    return f'user_{user_id}'
+
+class MemoryPresenceBackend:
+    """Presence state for a single process (development, tests, one worker)"""
+    
+    def __init__(self):
+        self.sockets = {}  # sid -> [user_id, expires_at, set of room ids]
+        self.lock = threading.Lock()
+    
+    def touch(self, sid, user_id, expires_at):
+        with self.lock:
+            entry = self.sockets.setdefault(sid, [user_id, expires_at, set()])
+            entry[0] = user_id
+            entry[1] = expires_at
+    
+    def remove(self, sid):
+        with self.lock:
+            entry = self.sockets.pop(sid, None)
+        return entry[2] if entry else set()
+    
+    def join(self, sid, room_id):
+        with self.lock:
+            if sid in self.sockets:
+                self.sockets[sid][2].add(room_id)
+    
+    def leave(self, sid, room_id):
+        with self.lock:
+            if sid in self.sockets:
+                self.sockets[sid][2].discard(room_id)
+    
+    def online_user_ids(self, user_ids, now):
+        wanted = set(user_ids)
+        with self.lock:
+            self._prune(now)
+            return {user_id for user_id, _, _ in self.sockets.values() if user_id in wanted}
+    
+    def room_user_ids(self, room_id, now):
+        with self.lock:
+            self._prune(now)
+            return {user_id for user_id, _, rooms in self.sockets.values() if room_id in rooms}
+    
+    def _prune(self, now):
+        for sid in [sid for sid, entry in self.sockets.items() if entry[1] <= now]:
+            del self.sockets[sid]
+
+class RedisPresenceBackend:
+    """
+    Presence state shared by every worker and host through Redis.
+    Sorted sets hold socket ids scored by their expiry time, so expired
+    sockets are ignored without a cleanup job.
+    """
+    
+    def __init__(self, url, prefix='gm:presence'):
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+    
+    def _user_key(self, user_id):
+        return f'{self.prefix}:user:{user_id}'
+    
+    def _room_key(self, room_id):
+        return f'{self.prefix}:room:{room_id}'
+    
+    def _socket_key(self, sid):
+        return f'{self.prefix}:sid:{sid}'
+    
+    def touch(self, sid, user_id, expires_at):
+        key_ttl = max(int(expires_at - time.time()) * 2, 60)
+        socket_key = self._socket_key(sid)
+        room_ids = [room_id.decode() for room_id in self.redis.smembers(f'{socket_key}:rooms')]
+        
+        pipeline = self.redis.pipeline()
+        pipeline.hset(socket_key, 'user_id', user_id)
+        pipeline.expire(socket_key, key_ttl)
+        pipeline.expire(f'{socket_key}:rooms', key_ttl)
+        pipeline.zadd(self._user_key(user_id), {sid: expires_at})
+        pipeline.expire(self._user_key(user_id), key_ttl)
+        for room_id in room_ids:
+            pipeline.zadd(self._room_key(room_id), {f'{user_id}:{sid}': expires_at})
+            pipeline.expire(self._room_key(room_id), key_ttl)
+        pipeline.execute()
+    
+    def remove(self, sid):
+        socket_key = self._socket_key(sid)
+        user_id = self.redis.hget(socket_key, 'user_id')
+        room_ids = {int(room_id) for room_id in self.redis.smembers(f'{socket_key}:rooms')}
+        
+        pipeline = self.redis.pipeline()
+        if user_id is not None:
+            user_id = user_id.decode()
+            pipeline.zrem(self._user_key(user_id), sid)
+            for room_id in room_ids:
+                pipeline.zrem(self._room_key(room_id), f'{user_id}:{sid}')
+        pipeline.delete(socket_key, f'{socket_key}:rooms')
+        pipeline.execute()
+        return room_ids
+    
+    def join(self, sid, room_id):
+        socket_key = self._socket_key(sid)
+        user_id = self.redis.hget(socket_key, 'user_id')
+        if user_id is None:
+            return
+        
+        ttl = max(self.redis.ttl(socket_key), 60)
+        expires_at = self.redis.zscore(self._user_key(user_id.decode()), sid) or time.time()
+        
+        pipeline = self.redis.pipeline()
+        pipeline.sadd(f'{socket_key}:rooms', room_id)
+        pipeline.expire(f'{socket_key}:rooms', ttl)
+        pipeline.zadd(self._room_key(room_id), {f'{user_id.decode()}:{sid}': expires_at})
+        pipeline.expire(self._room_key(room_id), ttl)
+        pipeline.execute()
+    
+    def leave(self, sid, room_id):
+        socket_key = self._socket_key(sid)
+        user_id = self.redis.hget(socket_key, 'user_id')
+        
+        pipeline = self.redis.pipeline()
+        pipeline.srem(f'{socket_key}:rooms', room_id)
+        if user_id is not None:
+            pipeline.zrem(self._room_key(room_id), f'{user_id.decode()}:{sid}')
+        pipeline.execute()
+    
+    def online_user_ids(self, user_ids, now):
+        user_ids = list(user_ids)
+        pipeline = self.redis.pipeline()
+        for user_id in user_ids:
+            pipeline.zcount(self._user_key(user_id), now, '+inf')
+        return {user_id for user_id, count in zip(user_ids, pipeline.execute()) if count}
+    
+    def room_user_ids(self, room_id, now):
+        members = self.redis.zrangebyscore(self._room_key(room_id), now, '+inf')
+        return {int(member.decode().split(':', 1)[0]) for member in members}
+
+class TypingThrottle:
+    """
+    Coalesces typing events per user and room in this process.
+    A change of state is forwarded at most once per interval; a repeated "still typing"
+    is forwarded only after refresh_after seconds so clients can expire stale indicators.
+    """
+    
+    def __init__(self, interval=1.0, refresh_after=3.0, max_entries=10000):
+        self.interval = interval
+        self.refresh_after = refresh_after
+        self.max_entries = max_entries
+        self.state = {}  # (room_id, user_id) -> (is_typing, last_emitted_at)
+        self.lock = threading.Lock()
+    
+    def should_emit(self, room_id, user_id, is_typing):
+        key = (room_id, user_id)
+        now = time.monotonic()
+        
+        with self.lock:
+            last_state, last_emitted_at = self.state.get(key, (False, 0.0))
+            elapsed = now - last_emitted_at
+            
+            if is_typing == last_state:
+                emit = is_typing and elapsed >= self.refresh_after
+            else:
+                # "Stopped typing" always goes out so indicators clear promptly
+                emit = not is_typing or elapsed >= self.interval
+            
+            if emit:
+                self.state[key] = (is_typing, now)
+                if len(self.state) > self.max_entries:
+                    self._prune(now)
+        
+        return emit
+    
+    def typing_rooms(self, user_id):
+        """Rooms where this user was last announced as typing"""
+        with self.lock:
+            return [room_id for (room_id, typing_user_id), (is_typing, _) in self.state.items()
+                    if typing_user_id == user_id and is_typing]
+    
+    def clear(self, room_id, user_id):
+        with self.lock:
+            self.state.pop((room_id, user_id), None)
+    
+    def _prune(self, now):
+        cutoff = now - max(self.refresh_after, self.interval) * 10
+        for key in [key for key, (_, emitted_at) in self.state.items() if emitted_at < cutoff]:
+            del self.state[key]
+
+class PresenceRegistry:
+    """
+    Who is connected, and to which chat rooms.
+    A socket counts as present until CHAT_PRESENCE_TTL seconds pass without a heartbeat;
+    every event the socket sends counts as one.
+    Uses Redis when CHAT_PRESENCE_URL (or a redis:// SOCKETIO_MESSAGE_QUEUE) is set, so all
+    workers share one view; otherwise state is kept per process.
+    """
+    
+    def __init__(self, app=None):
+        self.backend = MemoryPresenceBackend()
+        self.typing = TypingThrottle()
+        self.ttl = 60
+        self.last_seen = {}  # sid -> time of the last presence write from this process
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.ttl = app.config.get('CHAT_PRESENCE_TTL', 60)
+        self.typing = TypingThrottle(
+            interval=app.config.get('CHAT_TYPING_INTERVAL', 1.0),
+            refresh_after=app.config.get('CHAT_TYPING_REFRESH', 3.0)
+        )
+        
+        url = app.config.get('CHAT_PRESENCE_URL')
+        queue_url = app.config.get('SOCKETIO_MESSAGE_QUEUE') or ''
+        if not url and queue_url.startswith(('redis://', 'rediss://')):
+            url = queue_url
+        
+        if url and redis is not None:
+            self.backend = RedisPresenceBackend(url)
+        else:
+            if url:
+                app.logger.warning("redis is not installed, chat presence is tracked per process")
+            self.backend = MemoryPresenceBackend()
+        
+        app.extensions['chat_presence'] = self
+    
+    def connect(self, sid, user_id):
+        self.heartbeat(sid, user_id)
+    
+    def heartbeat(self, sid, user_id):
+        now = time.time()
+        self.last_seen[sid] = now
+        self.backend.touch(sid, user_id, now + self.ttl)
+    
+    def seen(self, sid, user_id):
+        """Refresh presence for any event from the socket, writing at most every ttl / 3 seconds"""
+        if time.time() - self.last_seen.get(sid, 0) >= self.ttl / 3:
+            self.heartbeat(sid, user_id)
+    
+    def disconnect(self, sid):
+        """Forget a socket; returns the room ids it had joined"""
+        self.last_seen.pop(sid, None)
+        return self.backend.remove(sid)
+    
+    def join_room(self, sid, room_id):
+        self.backend.join(sid, int(room_id))
+    
+    def leave_room(self, sid, room_id):
+        self.backend.leave(sid, int(room_id))
+    
+    def online_user_ids(self, user_ids):
+        return self.backend.online_user_ids(user_ids, time.time())
+    
+    def room_user_ids(self, room_id):
+        return self.backend.room_user_ids(int(room_id), time.time())
@@ -0,0 +1,65 @@
+"""
+Chat Room Access
+Per-connection cache of chat room authorizations, so steady-state socket events
+skip the room lookup
+"""
+from collections import OrderedDict
+import threading
+
+class RoomAccessCache:
+    """
+    Rooms each socket has been authorized for by join_room.
+    Each connection keeps at most CHAT_ROOM_ACCESS_CACHE_SIZE rooms (least recently used
+    are dropped). A grant only counts while the socket is still in the Socket.IO room,
+    so closing the room (which the message queue propagates to every worker) also
+    invalidates grants held by other processes.
+    """
+    
+    def __init__(self, app=None, max_rooms=64):
+        self.max_rooms = max_rooms
+        self.grants = {}  # sid -> OrderedDict of room id -> None
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.max_rooms = app.config.get('CHAT_ROOM_ACCESS_CACHE_SIZE', self.max_rooms)
+        app.extensions['chat_room_access'] = self
+    
+    def grant(self, sid, room_id):
+        with self.lock:
+            rooms = self.grants.setdefault(sid, OrderedDict())
+            rooms[int(room_id)] = None
+            rooms.move_to_end(int(room_id))
+            while len(rooms) > self.max_rooms:
+                rooms.popitem(last=False)
+    
+    def allows(self, sid, room_id, socket_rooms):
+        """True if sid was granted room_id and is still in its Socket.IO room"""
+        with self.lock:
+            rooms = self.grants.get(sid)
+            if rooms is None or int(room_id) not in rooms:
+                return False
+            
+            if str(room_id) not in socket_rooms:
+                del rooms[int(room_id)]
+                return False
+            
+            rooms.move_to_end(int(room_id))
+            return True
+    
+    def revoke(self, sid, room_id):
+        with self.lock:
+            rooms = self.grants.get(sid)
+            if rooms is not None:
+                rooms.pop(int(room_id), None)
+    
+    def invalidate_room(self, room_id):
+        """Drop every grant for a room held in this process"""
+        with self.lock:
+            for rooms in self.grants.values():
+                rooms.pop(int(room_id), None)
+    
+    def forget(self, sid):
+        with self.lock:
+            self.grants.pop(sid, None)
@@ -0,0 +1,140 @@
+"""
+Chat Room Summaries
+Builds room lists (last message, unread count, participants) in a fixed number of queries
+and repairs the denormalized counters they read
+"""
+from models.chat import ChatRoom, ChatMessage
+from database import db
+from sqlalchemy import select, update, func
+from sqlalchemy.orm import selectinload
+
+class ChatRoomSummaryService:
+    """Service for listing a user's chat rooms without per-room queries"""
+    
+    @staticmethod
+    def get_active_rooms(user):
+        """Active rooms visible to a user, newest activity first, with participants loaded"""
+        query = ChatRoom.query.filter_by(status='active').options(
+            selectinload(ChatRoom.customer),
+            selectinload(ChatRoom.staff_member),
+            selectinload(ChatRoom.last_message).selectinload(ChatMessage.sender),
+            selectinload(ChatRoom.last_message).selectinload(ChatMessage.reply_to)
+        )
+        
+        if user.is_admin():
+            # Admin sees every active room
+            pass
+        elif user.is_staff():
+            query = query.filter_by(staff_id=user.id)
+        elif user.is_customer():
+            query = query.filter_by(customer_id=user.id)
+        else:
+            return []
+        
+        return query.order_by(ChatRoom.last_activity.desc()).all()
+    
+    @staticmethod
+    def get_unread_counts(room_ids, user_id):
+        """Map room id -> messages not sent by user_id and still unread"""
+        if not room_ids:
+            return {}
+        
+        return dict(
+            db.session.query(ChatMessage.room_id, func.count(ChatMessage.id))
+            .filter(
+                ChatMessage.room_id.in_(room_ids),
+                ChatMessage.sender_id != user_id,
+                ChatMessage.is_read == False,
+                ChatMessage.is_deleted == False
+            )
+            .group_by(ChatMessage.room_id)
+            .all()
+        )
+    
+    @staticmethod
+    def room_display_name(room, user_id):
+        """Room name as shown to a participant"""
+        if room.name:
+            return room.name
+        if user_id == room.staff_id:
+            return f'Chat with {room.customer.full_name}'
+        return f'Chat with {room.staff_member.full_name if room.staff_member else "Support"}'
+    
+    @staticmethod
+    def summarize_rooms(rooms, user_id):
+        """Room list entries for the get_user_rooms event"""
+        # Participants read their counter column; others (admins) need one grouped COUNT
+        unread_counts = ChatRoomSummaryService.get_unread_counts(
+            [room.id for room in rooms if user_id not in (room.customer_id, room.staff_id)],
+            user_id
+        )
+        
+        room_data = []
+        for room in rooms:
+            if user_id == room.customer_id:
+                unread_count = room.customer_unread_count
+            elif user_id == room.staff_id:
+                unread_count = room.staff_unread_count
+            else:
+                unread_count = unread_counts.get(room.id, 0)
+            
+            room_data.append({
+                'id': room.id,
+                'name': ChatRoomSummaryService.room_display_name(room, user_id),
+                'last_message': room.last_message.to_dict() if room.last_message else None,
+                'unread_count': unread_count,
+                'last_activity': room.last_activity.isoformat() if room.last_activity else None,
+                'participants': [p.to_dict() for p in room.get_participants()]
+            })
+        
+        return room_data
+    
+    @staticmethod
+    def get_room_summaries(user):
+        """Active rooms of a user as summary dictionaries"""
+        rooms = ChatRoomSummaryService.get_active_rooms(user)
+        return ChatRoomSummaryService.summarize_rooms(rooms, user.id)
+    
+    @staticmethod
+    def recompute_room_counters(room_ids=None):
+        """
+        Rebuild last_message_id, last_message_preview and the unread counters from chat_messages.
+        Runs as set-based UPDATEs; pass room_ids to limit the repair to some rooms.
+        """
+        latest_id = select(ChatMessage.id).where(
+            ChatMessage.room_id == ChatRoom.id
+        ).order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(1).scalar_subquery()
+        
+        def unread_for(participant_column):
+            return select(func.count(ChatMessage.id)).where(
+                ChatMessage.room_id == ChatRoom.id,
+                ChatMessage.is_read == False,
+                ChatMessage.is_deleted == False,
+                # NULL-safe "sent by someone else", like sender_id != participant in Python
+                ChatMessage.sender_id.is_distinct_from(participant_column)
+            ).scalar_subquery()
+        
+        try:
+            statement = update(ChatRoom).values(
+                last_message_id=latest_id,
+                customer_unread_count=unread_for(ChatRoom.customer_id),
+                staff_unread_count=unread_for(ChatRoom.staff_id)
+            )
+            if room_ids is not None:
+                statement = statement.where(ChatRoom.id.in_(room_ids))
+            rooms_updated = db.session.execute(statement.execution_options(synchronize_session=False)).rowcount
+            
+            preview = select(func.substr(ChatMessage.message, 1, 200)).where(
+                ChatMessage.id == ChatRoom.last_message_id
+            ).scalar_subquery()
+            statement = update(ChatRoom).values(last_message_preview=preview)
+            if room_ids is not None:
+                statement = statement.where(ChatRoom.id.in_(room_ids))
+            db.session.execute(statement.execution_options(synchronize_session=False))
+            
+            db.session.commit()
+            return {'rooms_updated': rooms_updated}
+        
+        except Exception as e:
+            db.session.rollback()
+            raise e
@@ -0,0 +1,189 @@
+"""
+Chat Message Search
+Ranked full-text search over chat_messages: PostgreSQL full-text search backed by a
+GIN index, with an in-memory inverted index for SQLite and other databases
+"""
+from models.chat import ChatMessage
+from database import db
+from sqlalchemy import func, literal_column
+from sqlalchemy.orm import selectinload
+from html import escape
+import math
+import re
+import threading
+
+# Must match the expression of idx_chat_messages_search
+SEARCH_CONFIG = "'english'"
+# ts_headline marks matches with control characters; they become <mark> after HTML escaping
+HEADLINE_OPTIONS = 'StartSel="\x02", StopSel="\x03", MaxFragments=2, MaxWords=20, MinWords=5'
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+class _InMemoryMessageIndex:
+    """
+    Inverted index (token -> {message id: term frequency}) kept in process memory.
+    It catches up incrementally on every search using the highest id and updated_at
+    already indexed, so it suits test runs and small single-process deployments.
+    """
+    
+    def __init__(self):
+        self.postings = {}
+        self.documents = {}  # message id -> (room_id, sender_id, token count, tokens)
+        self.last_id = 0
+        self.last_updated_at = None
+        self.lock = threading.Lock()
+    
+    def _remove(self, message_id):
+        document = self.documents.pop(message_id, None)
+        if document:
+            for token in set(document[3]):
+                self.postings.get(token, {}).pop(message_id, None)
+    
+    def _add(self, message_id, room_id, sender_id, text):
+        tokens = [token.lower() for token in TOKEN_PATTERN.findall(text or '')]
+        self.documents[message_id] = (room_id, sender_id, len(tokens), tokens)
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[message_id] = postings.get(message_id, 0) + 1
+    
+    def refresh(self):
+        """Index messages added or changed since the last refresh"""
+        changed = ChatMessage.id > self.last_id
+        if self.last_updated_at is not None:
+            changed = changed | (ChatMessage.updated_at >= self.last_updated_at)
+        
+        rows = db.session.query(
+            ChatMessage.id, ChatMessage.room_id, ChatMessage.sender_id,
+            ChatMessage.message, ChatMessage.is_deleted, ChatMessage.updated_at
+        ).filter(changed).yield_per(1000)
+        
+        for message_id, room_id, sender_id, text, is_deleted, updated_at in rows:
+            self._remove(message_id)
+            if not is_deleted:
+                self._add(message_id, room_id, sender_id, text)
+            
+            self.last_id = max(self.last_id, message_id)
+            if updated_at and (self.last_updated_at is None or updated_at > self.last_updated_at):
+                self.last_updated_at = updated_at
+    
+    def search(self, terms, room_id=None, sender_id=None, limit=50):
+        """Return [(message id, score)] for messages containing every term, best first"""
+        with self.lock:
+            self.refresh()
+            
+            postings = [self.postings.get(term, {}) for term in terms]
+            if not postings or not all(postings):
+                return []
+            
+            candidates = set.intersection(*(set(p) for p in postings))
+            scored = []
+            for message_id in candidates:
+                doc_room_id, doc_sender_id, length, _ = self.documents[message_id]
+                if room_id is not None and doc_room_id != room_id:
+                    continue
+                if sender_id is not None and doc_sender_id != sender_id:
+                    continue
+                
+                # Term frequency, damped for long messages
+                score = sum(p[message_id] for p in postings) / (1 + math.log(1 + length))
+                scored.append((message_id, score))
+        
+        scored.sort(key=lambda item: (-item[1], -item[0]))
+        return scored[:limit]
+
+# One index per database URL
+_memory_indexes = {}
+_memory_indexes_lock = threading.Lock()
+
+def _memory_index():
+    key = str(db.engine.url)
+    with _memory_indexes_lock:
+        if key not in _memory_indexes:
+            _memory_indexes[key] = _InMemoryMessageIndex()
+        return _memory_indexes[key]
+
+def _highlight(text, terms):
+    """Wrap matched terms in <mark>, like ts_headline"""
+    wanted = set(terms)
+    parts = re.split(r'(\w+)', text or '')
+    
+    # Odd positions are the words captured by the split
+    return ''.join(
+        f'<mark>{escape(part)}</mark>' if index % 2 and part.lower() in wanted else escape(part)
+        for index, part in enumerate(parts)
+    )
+
+class ChatSearchService:
+    """Service for ranked chat message search"""
+    
+    @staticmethod
+    def search(query, room_id=None, sender_id=None, limit=50):
+        """
+        Search non-deleted messages. Returns a list of
+        {'message': <compact message dict>, 'rank': float, 'highlight': str}, best match first.
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+        
+        if db.engine.dialect.name == 'postgresql':
+            rows = ChatSearchService._search_postgresql(query, room_id, sender_id, limit)
+        else:
+            rows = ChatSearchService._search_memory(query, room_id, sender_id, limit)
+        
+        return [
+            {'message': message.to_compact_dict(), 'rank': float(rank), 'highlight': highlight}
+            for message, rank, highlight in rows
+        ]
+    
+    @staticmethod
+    def _search_postgresql(query, room_id, sender_id, limit):
+        config = literal_column(SEARCH_CONFIG)
+        tsquery = func.websearch_to_tsquery(config, query)
+        vector = func.to_tsvector(config, ChatMessage.message)
+        rank = func.ts_rank_cd(vector, tsquery)
+        
+        # Rank and limit first so ts_headline only runs on the returned page
+        ranked = db.session.query(ChatMessage.id, rank.label('rank')).filter(
+            vector.op('@@')(tsquery),
+            ChatMessage.is_deleted == False
+        )
+        if room_id:
+            ranked = ranked.filter(ChatMessage.room_id == room_id)
+        if sender_id:
+            ranked = ranked.filter(ChatMessage.sender_id == sender_id)
+        ranked = ranked.order_by(rank.desc(), ChatMessage.id.desc()).limit(limit).subquery()
+        
+        rows = db.session.query(
+            ChatMessage,
+            ranked.c.rank,
+            func.ts_headline(config, ChatMessage.message, tsquery, HEADLINE_OPTIONS)
+        ).join(ranked, ChatMessage.id == ranked.c.id).options(
+            selectinload(ChatMessage.sender),
+            selectinload(ChatMessage.reply_to)
+        ).order_by(ranked.c.rank.desc(), ChatMessage.id.desc()).all()
+        
+        return [
+            (message, rank, escape(headline).replace('\x02', '<mark>').replace('\x03', '</mark>'))
+            for message, rank, headline in rows
+        ]
+    
+    @staticmethod
+    def _search_memory(query, room_id, sender_id, limit):
+        terms = [token.lower() for token in TOKEN_PATTERN.findall(query)]
+        scored = _memory_index().search(terms, room_id=room_id, sender_id=sender_id, limit=limit)
+        if not scored:
+            return []
+        
+        messages = {
+            message.id: message
+            for message in ChatMessage.query.filter(
+                ChatMessage.id.in_([message_id for message_id, _ in scored])
+            ).options(selectinload(ChatMessage.sender), selectinload(ChatMessage.reply_to))
+        }
+        
+        return [
+            (messages[message_id], score, _highlight(messages[message_id].message, terms))
+            for message_id, score in scored
+            if message_id in messages
+        ]
@@ -4,8 +4,13 @@ Helper functions for chat functionality
 """
 from models.chat import ChatRoom, ChatMessage
 from models.user import User
+from chat.room_summary import ChatRoomSummaryService
+from chat.search import ChatSearchService
+from chat.export import ChatExportService
 from database import db
 from datetime import datetime
+from flask import current_app
+from sqlalchemy.orm import selectinload
 
 def create_chat_room(customer_id, staff_id=None, room_type='support', service_request_id=None):
     """Create a new chat room"""
@@ -29,6 +34,11 @@ def assign_staff_to_room(room_id, staff_id):
         if staff_member and staff_member.is_staff():
             chat_room.staff_id = staff_id
             db.session.commit()
+            invalidate_room_access(room_id)
+            
+            dispatcher = current_app.extensions.get('chat_dispatcher')
+            if dispatcher:
+                dispatcher.room_assigned(staff_id)
             return True
     return False
 
@@ -38,39 +48,47 @@ def get_user_active_rooms(user_id):
     if not user:
         return []
     
-    if user.is_customer():
-        rooms = ChatRoom.query.filter_by(
-            customer_id=user_id,
-            status='active'
-        ).order_by(ChatRoom.last_activity.desc()).all()
-    
-    elif user.is_staff() or user.is_admin():
-        if user.is_admin():
-            rooms = ChatRoom.query.filter_by(
-                status='active'
-            ).order_by(ChatRoom.last_activity.desc()).all()
-        else:
-            rooms = ChatRoom.query.filter_by(
-                staff_id=user_id,
-                status='active'
-            ).order_by(ChatRoom.last_activity.desc()).all()
-    
-    else:
-        rooms = []
-    
-    return rooms
+    return ChatRoomSummaryService.get_active_rooms(user)
 
-def get_room_messages(room_id, limit=50, offset=0):
-    """Get messages from a chat room"""
-    messages = ChatMessage.query.filter_by(
-        room_id=room_id,
-        is_deleted=False
-    ).order_by(
-        ChatMessage.created_at.desc()
-    ).offset(offset).limit(limit).all()
+def get_user_room_summaries(user_id):
+    """Get active chat rooms with last message, unread count and participants"""
+    user = User.query.get(user_id)
+    if not user:
+        return []
     
-    # Return in chronological order (oldest first)
-    return list(reversed(messages))
+    return ChatRoomSummaryService.get_room_summaries(user)
+
+def get_message_page(room_id, before_id=None, limit=50):
+    """
+    Get a page of messages older than before_id (the newest page when None).
+    Pages by message id, so each page is an index range scan however deep the history.
+    Returns (messages oldest first, has_more).
+    """
+    limit = max(1, min(limit, current_app.config.get('MESSAGE_HISTORY_LIMIT', 100)))
+    
+    query = ChatMessage.query.filter(
+        ChatMessage.room_id == room_id,
+        ChatMessage.is_deleted == False
+    )
+    if before_id:
+        query = query.filter(ChatMessage.id < before_id)
+    
+    # One extra row tells whether an older page exists
+    messages = query.options(
+        selectinload(ChatMessage.sender),
+        selectinload(ChatMessage.reply_to)
+    ).order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+    
+    return messages, has_more
+
+def get_room_messages(room_id, limit=50, before_id=None):
+    """Get messages from a chat room"""
+    messages, _ = get_message_page(room_id, before_id=before_id, limit=limit)
+    return messages
 
 def send_system_message(room_id, message_text):
     """Send a system message to a chat room"""
@@ -82,6 +100,9 @@ def send_system_message(room_id, message_text):
     )
     
     db.session.add(system_message)
+    db.session.flush()
+    
+    system_message.room.record_new_message(system_message)
     db.session.commit()
     
     return system_message
@@ -90,6 +111,8 @@ def close_chat_room(room_id, closed_by_user_id):
     """Close a chat room"""
     chat_room = ChatRoom.query.get(room_id)
     if chat_room:
+        was_active = chat_room.status == 'active'
+        staff_id = chat_room.staff_id
         chat_room.status = 'closed'
         chat_room.closed_at = datetime.utcnow()
         
@@ -102,10 +125,29 @@ def close_chat_room(room_id, closed_by_user_id):
             )
         
         db.session.commit()
+        
+        # Closing the Socket.IO room ends cached access on every worker
+        invalidate_room_access(room_id, close_socket_room=True)
+        
+        # Frees a slot for the staff member, which may let a waiting room through
+        dispatcher = current_app.extensions.get('chat_dispatcher')
+        if dispatcher and was_active:
+            dispatcher.room_closed(room_id, staff_id)
         return True
     
     return False
 
+def invalidate_room_access(room_id, close_socket_room=False):
+    """Drop cached socket authorizations for a room after its participants or status change"""
+    room_access = current_app.extensions.get('chat_room_access')
+    if room_access:
+        room_access.invalidate_room(room_id)
+    
+    socketio = current_app.extensions.get('socketio')
+    if close_socket_room and socketio:
+        socketio.emit('room_closed', {'room_id': room_id}, room=str(room_id))
+        socketio.close_room(str(room_id))
+
 def get_unassigned_support_rooms():
     """Get support rooms that don't have staff assigned"""
     return ChatRoom.query.filter_by(
@@ -148,53 +190,15 @@ def get_chat_statistics(user_id=None, date_from=None, date_to=None):
     }
 
 def search_messages(query, room_id=None, user_id=None, limit=50):
-    """Search messages by content"""
-    search_query = ChatMessage.query.filter(
-        ChatMessage.message.contains(query),
-        ChatMessage.is_deleted == False
-    )
-    
-    if room_id:
-        search_query = search_query.filter_by(room_id=room_id)
-    
-    if user_id:
-        search_query = search_query.filter_by(sender_id=user_id)
-    
-    return search_query.order_by(
-        ChatMessage.created_at.desc()
-    ).limit(limit).all()
+    """
+    Full-text search over messages, best match first.
+    Each result has the compact message, its rank and an HTML highlight with <mark> tags.
+    """
+    return ChatSearchService.search(query, room_id=room_id, sender_id=user_id, limit=limit)
 
 def export_chat_history(room_id, format='json'):
-    """Export chat history for a room"""
-    chat_room = ChatRoom.query.get(room_id)
-    if not chat_room:
-        return None
-    
-    messages = ChatMessage.query.filter_by(
-        room_id=room_id,
-        is_deleted=False
-    ).order_by(ChatMessage.created_at.asc()).all()
-    
-    if format == 'json':
-        return {
-            'room': chat_room.to_dict(),
-            'messages': [msg.to_dict() for msg in messages],
-            'exported_at': datetime.utcnow().isoformat()
-        }
-    
-    elif format == 'txt':
-        lines = [
-            f"Chat History - {chat_room.name or 'Support Chat'}",
-            f"Exported: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}",
-            f"Room ID: {room_id}",
-            "-" * 50
-        ]
-        
-        for msg in messages:
-            timestamp = msg.created_at.strftime('%Y-%m-%d %H:%M:%S')
-            sender_name = msg.sender.full_name if msg.sender else 'System'
-            lines.append(f"[{timestamp}] {sender_name}: {msg.message}")
-        
-        return '\n'.join(lines)
-    
-    return None
\ No newline at end of file
+    """
+    Export chat history for a room as a generator of text chunks ('json', 'jsonl' or 'txt'),
+    suitable for a streamed Response. Returns None if the room does not exist.
+    """
+    return ChatExportService.export_room(room_id, format)
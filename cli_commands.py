@@ -3,6 +3,7 @@ Database initialization commands for GM Services Nigeria
 """
 import click
 from flask.cli import with_appcontext
+from datetime import datetime, timedelta
 from database import db
 from models.location import NigerianState, LocalGovernment
 from data.nigeria_data import NIGERIAN_STATES, LOCAL_GOVERNMENTS
@@ -102,6 +103,15 @@ def register_cli_commands(app):
     app.cli.add_command(create_sample_data)
     app.cli.add_command(check_inventory_alerts)
     app.cli.add_command(init_inventory_sample_data)
+    app.cli.add_command(rollup_usage_stats)
+    app.cli.add_command(backfill_usage_stats)
+    app.cli.add_command(maintain_activity_partitions)
+    app.cli.add_command(repair_chat_counters)
+    app.cli.add_command(export_chat_archive)
+    app.cli.add_command(archive_chat_rooms)
+    app.cli.add_command(rehydrate_chat_room)
+    app.cli.add_command(run_jobs)
+    app.cli.add_command(run_scheduler)
     
     # Import and register security commands
     from tasks.background_tasks import register_security_commands
@@ -140,4 +150,237 @@ def init_inventory_sample_data():
         init_inventory_data()
     except Exception as e:
         print(f"❌ Error initializing inventory data: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
+
+@click.command()
+@with_appcontext
+def rollup_usage_stats():
+    """Roll up new activity logs into usage statistics"""
+    try:
+        from tasks.usage_rollup import UsageRollupService
+        
+        print("Rolling up activity logs...")
+        result = UsageRollupService.run_incremental()
+        
+        print(f"✅ Usage rollup completed:")
+        print(f"   - From: {result['from'].strftime('%Y-%m-%d %H:%M')}")
+        print(f"   - Hourly rows written: {result['hours_written']}")
+        
+    except Exception as e:
+        print(f"❌ Error rolling up usage statistics: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--start-date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='First day to rebuild (YYYY-MM-DD)')
+@click.option('--end-date', required=True, type=click.DateTime(formats=['%Y-%m-%d']), help='Last day to rebuild (YYYY-MM-DD)')
+@with_appcontext
+def backfill_usage_stats(start_date, end_date):
+    """Rebuild usage statistics for a historical date range"""
+    try:
+        from tasks.usage_rollup import UsageRollupService
+        
+        print(f"Backfilling usage statistics {start_date.date()} - {end_date.date()}...")
+        result = UsageRollupService.backfill(start_date.date(), end_date.date())
+        
+        print(f"✅ Usage backfill completed:")
+        print(f"   - Days processed: {result['days']}")
+        print(f"   - Hourly rows written: {result['hours_written']}")
+        
+    except Exception as e:
+        print(f"❌ Error backfilling usage statistics: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--months-ahead', type=int, default=None, help='Number of future monthly partitions to create')
+@click.option('--retention-months', type=int, default=None, help='Archive partitions older than this many months')
+@click.option('--archive-dir', default=None, help='Directory for compressed partition archives')
+@click.option('--apply-retention', is_flag=True, help='Also archive and drop partitions older than the retention window')
+@with_appcontext
+def maintain_activity_partitions(months_ahead, retention_months, archive_dir, apply_retention):
+    """Create upcoming activity log partitions and, with --apply-retention, archive expired ones"""
+    try:
+        from tasks.activity_partitions import ActivityLogPartitionService
+        
+        print("Maintaining activity log partitions...")
+        result = ActivityLogPartitionService.ensure_partitions(months_ahead=months_ahead)
+        
+        if result.get('skipped'):
+            print(f"ℹ️ {result['skipped']}")
+            return
+        
+        print(f"✅ Partitions created: {len(result['partitions_created'])}")
+        for table_name in result['partitions_created']:
+            print(f"   - {table_name}")
+        
+        if not apply_retention:
+            return
+        
+        retention = ActivityLogPartitionService.apply_retention(
+            retention_months=retention_months,
+            archive_dir=archive_dir
+        )
+        
+        print(f"✅ Partitions archived: {len(retention['partitions_archived'])}")
+        for archived in retention['partitions_archived']:
+            print(f"   - {archived['partition']} -> {archived['archive_path']}")
+        
+    except Exception as e:
+        print(f"❌ Error maintaining activity log partitions: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--room-id', 'room_ids', type=int, multiple=True, help='Only repair these rooms (repeatable)')
+@with_appcontext
+def repair_chat_counters(room_ids):
+    """Recompute chat room last messages and unread counters from the messages table"""
+    try:
+        from chat.room_summary import ChatRoomSummaryService
+        
+        print("Recomputing chat room counters...")
+        result = ChatRoomSummaryService.recompute_room_counters(room_ids=list(room_ids) or None)
+        
+        print(f"✅ Chat rooms updated: {result['rooms_updated']}")
+        
+    except Exception as e:
+        print(f"❌ Error repairing chat counters: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--start-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='First closing day to include (YYYY-MM-DD, default: first day of last month)')
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Day after the last closing day (YYYY-MM-DD, default: first day of this month)')
+@click.option('--export-dir', default=None, help='Directory for the archive file')
+@with_appcontext
+def export_chat_archive(start_date, end_date, export_dir):
+    """Write closed chat rooms and their messages to a compressed JSON Lines archive"""
+    try:
+        from chat.export import ChatExportService
+        
+        this_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if end_date is None:
+            end_date = this_month
+        if start_date is None:
+            start_date = (end_date - timedelta(days=1)).replace(day=1)
+        
+        print(f"Exporting chat rooms closed {start_date.date()} - {end_date.date()} (exclusive)...")
+        result = ChatExportService.write_closed_rooms_archive(start_date, end_date, export_dir=export_dir)
+        
+        print(f"✅ Chat archive written: {result['archive_path']}")
+        print(f"   - Rooms: {result['rooms']}")
+        print(f"   - Messages: {result['messages']}")
+        
+    except Exception as e:
+        print(f"❌ Error exporting chat archive: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--older-than-days', type=int, default=None, help='Archive rooms closed more than this many days ago')
+@click.option('--archive-dir', default=None, help='Directory for the per-room archive files')
+@click.option('--limit', type=int, default=None, help='Archive at most this many rooms')
+@with_appcontext
+def archive_chat_rooms(older_than_days, archive_dir, limit):
+    """Move messages of long-closed chat rooms to compressed archive files"""
+    try:
+        from chat.archive import ChatArchiveService
+        
+        print("Archiving closed chat rooms...")
+        result = ChatArchiveService.archive_closed_rooms(
+            older_than_days=older_than_days,
+            archive_dir=archive_dir,
+            limit=limit
+        )
+        
+        print(f"✅ Chat rooms archived: {result['rooms_archived']}")
+        print(f"   - Messages moved: {result['messages_archived']}")
+        print(f"   - Archive directory: {result['archive_dir']}")
+        if result['failed_room_ids']:
+            print(f"❌ Failed rooms: {', '.join(str(room_id) for room_id in result['failed_room_ids'])}")
+        
+    except Exception as e:
+        print(f"❌ Error archiving chat rooms: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--room-id', required=True, type=int, help='Archived room to restore')
+@with_appcontext
+def rehydrate_chat_room(room_id):
+    """Load an archived chat room's messages back into the database"""
+    try:
+        from chat.archive import ChatArchiveService
+        
+        count = ChatArchiveService.rehydrate_room(room_id)
+        if count is None:
+            print(f"❌ Chat room {room_id} is not archived")
+            return
+        
+        print(f"✅ Chat room {room_id} rehydrated: {count} messages restored")
+        
+    except Exception as e:
+        print(f"❌ Error rehydrating chat room: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+@click.option('--max-jobs', type=int, default=None, help='Exit after running this many jobs')
+@click.option('--poll-interval', type=float, default=None, help='Seconds to wait between checks of an empty queue')
+@with_appcontext
+def run_jobs(burst, max_jobs, poll_interval):
+    """Run queued background jobs (stock imports, activity exports)"""
+    import signal
+    import threading
+    from tasks.jobs import BackgroundJobService
+    
+    stop_event = threading.Event()
+    
+    def stop(signum, frame):
+        # Finish the running job, then exit
+        print("⏹️ Stopping after the current job...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    try:
+        print("🚀 Job worker started")
+        jobs_run = BackgroundJobService.run_worker(
+            poll_interval=poll_interval,
+            max_jobs=max_jobs,
+            burst=burst,
+            stop_event=stop_event
+        )
+        print(f"✅ Job worker stopped: {jobs_run} jobs run")
+        
+    except Exception as e:
+        print(f"❌ Job worker error: {str(e)}")
+        raise e
+
+@click.command()
+@click.option('--once', is_flag=True, help='Run the scheduled tasks once and exit')
+@click.option('--interval', type=int, default=3600, help='Seconds between runs')
+@with_appcontext
+def run_scheduler(once, interval):
+    """Run the scheduled maintenance tasks (run exactly one scheduler per deployment)"""
+    import signal
+    import threading
+    from tasks.background_tasks import task_manager
+    
+    stop_event = threading.Event()
+    
+    def stop(signum, frame):
+        print("⏹️ Stopping scheduler...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    try:
+        print("🚀 Scheduler started")
+        while not stop_event.is_set():
+            task_manager.run_once()
+            if once:
+                break
+            stop_event.wait(interval)
+        print("✅ Scheduler stopped")
+        
+    except Exception as e:
+        print(f"❌ Scheduler error: {str(e)}")
+        raise e
@@ -59,9 +59,66 @@ class Config:
     WTF_CSRF_ENABLED = True
     WTF_CSRF_TIME_LIMIT = None
     
+    # Socket.IO fan-out between workers and hosts:
+    # redis://host:6379/0, or local://127.0.0.1:6380 for the bundled broker (single host)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'gm-services-socketio')
+    
+    # Request metrics (/metrics, Prometheus format)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ['true', 'on', '1']
+    METRICS_AUTH_TOKEN = os.environ.get('METRICS_AUTH_TOKEN')  # optional bearer token for scrapes
+    
     # Chat settings
     CHAT_ROOM_LIMIT = 50
     MESSAGE_HISTORY_LIMIT = 100
+    CHAT_PRESENCE_URL = os.environ.get('CHAT_PRESENCE_URL')  # redis:// to share presence between workers
+    CHAT_PRESENCE_TTL = int(os.environ.get('CHAT_PRESENCE_TTL', 60))  # seconds without a heartbeat before a socket is offline
+    CHAT_TYPING_INTERVAL = 1.0  # at most one typing state change per user and room per interval
+    CHAT_TYPING_REFRESH = 3.0  # re-announce "still typing" after this many seconds
+    CHAT_ROOM_ACCESS_CACHE_SIZE = 64  # authorized rooms remembered per socket connection
+    CHAT_EXPORT_DIR = os.environ.get('CHAT_EXPORT_DIR') or 'logs/chat_exports'
+    CHAT_ARCHIVE_DIR = os.environ.get('CHAT_ARCHIVE_DIR') or 'logs/chat_archive'
+    CHAT_DISPATCH_ENABLED = os.environ.get('CHAT_DISPATCH_ENABLED', 'true').lower() in ['true', 'on', '1']
+    CHAT_DISPATCH_MAX_ROOMS_PER_STAFF = int(os.environ.get('CHAT_DISPATCH_MAX_ROOMS_PER_STAFF', 5))
+    CHAT_DISPATCH_RESPONSE_WEIGHT = 120  # seconds of average response time that weigh as much as one active room
+    CHAT_DISPATCH_RESPONSE_WINDOW_MINUTES = 60
+    CHAT_DISPATCH_REFRESH_SECONDS = 60  # re-read staff loads from the database (other workers assign too)
+    CHAT_DISPATCH_BATCH_SIZE = 20
+    CHAT_ARCHIVE_AFTER_DAYS = int(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 90))  # closed rooms older than this move to cold storage
+    CHAT_ARCHIVE_BATCH_LIMIT = 500  # rooms archived per scheduled run
+    
+    # Background job settings (workers run with `flask run-jobs`)
+    BACKGROUND_JOBS_ENABLED = os.environ.get('BACKGROUND_JOBS_ENABLED', 'true').lower() in ['true', 'on', '1']  # queue stock uploads instead of running them in the request
+    BACKGROUND_JOB_DIR = os.environ.get('BACKGROUND_JOB_DIR') or 'logs/jobs'
+    BACKGROUND_JOB_POLL_INTERVAL = 2.0  # seconds an idle worker waits before checking the queue again
+    BACKGROUND_JOB_PROGRESS_INTERVAL = 2.0  # seconds between progress writes
+    BACKGROUND_JOB_STALE_AFTER = int(os.environ.get('BACKGROUND_JOB_STALE_AFTER') or 300)  # seconds without progress before a running job counts as abandoned
+    BACKGROUND_JOB_MAX_ATTEMPTS = 3
+    
+    # Inventory alert settings
+    INVENTORY_ALERT_HOOK_ENABLED = os.environ.get('INVENTORY_ALERT_HOOK_ENABLED', 'true').lower() in ['true', 'on', '1']  # reconcile alerts on every stock change; the scheduled scan stays as a safety net
+    
+    # Activity logging settings (write-behind buffer)
+    ACTIVITY_LOG_ASYNC = os.environ.get('ACTIVITY_LOG_ASYNC', 'true').lower() in ['true', 'on', '1']
+    ACTIVITY_LOG_FLUSH_SIZE = int(os.environ.get('ACTIVITY_LOG_FLUSH_SIZE') or 200)
+    ACTIVITY_LOG_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_LOG_FLUSH_INTERVAL') or 2.0)  # seconds
+    ACTIVITY_LOG_QUEUE_SIZE = int(os.environ.get('ACTIVITY_LOG_QUEUE_SIZE') or 10000)
+    ACTIVITY_LOG_PUT_TIMEOUT = 0.05  # seconds to wait on a full queue before writing inline
+    
+    # Page view logging policy (endpoint patterns use shell-style wildcards)
+    ACTIVITY_PAGE_VIEW_POLICY = {
+        'always_log': ['admin.*', 'staff.*', 'auth.*', '*loan*'],  # security-relevant, never sampled
+        'aggregate_only': ['index', 'about', 'contact', 'faq', 'privacy', 'terms', 'support'],
+        'sample_rates': {'gadgets.*': 0.1, 'services.*': 0.5},
+        'default_sample_rate': 1.0,
+        'dedup_window_seconds': 300,
+        'aggregate_flush_seconds': 60
+    }
+    
+    # Activity log partitioning and retention (PostgreSQL)
+    ACTIVITY_LOG_PARTITION_MONTHS_AHEAD = 3
+    ACTIVITY_LOG_RETENTION_MONTHS = int(os.environ.get('ACTIVITY_LOG_RETENTION_MONTHS') or 12)
+    ACTIVITY_LOG_ARCHIVE_DIR = os.environ.get('ACTIVITY_LOG_ARCHIVE_DIR') or 'logs/archive'
     
     # OAuth settings
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID')
@@ -0,0 +1,49 @@
+"""
+Gunicorn server hooks
+Loaded automatically from the working directory by gunicorn
+"""
+import glob
+import os
+import subprocess
+import sys
+from urllib.parse import urlparse
+
+_socketio_broker = None
+
+def on_starting(server):
+    """Clear metric files left by a previous run of the master process"""
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, '*.db')):
+            os.remove(path)
+
+def when_ready(server):
+    """Start the bundled Socket.IO broker when SOCKETIO_MESSAGE_QUEUE points at local://"""
+    global _socketio_broker
+    url = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+    if not url.startswith('local://'):
+        return
+    
+    parsed = urlparse(url)
+    _socketio_broker = subprocess.Popen([
+        sys.executable, '-m', 'chat.message_queue',
+        '--host', parsed.hostname or '127.0.0.1',
+        '--port', str(parsed.port or 6380)
+    ])
+    server.log.info(f"Started Socket.IO broker for {url} (pid {_socketio_broker.pid})")
+
+def on_exit(server):
+    """Stop the bundled Socket.IO broker"""
+    if _socketio_broker is not None:
+        _socketio_broker.terminate()
+        _socketio_broker.wait(timeout=10)
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges from the merged /metrics output"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        try:
+            from prometheus_client import multiprocess
+            multiprocess.mark_process_dead(worker.pid)
+        except ImportError:
+            pass
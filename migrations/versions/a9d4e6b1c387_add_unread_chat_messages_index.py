@@ -0,0 +1,33 @@
+"""Partial index on unread chat messages
+
+Revision ID: a9d4e6b1c387
+Revises: f3a7c2d9e514
+Create Date: 2026-10-17 13:47:31.205816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e6b1c387'
+down_revision = 'f3a7c2d9e514'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_messages'):
+        return
+
+    op.create_index('idx_chat_messages_unread', 'chat_messages', ['room_id', 'sender_id'], unique=False,
+                    postgresql_where=sa.text('is_read = false'), sqlite_where=sa.text('is_read = 0'))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_messages'):
+        return
+
+    op.drop_index('idx_chat_messages_unread', table_name='chat_messages')
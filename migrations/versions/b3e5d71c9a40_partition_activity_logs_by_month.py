@@ -0,0 +1,153 @@
+"""Partition activity_logs by month
+
+Revision ID: b3e5d71c9a40
+Revises: 626716d7a32b
+Create Date: 2026-10-17 09:12:44.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e5d71c9a40'
+down_revision = '626716d7a32b'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = (
+    'id, user_id, performed_by_id, activity_type, action, description, category, '
+    'ip_address, user_agent, request_method, request_url, additional_data, success, '
+    'error_message, timestamp, duration_ms'
+)
+
+INDEXES = (
+    ('idx_activity_user_timestamp', 'user_id, timestamp'),
+    ('idx_activity_type_timestamp', 'activity_type, timestamp'),
+    ('idx_activity_category_timestamp', 'category, timestamp'),
+    ('idx_activity_performed_by', 'performed_by_id, timestamp'),
+)
+
+MONTHS_AHEAD = 3
+
+
+def _add_months(month_start, months):
+    month_index = month_start.month - 1 + months
+    return month_start.replace(year=month_start.year + month_index // 12, month=month_index % 12 + 1, day=1)
+
+
+def _create_partitions(first_month, last_month):
+    month = first_month
+    while month <= last_month:
+        next_month = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS activity_logs_p{month:%Y_%m} PARTITION OF activity_logs "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month:%Y-%m-%d}')"
+        )
+        month = next_month
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        # Partitioning is PostgreSQL-only; other databases keep the plain table
+        return
+
+    has_existing_table = sa.inspect(bind).has_table('activity_logs')
+    current_month = datetime.utcnow().date().replace(day=1)
+    first_month = current_month
+
+    if has_existing_table:
+        oldest = bind.execute(sa.text('SELECT min(timestamp) FROM activity_logs')).scalar()
+        if oldest is not None:
+            first_month = min(first_month, oldest.date().replace(day=1))
+
+        # Free the names used by the new parent table
+        op.execute('ALTER TABLE activity_logs RENAME TO activity_logs_unpartitioned')
+        op.execute('ALTER TABLE activity_logs_unpartitioned DROP CONSTRAINT IF EXISTS activity_logs_pkey')
+        for index_name, _ in INDEXES:
+            op.execute(f'DROP INDEX IF EXISTS {index_name}')
+        op.execute('ALTER SEQUENCE IF EXISTS activity_logs_id_seq OWNED BY NONE')
+
+    op.execute('CREATE SEQUENCE IF NOT EXISTS activity_logs_id_seq')
+
+    # The partition key has to be part of the primary key
+    op.execute("""
+        CREATE TABLE activity_logs (
+            id INTEGER NOT NULL DEFAULT nextval('activity_logs_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            performed_by_id INTEGER REFERENCES users (id),
+            activity_type VARCHAR(50) NOT NULL,
+            action VARCHAR(100) NOT NULL,
+            description TEXT,
+            category VARCHAR(50) NOT NULL,
+            ip_address VARCHAR(45),
+            user_agent TEXT,
+            request_method VARCHAR(10),
+            request_url TEXT,
+            additional_data JSON,
+            success BOOLEAN,
+            error_message TEXT,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            duration_ms INTEGER,
+            CONSTRAINT activity_logs_pkey PRIMARY KEY (id, timestamp)
+        ) PARTITION BY RANGE (timestamp)
+    """)
+
+    for index_name, columns in INDEXES:
+        op.execute(f'CREATE INDEX {index_name} ON activity_logs ({columns})')
+
+    _create_partitions(first_month, _add_months(current_month, MONTHS_AHEAD))
+
+    # Catch-all so an insert never fails because maintenance fell behind
+    op.execute('CREATE TABLE activity_logs_default PARTITION OF activity_logs DEFAULT')
+
+    if has_existing_table:
+        op.execute(f'INSERT INTO activity_logs ({COLUMNS}) SELECT {COLUMNS} FROM activity_logs_unpartitioned')
+        op.execute('DROP TABLE activity_logs_unpartitioned')
+        op.execute("SELECT setval('activity_logs_id_seq', COALESCE((SELECT max(id) FROM activity_logs), 0) + 1, false)")
+
+    op.execute('ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute('ALTER TABLE activity_logs RENAME TO activity_logs_partitioned')
+    op.execute('ALTER TABLE activity_logs_partitioned DROP CONSTRAINT IF EXISTS activity_logs_pkey')
+    for index_name, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {index_name}')
+    op.execute('ALTER SEQUENCE activity_logs_id_seq OWNED BY NONE')
+
+    op.execute("""
+        CREATE TABLE activity_logs (
+            id INTEGER NOT NULL DEFAULT nextval('activity_logs_id_seq'),
+            user_id INTEGER REFERENCES users (id),
+            performed_by_id INTEGER REFERENCES users (id),
+            activity_type VARCHAR(50) NOT NULL,
+            action VARCHAR(100) NOT NULL,
+            description TEXT,
+            category VARCHAR(50) NOT NULL,
+            ip_address VARCHAR(45),
+            user_agent TEXT,
+            request_method VARCHAR(10),
+            request_url TEXT,
+            additional_data JSON,
+            success BOOLEAN,
+            error_message TEXT,
+            timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            duration_ms INTEGER,
+            CONSTRAINT activity_logs_pkey PRIMARY KEY (id)
+        )
+    """)
+
+    for index_name, columns in INDEXES:
+        op.execute(f'CREATE INDEX {index_name} ON activity_logs ({columns})')
+
+    op.execute(f'INSERT INTO activity_logs ({COLUMNS}) SELECT {COLUMNS} FROM activity_logs_partitioned')
+    op.execute('DROP TABLE activity_logs_partitioned')
+    op.execute('ALTER SEQUENCE activity_logs_id_seq OWNED BY activity_logs.id')
@@ -0,0 +1,37 @@
+"""Add archive stub columns to chat_rooms
+
+Revision ID: b6d2f8a4c913
+Revises: d7e1a3f5b920
+Create Date: 2026-10-17 16:05:41.220318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2f8a4c913'
+down_revision = 'd7e1a3f5b920'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    op.add_column('chat_rooms', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.add_column('chat_rooms', sa.Column('archive_path', sa.String(length=500), nullable=True))
+    op.add_column('chat_rooms', sa.Column('archived_message_count', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    with op.batch_alter_table('chat_rooms') as batch_op:
+        batch_op.drop_column('archived_message_count')
+        batch_op.drop_column('archive_path')
+        batch_op.drop_column('archived_at')
@@ -0,0 +1,32 @@
+"""Add chat_messages (room_id, id) index for history paging
+
+Revision ID: c5b8f0e2d613
+Revises: a9d4e6b1c387
+Create Date: 2026-10-17 14:20:57.613094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5b8f0e2d613'
+down_revision = 'a9d4e6b1c387'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_messages'):
+        return
+
+    op.create_index('idx_chat_messages_room_id_id', 'chat_messages', ['room_id', 'id'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_messages'):
+        return
+
+    op.drop_index('idx_chat_messages_room_id_id', table_name='chat_messages')
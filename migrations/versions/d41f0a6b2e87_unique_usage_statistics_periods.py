@@ -0,0 +1,71 @@
+"""Unique usage statistics row per date and hour
+
+Revision ID: d41f0a6b2e87
+Revises: b3e5d71c9a40
+Create Date: 2026-10-17 10:03:19.554170
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f0a6b2e87'
+down_revision = 'b3e5d71c9a40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('usage_statistics'):
+        return
+    if bind.dialect.name not in ('postgresql', 'sqlite'):
+        # No partial indexes; UsageStatistics.increment locks and updates rows instead
+        return
+
+    # Merge duplicate daily rows left by the old read-modify-write counters
+    # into the oldest row for each date before the unique index goes on.
+    op.execute("""
+        UPDATE usage_statistics SET
+            new_registrations = (
+                SELECT SUM(COALESCE(s.new_registrations, 0)) FROM usage_statistics s
+                WHERE s.hour IS NULL AND s.date = usage_statistics.date
+            ),
+            total_logins = (
+                SELECT SUM(COALESCE(s.total_logins, 0)) FROM usage_statistics s
+                WHERE s.hour IS NULL AND s.date = usage_statistics.date
+            )
+        WHERE hour IS NULL AND id IN (
+            SELECT MIN(id) FROM usage_statistics WHERE hour IS NULL
+            GROUP BY date HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM usage_statistics
+        WHERE hour IS NULL AND id NOT IN (
+            SELECT MIN(id) FROM usage_statistics WHERE hour IS NULL GROUP BY date
+        )
+    """)
+    op.execute("""
+        DELETE FROM usage_statistics
+        WHERE hour IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM usage_statistics WHERE hour IS NOT NULL GROUP BY date, hour
+        )
+    """)
+
+    op.create_index('uq_usage_daily', 'usage_statistics', ['date'], unique=True,
+                    postgresql_where=sa.text('hour IS NULL'), sqlite_where=sa.text('hour IS NULL'))
+    op.create_index('uq_usage_hourly', 'usage_statistics', ['date', 'hour'], unique=True,
+                    postgresql_where=sa.text('hour IS NOT NULL'), sqlite_where=sa.text('hour IS NOT NULL'))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('usage_statistics'):
+        return
+    if bind.dialect.name not in ('postgresql', 'sqlite'):
+        return
+
+    op.drop_index('uq_usage_hourly', table_name='usage_statistics')
+    op.drop_index('uq_usage_daily', table_name='usage_statistics')
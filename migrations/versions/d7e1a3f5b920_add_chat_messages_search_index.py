@@ -0,0 +1,34 @@
+"""Add full-text search index on chat_messages
+
+Revision ID: d7e1a3f5b920
+Revises: c5b8f0e2d613
+Create Date: 2026-10-17 14:52:16.370458
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e1a3f5b920'
+down_revision = 'c5b8f0e2d613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql' or not sa.inspect(bind).has_table('chat_messages'):
+        return
+
+    # Expression must match chat/search.py so the planner can use the index
+    op.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_search ON chat_messages "
+               "USING gin (to_tsvector('english', message))")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+
+    op.execute("DROP INDEX IF EXISTS idx_chat_messages_search")
@@ -0,0 +1,41 @@
+"""Unique active low stock alert per inventory item
+
+Revision ID: e5b9c3d7a124
+Revises: c4e8a1b7d352
+Create Date: 2026-10-17 19:26:40.871352
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9c3d7a124'
+down_revision = 'c4e8a1b7d352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('low_stock_alerts'):
+        return
+
+    # Keep the newest active alert of each item before the unique index goes on
+    op.execute("""
+        UPDATE low_stock_alerts SET status = 'resolved', resolved_at = CURRENT_TIMESTAMP
+        WHERE status = 'active' AND id NOT IN (
+            SELECT MAX(id) FROM low_stock_alerts WHERE status = 'active' GROUP BY inventory_item_id
+        )
+    """)
+
+    op.create_index('uq_low_stock_alerts_active_item', 'low_stock_alerts', ['inventory_item_id'], unique=True,
+                    postgresql_where=sa.text("status = 'active'"), sqlite_where=sa.text("status = 'active'"))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('low_stock_alerts'):
+        return
+
+    op.drop_index('uq_low_stock_alerts_active_item', table_name='low_stock_alerts')
@@ -0,0 +1,24 @@
+"""Add activity_logs (timestamp, id) index for keyset pagination
+
+Revision ID: e8c2a9174f13
+Revises: d41f0a6b2e87
+Create Date: 2026-10-17 11:26:50.731402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8c2a9174f13'
+down_revision = 'd41f0a6b2e87'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('idx_activity_timestamp_id', 'activity_logs', ['timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_activity_timestamp_id', table_name='activity_logs')
@@ -0,0 +1,33 @@
+"""Add rehydrated_at to chat_rooms
+
+Revision ID: f2a6d8c1e359
+Revises: e5b9c3d7a124
+Create Date: 2026-10-17 21:14:52.603118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a6d8c1e359'
+down_revision = 'e5b9c3d7a124'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    op.add_column('chat_rooms', sa.Column('rehydrated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    with op.batch_alter_table('chat_rooms') as batch_op:
+        batch_op.drop_column('rehydrated_at')
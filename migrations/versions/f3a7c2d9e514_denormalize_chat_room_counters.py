@@ -0,0 +1,70 @@
+"""Denormalized last message and unread counters on chat_rooms
+
+Revision ID: f3a7c2d9e514
+Revises: e8c2a9174f13
+Create Date: 2026-10-17 13:12:04.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3a7c2d9e514'
+down_revision = 'e8c2a9174f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    op.add_column('chat_rooms', sa.Column('last_message_id', sa.Integer(), nullable=True))
+    op.add_column('chat_rooms', sa.Column('last_message_preview', sa.String(length=200), nullable=True))
+    op.add_column('chat_rooms', sa.Column('customer_unread_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('chat_rooms', sa.Column('staff_unread_count', sa.Integer(), nullable=False, server_default='0'))
+
+    if bind.dialect.name == 'postgresql':
+        op.create_foreign_key('fk_chat_rooms_last_message_id', 'chat_rooms', 'chat_messages',
+                              ['last_message_id'], ['id'], ondelete='SET NULL')
+
+    # Backfill from the existing messages (same rules as the repair-chat-counters command)
+    op.execute("""
+        UPDATE chat_rooms SET
+            last_message_id = (
+                SELECT m.id FROM chat_messages m WHERE m.room_id = chat_rooms.id
+                ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+            ),
+            customer_unread_count = (
+                SELECT COUNT(*) FROM chat_messages m
+                WHERE m.room_id = chat_rooms.id AND m.is_read = false AND m.is_deleted = false
+                AND (m.sender_id <> chat_rooms.customer_id OR chat_rooms.customer_id IS NULL)
+            ),
+            staff_unread_count = (
+                SELECT COUNT(*) FROM chat_messages m
+                WHERE m.room_id = chat_rooms.id AND m.is_read = false AND m.is_deleted = false
+                AND (m.sender_id <> chat_rooms.staff_id OR chat_rooms.staff_id IS NULL)
+            )
+    """)
+    op.execute("""
+        UPDATE chat_rooms SET last_message_preview = (
+            SELECT SUBSTR(m.message, 1, 200) FROM chat_messages m WHERE m.id = chat_rooms.last_message_id
+        )
+    """)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('chat_rooms'):
+        return
+
+    if bind.dialect.name == 'postgresql':
+        op.drop_constraint('fk_chat_rooms_last_message_id', 'chat_rooms', type_='foreignkey')
+
+    with op.batch_alter_table('chat_rooms') as batch_op:
+        batch_op.drop_column('staff_unread_count')
+        batch_op.drop_column('customer_unread_count')
+        batch_op.drop_column('last_message_preview')
+        batch_op.drop_column('last_message_id')
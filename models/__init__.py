@@ -19,7 +19,7 @@ from .creative_services import CreativeServiceCategory, CreativeDesigner, Portfo
 from .payment import BankAccount, BankTransferPayment, PaymentAnalytics
 from .service_request import ServiceRequestType, ServiceRequest, ServiceRequestInteraction, ServiceRequestTemplate, ServiceRequestKnowledgeBase
 from .inventory import InventoryLocation, StaffLocationAssignment, InventoryItem, StockMovement, LowStockAlert, InventoryAudit, InventoryAuditItem
-from .admin import AdminRole, AdminUser, AdminActivityLog, DashboardWidget, BusinessMetric, SystemAlert, SystemConfiguration, DataExport, AuditTrail, SystemBackup
+from .admin import AdminRole, AdminUser, AdminActivityLog, DashboardWidget, BusinessMetric, SystemAlert, SystemConfiguration, DataExport, AuditTrail, SystemBackup, BackgroundJob
 
 __all__ = [
     'User',
@@ -144,5 +144,6 @@ __all__ = [
     'SystemConfiguration',
     'DataExport',
     'AuditTrail',
-    'SystemBackup'
+    'SystemBackup',
+    'BackgroundJob'
 ]
\ No newline at end of file
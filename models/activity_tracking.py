@@ -4,7 +4,7 @@ Tracks user registration, staff onboarding, user activities, and system usage
 """
 from database import db
 from datetime import datetime
-from sqlalchemy import Index
+from sqlalchemy import Index, func, text, select, insert, update
 
 class ActivityLog(db.Model):
     """
@@ -43,12 +43,15 @@ class ActivityLog(db.Model):
     user = db.relationship('User', foreign_keys=[user_id], backref='activity_logs')
     performed_by = db.relationship('User', foreign_keys=[performed_by_id], backref='performed_activities')
     
-    # Indexes for performance
+    # Indexes for performance. On PostgreSQL the table is range partitioned by
+    # month on timestamp (see migration b3e5d71c9a40), so queries should bound
+    # timestamp with plain comparisons to get partition pruning.
     __table_args__ = (
         Index('idx_activity_user_timestamp', 'user_id', 'timestamp'),
         Index('idx_activity_type_timestamp', 'activity_type', 'timestamp'),
         Index('idx_activity_category_timestamp', 'category', 'timestamp'),
         Index('idx_activity_performed_by', 'performed_by_id', 'timestamp'),
+        Index('idx_activity_timestamp_id', 'timestamp', 'id'),  # keyset pagination
     )
     
     def __repr__(self):
@@ -186,15 +189,92 @@ class UsageStatistics(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Indexes
+    # Indexes. The partial unique indexes give one daily row and one row per
+    # hour for each date, and are the conflict targets for increment_statement.
+    # Databases without partial indexes skip them (a plain unique date index
+    # would reject hourly rows).
     __table_args__ = (
         Index('idx_usage_date_hour', 'date', 'hour'),
         Index('idx_usage_date', 'date'),
+        Index('uq_usage_daily', 'date', unique=True,
+              postgresql_where=text('hour IS NULL'), sqlite_where=text('hour IS NULL')
+              ).ddl_if(dialect=('postgresql', 'sqlite')),
+        Index('uq_usage_hourly', 'date', 'hour', unique=True,
+              postgresql_where=text('hour IS NOT NULL'), sqlite_where=text('hour IS NOT NULL')
+              ).ddl_if(dialect=('postgresql', 'sqlite')),
     )
     
     def __repr__(self):
         period = f"{self.date} {self.hour}:00" if self.hour is not None else str(self.date)
         return f'<UsageStatistics {period}>'
+    
+    @classmethod
+    def increment(cls, executor, day, increments, hour=None):
+        """
+        Add to counter columns of one row through a Session or Connection.
+        Uses a single upsert where the dialect supports partial unique indexes; elsewhere
+        (MySQL) the row is locked with SELECT ... FOR UPDATE and updated, or inserted.
+        """
+        dialect_name = executor.get_bind().dialect.name if hasattr(executor, 'get_bind') else executor.dialect.name
+        if dialect_name in ('postgresql', 'sqlite'):
+            executor.execute(cls.increment_statement(dialect_name, day, increments, hour=hour))
+            return
+        
+        table = cls.__table__
+        now = datetime.utcnow()
+        row_filter = [table.c.date == day, table.c.hour.is_(None) if hour is None else table.c.hour == hour]
+        row_id = executor.execute(
+            select(table.c.id).where(*row_filter).order_by(table.c.id).limit(1).with_for_update()
+        ).scalar()
+        
+        if row_id is None:
+            executor.execute(insert(table).values(date=day, hour=hour, created_at=now, updated_at=now, **increments))
+        else:
+            executor.execute(update(table).where(table.c.id == row_id).values(
+                updated_at=now,
+                **{metric: func.coalesce(table.c[metric], 0) + amount for metric, amount in increments.items()}
+            ))
+    
+    @classmethod
+    def increment_statement(cls, dialect_name, day, increments, hour=None):
+        """
+        Build a single INSERT ... ON CONFLICT DO UPDATE that adds to counter columns
+        (PostgreSQL and SQLite; use increment for other databases)
+        """
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            raise NotImplementedError(f'Usage counter upsert is not supported on {dialect_name}')
+        
+        table = cls.__table__
+        now = datetime.utcnow()
+        statement = insert(table).values(date=day, hour=hour, created_at=now, updated_at=now, **increments)
+        
+        set_ = {
+            metric: func.coalesce(table.c[metric], 0) + statement.excluded[metric]
+            for metric in increments
+        }
+        set_['updated_at'] = now
+        
+        if hour is None:
+            return statement.on_conflict_do_update(
+                index_elements=['date'], index_where=table.c.hour.is_(None), set_=set_
+            )
+        return statement.on_conflict_do_update(
+            index_elements=['date', 'hour'], index_where=table.c.hour.isnot(None), set_=set_
+        )
+    
+    @property
+    def peak_activity_hour(self):
+        """Busiest hour of the day, recorded by the usage rollup"""
+        return (self.metrics_data or {}).get('peak_activity_hour')
+    
+    @property
+    def top_users(self):
+        """Most active user ids and their activity counts, recorded by the usage rollup"""
+        return {int(user_id): count for user_id, count in (self.metrics_data or {}).get('top_users', {}).items()}
 
 class LoginSession(db.Model):
     """
@@ -551,6 +551,88 @@ class SystemBackup(db.Model):
             return date.today() > self.retention_until
         return False
 
+class BackgroundJob(db.Model):
+    """Queued long-running work (imports, exports) processed by the job worker"""
+    
+    __tablename__ = 'background_jobs'
+    __table_args__ = (
+        db.Index('ix_background_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    
+    # Job Details
+    job_type = db.Column(db.String(50), nullable=False)  # stock_import, activity_export
+    requested_by_id = db.Column(db.Integer, db.ForeignKey('users.id'))
+    parameters = db.Column(db.JSON)  # Handler arguments
+    
+    # Processing
+    status = db.Column(db.String(30), default='pending', nullable=False)  # pending, processing, completed, failed
+    total_records = db.Column(db.Integer)
+    processed_records = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # Not picked up before this time
+    
+    # Worker
+    locked_by = db.Column(db.String(100))  # Worker currently running the job
+    heartbeat_at = db.Column(db.DateTime)  # Refreshed while the job makes progress
+    
+    # Outcome
+    result = db.Column(db.JSON)
+    file_path = db.Column(db.String(500))
+    file_size = db.Column(db.BigInteger)  # Size in bytes
+    error_message = db.Column(db.Text)
+    
+    # Timestamps
+    started_at = db.Column(db.DateTime)
+    completed_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    requested_by = db.relationship('User', backref='background_jobs')
+    
+    def __init__(self, **kwargs):
+        super(BackgroundJob, self).__init__(**kwargs)
+        if not self.job_id:
+            self.job_id = self.generate_job_id()
+    
+    @staticmethod
+    def generate_job_id():
+        """Generate unique job ID"""
+        prefix = "JOB"
+        timestamp = datetime.now().strftime("%y%m%d%H%M")
+        random_part = str(uuid.uuid4().hex)[:6].upper()
+        return f"{prefix}{timestamp}{random_part}"
+    
+    def __repr__(self):
+        return f'<BackgroundJob {self.job_id} - {self.job_type} ({self.status})>'
+    
+    @property
+    def progress_percent(self):
+        """Share of records processed, or None while the total is unknown"""
+        if not self.total_records:
+            return 100 if self.status == 'completed' else None
+        return min(100, int((self.processed_records or 0) * 100 / self.total_records))
+    
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'job_type': self.job_type,
+            'status': self.status,
+            'total_records': self.total_records,
+            'processed_records': self.processed_records,
+            'progress_percent': self.progress_percent,
+            'attempts': self.attempts,
+            'result': self.result,
+            'has_file': bool(self.file_path),
+            'error_message': self.error_message,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
 
 class AdminNotification(db.Model):
     """Admin notifications for service requests and system events"""
@@ -4,6 +4,8 @@ Handles real-time chat functionality between customers and staff
 """
 from database import db
 from datetime import datetime
+from collections import Counter
+from sqlalchemy import case, select, update
 
 class ChatRoom(db.Model):
     """Chat room model for organizing conversations"""
@@ -37,9 +39,24 @@ class ChatRoom(db.Model):
     last_activity = db.Column(db.DateTime, default=datetime.utcnow)
     closed_at = db.Column(db.DateTime)
     
+    # Denormalized listing data, kept in step with chat_messages on insert, read and delete
+    last_message_id = db.Column(db.Integer, db.ForeignKey('chat_messages.id', use_alter=True,
+                                                          name='fk_chat_rooms_last_message_id',
+                                                          ondelete='SET NULL'))
+    last_message_preview = db.Column(db.String(200))
+    customer_unread_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    staff_unread_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    
+    # Cold storage: an 'archived' room is a stub whose messages live in archive_path
+    archived_at = db.Column(db.DateTime)
+    archive_path = db.Column(db.String(500))
+    archived_message_count = db.Column(db.Integer)
+    rehydrated_at = db.Column(db.DateTime)  # restored rooms wait another CHAT_ARCHIVE_AFTER_DAYS before re-archiving
+    
     # Relationships
     messages = db.relationship('ChatMessage', backref='room', lazy='dynamic', 
-                             cascade='all, delete-orphan')
+                             cascade='all, delete-orphan', foreign_keys='ChatMessage.room_id')
+    last_message = db.relationship('ChatMessage', foreign_keys=[last_message_id], post_update=True)
     customer = db.relationship('User', foreign_keys=[customer_id], backref='customer_chat_rooms')
     staff_member = db.relationship('User', foreign_keys=[staff_id], backref='staff_chat_rooms')
     service_request = db.relationship('ServiceRequest', backref='chat_room')
@@ -49,26 +66,139 @@ class ChatRoom(db.Model):
     
     def get_last_message(self):
         """Get the last message in the room"""
+        if self.last_message_id:
+            return self.last_message
         return self.messages.order_by(ChatMessage.created_at.desc()).first()
     
     def get_unread_count(self, user_id):
         """Get unread message count for a specific user"""
+        if user_id == self.customer_id:
+            return self.customer_unread_count or 0
+        if user_id == self.staff_id:
+            return self.staff_unread_count or 0
+        
+        # Not a participant (e.g. an admin looking in): count directly
         return self.messages.filter(
             ChatMessage.sender_id != user_id,
-            ChatMessage.is_read == False
+            ChatMessage.is_read == False,
+            ChatMessage.is_deleted == False
         ).count()
     
+    def record_new_message(self, message):
+        """
+        Point the room at a newly added message and bump the other participants' unread counters.
+        The message must be flushed; the caller commits.
+        """
+        self.last_message_id = message.id
+        self.last_message_preview = message.message[:200]
+        self.last_activity = datetime.utcnow()
+        
+        # Counters are incremented in SQL so concurrent senders do not lose updates
+        if message.sender_id != self.customer_id:
+            self.customer_unread_count = ChatRoom.customer_unread_count + 1
+        if message.sender_id != self.staff_id:
+            self.staff_unread_count = ChatRoom.staff_unread_count + 1
+    
+    @staticmethod
+    def record_message(room_id, message):
+        """
+        record_new_message as a single UPDATE, for callers that have not loaded the room.
+        Returns the room's (customer_id, staff_id), or None if the room does not exist.
+        """
+        statement = update(ChatRoom).where(ChatRoom.id == room_id).values(
+            last_message_id=message.id,
+            last_message_preview=message.message[:200],
+            last_activity=datetime.utcnow(),
+            customer_unread_count=ChatRoom.customer_unread_count + case(
+                (ChatRoom.customer_id.is_distinct_from(message.sender_id), 1), else_=0
+            ),
+            staff_unread_count=ChatRoom.staff_unread_count + case(
+                (ChatRoom.staff_id.is_distinct_from(message.sender_id), 1), else_=0
+            )
+        ).execution_options(synchronize_session=False)
+        
+        if db.engine.dialect.update_returning:
+            return db.session.execute(statement.returning(ChatRoom.customer_id, ChatRoom.staff_id)).first()
+        
+        db.session.execute(statement)
+        return db.session.execute(
+            select(ChatRoom.customer_id, ChatRoom.staff_id).where(ChatRoom.id == room_id)
+        ).first()
+    
+    def release_unread(self, sender_ids):
+        """Decrement unread counters for messages (by sender) that stopped being unread"""
+        customer_delta = sum(1 for sender_id in sender_ids if sender_id != self.customer_id)
+        staff_delta = sum(1 for sender_id in sender_ids if sender_id != self.staff_id)
+        
+        if customer_delta:
+            self.customer_unread_count = case(
+                (ChatRoom.customer_unread_count > customer_delta, ChatRoom.customer_unread_count - customer_delta),
+                else_=0
+            )
+        if staff_delta:
+            self.staff_unread_count = case(
+                (ChatRoom.staff_unread_count > staff_delta, ChatRoom.staff_unread_count - staff_delta),
+                else_=0
+            )
+    
+    @staticmethod
+    def release_unread_counts(room_id, sender_ids):
+        """release_unread as a single UPDATE, for callers that have not loaded the room"""
+        sender_counts = Counter(sender_ids)
+        if not sender_counts:
+            return
+        
+        def released(counter_column, participant_column):
+            delta = sum(
+                case((participant_column.is_distinct_from(sender_id), count), else_=0)
+                for sender_id, count in sender_counts.items()
+            )
+            return case((counter_column > delta, counter_column - delta), else_=0)
+        
+        db.session.execute(update(ChatRoom).where(ChatRoom.id == room_id).values(
+            customer_unread_count=released(ChatRoom.customer_unread_count, ChatRoom.customer_id),
+            staff_unread_count=released(ChatRoom.staff_unread_count, ChatRoom.staff_id)
+        ).execution_options(synchronize_session=False))
+    
     def mark_messages_as_read(self, user_id):
-        """Mark all messages as read for a specific user"""
-        unread_messages = self.messages.filter(
+        """
+        Mark all messages as read for a specific user in one UPDATE.
+        Returns the ids of the messages that were marked.
+        """
+        return ChatRoom.mark_room_read(self.id, user_id)
+    
+    @staticmethod
+    def mark_room_read(room_id, user_id):
+        """mark_messages_as_read by room id, without loading the room"""
+        unread = (
+            ChatMessage.room_id == room_id,
             ChatMessage.sender_id != user_id,
             ChatMessage.is_read == False
-        ).all()
+        )
+        
+        if db.engine.dialect.update_returning:
+            statement = update(ChatMessage).where(*unread).values(
+                is_read=True,
+                read_at=datetime.utcnow()
+            ).returning(ChatMessage.id, ChatMessage.sender_id, ChatMessage.is_deleted)
+            rows = db.session.execute(statement.execution_options(synchronize_session=False)).all()
+        else:
+            rows = db.session.query(ChatMessage.id, ChatMessage.sender_id, ChatMessage.is_deleted).filter(
+                *unread
+            ).with_for_update().all()
+            if rows:
+                db.session.execute(
+                    update(ChatMessage).where(ChatMessage.id.in_([row.id for row in rows])).values(
+                        is_read=True,
+                        read_at=datetime.utcnow()
+                    ).execution_options(synchronize_session=False)
+                )
         
-        for message in unread_messages:
-            message.is_read = True
+        # Deleted messages were already taken off the counters
+        ChatRoom.release_unread_counts(room_id, [row.sender_id for row in rows if not row.is_deleted])
         
         db.session.commit()
+        return [row.id for row in rows]
     
     def get_participants(self):
         """Get list of participants"""
@@ -134,6 +264,17 @@ class ChatMessage(db.Model):
     # Relationships
     reply_to = db.relationship('ChatMessage', remote_side=[id], backref='replies')
     
+    # Only unread rows are indexed, so marking a room read stays cheap however long its history
+    __table_args__ = (
+        db.Index('idx_chat_messages_unread', 'room_id', 'sender_id',
+                 postgresql_where=db.text('is_read = false'), sqlite_where=db.text('is_read = 0')),
+        # History pages walk a room backwards by id
+        db.Index('idx_chat_messages_room_id_id', 'room_id', 'id'),
+        # Full-text search (chat/search.py); PostgreSQL only
+        db.Index('idx_chat_messages_search', db.text("to_tsvector('english', message)"),
+                 postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
     def __repr__(self):
         return f'<ChatMessage {self.id}: {self.message[:50]}...>'
     
@@ -142,6 +283,8 @@ class ChatMessage(db.Model):
         if not self.is_read:
             self.is_read = True
             self.read_at = datetime.utcnow()
+            if not self.is_deleted:
+                self.room.release_unread([self.sender_id])
             db.session.commit()
     
     def edit_message(self, new_message):
@@ -149,13 +292,20 @@ class ChatMessage(db.Model):
         self.message = new_message
         self.is_edited = True
         self.updated_at = datetime.utcnow()
+        if self.room.last_message_id == self.id:
+            self.room.last_message_preview = new_message[:200]
         db.session.commit()
     
     def delete_message(self):
         """Soft delete message"""
+        if not self.is_read and not self.is_deleted:
+            self.room.release_unread([self.sender_id])
+        
         self.is_deleted = True
         self.message = "[Message deleted]"
         self.updated_at = datetime.utcnow()
+        if self.room.last_message_id == self.id:
+            self.room.last_message_preview = self.message
         db.session.commit()
     
     def get_time_ago(self):
@@ -197,4 +347,29 @@ class ChatMessage(db.Model):
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'read_at': self.read_at.isoformat() if self.read_at else None,
             'time_ago': self.get_time_ago()
-        }
\ No newline at end of file
+        }
+    
+    def to_compact_dict(self):
+        """Smaller message payload for history pages (load sender and reply_to eagerly)"""
+        data = {
+            'id': self.id,
+            'sender_id': self.sender_id,
+            'sender_name': self.sender.full_name if self.sender else None,
+            'sender_role': self.sender.role if self.sender else None,
+            'message': self.message,
+            'message_type': self.message_type,
+            'is_read': self.is_read,
+            'is_edited': self.is_edited,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+        
+        # Optional fields only when set
+        if self.file_url:
+            data.update(file_url=self.file_url, file_name=self.file_name,
+                        file_size=self.file_size, file_type=self.file_type)
+        if self.reply_to_message_id:
+            data['reply_to_message_id'] = self.reply_to_message_id
+            if self.reply_to and not self.reply_to.is_deleted:
+                data['reply_to_message'] = self.reply_to.message[:100]
+        
+        return data
\ No newline at end of file
@@ -220,6 +220,12 @@ class LowStockAlert(db.Model):
     
     __tablename__ = 'low_stock_alerts'
     
+    # At most one active alert per item; the conflict target for InventoryAlertService.reconcile_alerts
+    __table_args__ = (
+        db.Index('uq_low_stock_alerts_active_item', 'inventory_item_id', unique=True,
+                 postgresql_where=db.text("status = 'active'"), sqlite_where=db.text("status = 'active'")),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     
     # References
@@ -438,6 +438,13 @@ function initializeNotifications() {
     socket.on('status_update', function(data) {
         updateItemStatus(data);
     });
+    
+    // Keep chat presence alive while the page is open (server TTL is 60s by default)
+    setInterval(function() {
+        if (socket.connected) {
+            socket.emit('presence_heartbeat');
+        }
+    }, 20000);
 }
 
 function showNotification(data) {
@@ -0,0 +1,207 @@
+"""
+Activity Log Partition Maintenance
+Creates upcoming monthly partitions of activity_logs and archives expired ones
+"""
+from database import db
+from datetime import datetime, date
+from flask import current_app
+from sqlalchemy import text
+import gzip
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = 'activity_logs'
+DEFAULT_PARTITION = 'activity_logs_default'
+PARTITION_PATTERN = re.compile(r'^activity_logs_p(\d{4})_(\d{2})$')
+
+class ActivityLogPartitionService:
+    """Service for managing the monthly partitions of activity_logs"""
+    
+    @staticmethod
+    def _add_months(month_start, months):
+        """Shift a first-of-month date by a number of months"""
+        month_index = month_start.month - 1 + months
+        return month_start.replace(year=month_start.year + month_index // 12, month=month_index % 12 + 1, day=1)
+    
+    @staticmethod
+    def partition_name(month_start):
+        """Name of the partition holding the given month"""
+        return f'{PARENT_TABLE}_p{month_start:%Y_%m}'
+    
+    @staticmethod
+    def is_partitioned():
+        """Check whether activity_logs is a partitioned table on this database"""
+        if db.engine.dialect.name != 'postgresql':
+            return False
+        
+        return db.session.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :name)"
+        ), {'name': PARENT_TABLE}).scalar()
+    
+    @staticmethod
+    def list_partitions():
+        """Return (month_start, table_name) for every attached monthly partition"""
+        rows = db.session.execute(text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :name"
+        ), {'name': PARENT_TABLE}).scalars().all()
+        
+        partitions = []
+        for table_name in rows:
+            match = PARTITION_PATTERN.match(table_name)
+            if match:
+                partitions.append((date(int(match.group(1)), int(match.group(2)), 1), table_name))
+        
+        return sorted(partitions)
+    
+    @staticmethod
+    def _default_partition_months():
+        """First-of-month dates of the rows that fell into the default partition"""
+        months = db.session.execute(text(
+            f"SELECT DISTINCT date_trunc('month', timestamp)::date FROM {DEFAULT_PARTITION}"
+        )).scalars().all()
+        return set(months)
+    
+    @staticmethod
+    def ensure_partitions(months_ahead=None):
+        """
+        Create partitions for the current month and the next few months.
+        Rows that already fell into the default partition get a partition of their own
+        month: the default partition is detached, the rows are moved into the new
+        partitions and it is attached again, all in one transaction.
+        """
+        try:
+            if not ActivityLogPartitionService.is_partitioned():
+                return {'partitions_created': [], 'skipped': 'activity_logs is not partitioned'}
+            
+            if months_ahead is None:
+                months_ahead = current_app.config.get('ACTIVITY_LOG_PARTITION_MONTHS_AHEAD', 3)
+            
+            existing = {name for _, name in ActivityLogPartitionService.list_partitions()}
+            current_month = datetime.utcnow().date().replace(day=1)
+            months = {
+                ActivityLogPartitionService._add_months(current_month, offset)
+                for offset in range(months_ahead + 1)
+            }
+            stranded = ActivityLogPartitionService._default_partition_months()
+            months = sorted(
+                month_start for month_start in months | stranded
+                if ActivityLogPartitionService.partition_name(month_start) not in existing
+            )
+            
+            # A month cannot be added while the default partition holds its rows
+            detach_default = any(month_start in stranded for month_start in months)
+            if detach_default:
+                db.session.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}'))
+            
+            created = []
+            for month_start in months:
+                table_name = ActivityLogPartitionService.partition_name(month_start)
+                month_end = ActivityLogPartitionService._add_months(month_start, 1)
+                db.session.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {table_name} PARTITION OF {PARENT_TABLE} "
+                    f"FOR VALUES FROM ('{month_start:%Y-%m-%d}') TO ('{month_end:%Y-%m-%d}')"
+                ))
+                
+                if month_start in stranded:
+                    bounds = {'start': month_start, 'end': month_end}
+                    moved = db.session.execute(text(
+                        f"INSERT INTO {table_name} SELECT * FROM {DEFAULT_PARTITION} "
+                        f"WHERE timestamp >= :start AND timestamp < :end"
+                    ), bounds).rowcount
+                    db.session.execute(text(
+                        f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+                    ), bounds)
+                    logger.info(f"Moved {moved} activity logs from {DEFAULT_PARTITION} to {table_name}")
+                
+                created.append(table_name)
+            
+            if detach_default:
+                db.session.execute(text(f'ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT'))
+            
+            db.session.commit()
+            
+            logger.info(f"Activity log partitions created: {created}")
+            return {'partitions_created': created}
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error creating activity log partitions: {str(e)}")
+            raise e
+    
+    @staticmethod
+    def _archive_partition(table_name, archive_dir):
+        """Dump a partition to a gzip-compressed CSV file and return its path"""
+        os.makedirs(archive_dir, exist_ok=True)
+        archive_path = os.path.join(archive_dir, f'{table_name}.csv.gz')
+        temp_path = f'{archive_path}.part'
+        
+        raw_connection = db.engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            with gzip.open(temp_path, 'wb') as archive_file:
+                cursor.copy_expert(f'COPY {table_name} TO STDOUT WITH CSV HEADER', archive_file)
+            cursor.close()
+            raw_connection.commit()
+        finally:
+            raw_connection.close()
+        
+        os.replace(temp_path, archive_path)
+        return archive_path
+    
+    @staticmethod
+    def apply_retention(retention_months=None, archive_dir=None):
+        """
+        Archive and drop partitions older than the retention window.
+        A partition is only detached and dropped after its archive file is written.
+        """
+        try:
+            if not ActivityLogPartitionService.is_partitioned():
+                return {'partitions_archived': [], 'skipped': 'activity_logs is not partitioned'}
+            
+            if retention_months is None:
+                retention_months = current_app.config.get('ACTIVITY_LOG_RETENTION_MONTHS', 12)
+            if archive_dir is None:
+                archive_dir = current_app.config.get('ACTIVITY_LOG_ARCHIVE_DIR', 'logs/archive')
+            
+            current_month = datetime.utcnow().date().replace(day=1)
+            cutoff = ActivityLogPartitionService._add_months(current_month, -retention_months)
+            archived = []
+            
+            for month_start, table_name in ActivityLogPartitionService.list_partitions():
+                if month_start >= cutoff:
+                    continue
+                
+                archive_path = ActivityLogPartitionService._archive_partition(table_name, archive_dir)
+                
+                db.session.execute(text(f'ALTER TABLE {PARENT_TABLE} DETACH PARTITION {table_name}'))
+                db.session.execute(text(f'DROP TABLE {table_name}'))
+                db.session.commit()
+                
+                archived.append({'partition': table_name, 'archive_path': archive_path})
+                logger.info(f"Archived activity log partition {table_name} to {archive_path}")
+            
+            return {'partitions_archived': archived}
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error applying activity log retention: {str(e)}")
+            raise e
+
+def schedule_partition_maintenance():
+    """
+    Create upcoming partitions (call this from your task scheduler).
+    Retention drops data, so it only runs from `flask maintain-activity-partitions --apply-retention`.
+    """
+    try:
+        return ActivityLogPartitionService.ensure_partitions()
+    
+    except Exception as e:
+        logger.error(f"Error in scheduled partition maintenance: {str(e)}")
+        return {'error': str(e)}
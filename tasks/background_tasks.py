@@ -40,11 +40,7 @@ class BackgroundTaskManager:
         with app.app_context():
             while self.running:
                 try:
-                    # Check for key rotation every hour
-                    self._check_key_rotation()
-                    
-                    # Check for other scheduled tasks
-                    self._run_scheduled_tasks()
+                    self.run_once()
                     
                     # Sleep for 1 hour
                     time.sleep(3600)  # 3600 seconds = 1 hour
@@ -53,6 +49,14 @@ class BackgroundTaskManager:
                     print(f"❌ Background task error: {str(e)}")
                     time.sleep(300)  # Sleep for 5 minutes on error
     
+    def run_once(self):
+        """Run every scheduled task once in the current app context"""
+        # Check for key rotation every hour
+        self._check_key_rotation()
+        
+        # Check for other scheduled tasks
+        self._run_scheduled_tasks()
+    
     def _check_key_rotation(self):
         """Check if any keys need rotation"""
         try:
@@ -75,9 +79,24 @@ class BackgroundTaskManager:
     def _run_scheduled_tasks(self):
         """Run other scheduled tasks"""
         try:
+            # Roll new activity logs up into usage statistics
+            from tasks.usage_rollup import schedule_usage_rollup
+            schedule_usage_rollup()
+            
+            # Keep activity log partitions ahead of time and enforce retention
+            from tasks.activity_partitions import schedule_partition_maintenance
+            schedule_partition_maintenance()
+            
+            # Move long-closed chat rooms to cold storage
+            from chat.archive import schedule_chat_archive
+            schedule_chat_archive()
+            
+            # Full low stock scan; stock changes reconcile their own alerts, this catches anything missed
+            from tasks.inventory_alerts import schedule_inventory_alerts
+            schedule_inventory_alerts()
+            
             # Add other scheduled tasks here
             # Example: cleanup old logs, send notifications, etc.
-            pass
         except Exception as e:
             print(f"❌ Error running scheduled tasks: {str(e)}")
     
@@ -2,13 +2,15 @@
 Inventory Alert System
 Automated background tasks for inventory monitoring and low stock alerts
 """
-from models.inventory import InventoryItem, LowStockAlert, InventoryLocation, StaffLocationAssignment
+from models.inventory import InventoryItem, StockMovement, LowStockAlert, InventoryLocation, StaffLocationAssignment
 from models.ecommerce import Product
 from models.jewelry import JewelryItem
 from models.user import User
 from database import db
 from datetime import datetime, timedelta
 from flask import current_app
+from sqlalchemy import select, update, case, literal, and_, or_, event, inspect
+from sqlalchemy.orm import selectinload
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,68 +22,131 @@ class InventoryAlertService:
     def check_low_stock_items():
         """Check all inventory items for low stock and create alerts"""
         try:
-            # Get all active inventory items that are low on stock
-            low_stock_items = InventoryItem.query.filter(
-                InventoryItem.status == 'active',
-                InventoryItem.current_stock <= InventoryItem.reorder_point
-            ).all()
-            
-            alerts_created = 0
-            alerts_updated = 0
-            
-            for item in low_stock_items:
-                # Check if there's already an active alert for this item
-                existing_alert = LowStockAlert.query.filter_by(
-                    inventory_item_id=item.id,
-                    status='active'
-                ).first()
-                
-                if existing_alert:
-                    # Update existing alert if stock level has changed
-                    if existing_alert.current_stock != item.current_stock:
-                        existing_alert.current_stock = item.current_stock
-                        existing_alert.alert_level = 'critical' if item.current_stock < 2 else 'low'
-                        existing_alert.updated_at = datetime.utcnow()
-                        alerts_updated += 1
-                else:
-                    # Create new alert
-                    alert = LowStockAlert(
-                        inventory_item_id=item.id,
-                        alert_level='critical' if item.current_stock < 2 else 'low',
-                        current_stock=item.current_stock,
-                        reorder_point=item.reorder_point
-                    )
-                    db.session.add(alert)
-                    alerts_created += 1
-            
-            # Resolve alerts for items that are no longer low stock
-            resolved_alerts = LowStockAlert.query.join(InventoryItem).filter(
-                LowStockAlert.status == 'active',
-                InventoryItem.current_stock > InventoryItem.reorder_point
-            ).all()
-            
-            alerts_resolved = 0
-            for alert in resolved_alerts:
-                alert.status = 'resolved'
-                alert.resolved_at = datetime.utcnow()
-                alerts_resolved += 1
-            
+            result = InventoryAlertService.reconcile_alerts()
             db.session.commit()
             
-            logger.info(f"Inventory alert check completed: {alerts_created} created, "
-                       f"{alerts_updated} updated, {alerts_resolved} resolved")
+            logger.info(f"Inventory alert check completed: {result['alerts_created']} created, "
+                       f"{result['alerts_updated']} updated, {result['alerts_resolved']} resolved")
             
-            return {
-                'alerts_created': alerts_created,
-                'alerts_updated': alerts_updated,
-                'alerts_resolved': alerts_resolved
-            }
+            return result
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error checking low stock items: {str(e)}")
             raise e
     
+    @staticmethod
+    def reconcile_alerts(*item_criteria, changes=None):
+        """
+        Bring active alerts in line with current stock for the items matching item_criteria
+        (all items by default) in three set-based statements: refresh changed alerts, resolve
+        alerts of restocked items, then open alerts for newly low items.
+        Returns the row counts; the caller commits. Pass a list as changes to receive the
+        touched alerts (needs UPDATE/INSERT ... RETURNING support).
+        """
+        now = datetime.utcnow()
+        is_low = and_(
+            InventoryItem.status == 'active',
+            InventoryItem.current_stock <= InventoryItem.reorder_point
+        )
+        alert_level = case((InventoryItem.current_stock < 2, 'critical'), else_='low')
+        
+        # UPDATE ... FROM: stock or reorder point moved while the item stayed low
+        alerts_updated = InventoryAlertService._execute(
+            update(LowStockAlert).where(
+                LowStockAlert.inventory_item_id == InventoryItem.id,
+                LowStockAlert.status == 'active',
+                is_low,
+                or_(
+                    LowStockAlert.current_stock != InventoryItem.current_stock,
+                    LowStockAlert.reorder_point != InventoryItem.reorder_point
+                ),
+                *item_criteria
+            ).values(
+                current_stock=InventoryItem.current_stock,
+                reorder_point=InventoryItem.reorder_point,
+                alert_level=alert_level,
+                updated_at=now
+            ).execution_options(synchronize_session=False),
+            'updated', changes
+        )
+        
+        # UPDATE ... FROM: item is back above its reorder point
+        alerts_resolved = InventoryAlertService._execute(
+            update(LowStockAlert).where(
+                LowStockAlert.inventory_item_id == InventoryItem.id,
+                LowStockAlert.status == 'active',
+                InventoryItem.current_stock > InventoryItem.reorder_point,
+                *item_criteria
+            ).values(
+                status='resolved',
+                resolved_at=now,
+                updated_at=now
+            ).execution_options(synchronize_session=False),
+            'resolved', changes
+        )
+        
+        # INSERT ... SELECT: low items without an active alert
+        has_active_alert = select(LowStockAlert.id).where(
+            LowStockAlert.inventory_item_id == InventoryItem.id,
+            LowStockAlert.status == 'active'
+        ).exists()
+        new_alerts = select(
+            InventoryItem.id, alert_level, InventoryItem.current_stock, InventoryItem.reorder_point,
+            literal('active'), literal(now), literal(now)
+        ).where(is_low, ~has_active_alert, *item_criteria)
+        
+        statement = InventoryAlertService._insert(db.engine.dialect.name).from_select(
+            ['inventory_item_id', 'alert_level', 'current_stock', 'reorder_point',
+             'status', 'created_at', 'updated_at'],
+            new_alerts
+        )
+        if hasattr(statement, 'on_conflict_do_nothing'):
+            # A concurrent check may have opened the alert first (uq_low_stock_alerts_active_item)
+            statement = statement.on_conflict_do_nothing(
+                index_elements=['inventory_item_id'],
+                index_where=LowStockAlert.__table__.c.status == 'active'
+            )
+        alerts_created = InventoryAlertService._execute(statement, 'created', changes)
+        
+        return {
+            'alerts_created': alerts_created,
+            'alerts_updated': alerts_updated,
+            'alerts_resolved': alerts_resolved
+        }
+    
+    @staticmethod
+    def _execute(statement, event, changes):
+        """Run a reconcile statement and return its row count, collecting the rows into changes"""
+        if changes is None:
+            return db.session.execute(statement).rowcount
+        
+        rows = db.session.execute(statement.returning(
+            LowStockAlert.id, LowStockAlert.inventory_item_id, LowStockAlert.alert_level,
+            LowStockAlert.current_stock, LowStockAlert.reorder_point, LowStockAlert.status
+        )).all()
+        changes.extend(dict(row._mapping, event=event) for row in rows)
+        return len(rows)
+    
+    @staticmethod
+    def _insert(dialect_name):
+        """INSERT construct with ON CONFLICT support where the dialect has it"""
+        if dialect_name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect_name == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy import insert
+        return insert(LowStockAlert)
+    
+    @staticmethod
+    def stock_changed(item_ids):
+        """
+        Flag inventory items whose stock was written outside the ORM (bulk statements) so
+        the stock alert hook reconciles them when the session commits
+        """
+        db.session.info.setdefault(PENDING_ITEMS_KEY, set()).update(int(item_id) for item_id in item_ids)
+    
     @staticmethod
     def get_critical_alerts(location_id=None):
         """Get critical alerts (2 or fewer items remaining)"""
@@ -228,6 +293,131 @@ class InventoryAlertService:
             logger.error(f"Error cleaning up old alerts: {str(e)}")
             raise e
 
+PENDING_ITEMS_KEY = 'stock_changed_item_ids'
+PENDING_NOTIFICATIONS_KEY = 'stock_alert_notifications'
+WATCHED_ITEM_FIELDS = ('current_stock', 'reorder_point', 'status')
+
+class StockAlertHook:
+    """
+    Keeps low stock alerts current as stock changes.
+    Items touched by a flush (new stock movements, edited stock levels or reorder points) and
+    items flagged with InventoryAlertService.stock_changed are reconciled just before the
+    session commits, inside the same transaction, and the resulting alert changes are pushed
+    to admins and location staff over Socket.IO once the commit succeeds.
+    """
+    
+    def __init__(self, app=None):
+        self.enabled = True
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        self.enabled = app.config.get('INVENTORY_ALERT_HOOK_ENABLED', True)
+        app.extensions['stock_alert_hook'] = self
+        if not self.enabled:
+            return
+        
+        # Listeners attach to the session class, which every app shares
+        for name, listener in (('after_flush', self.after_flush), ('before_commit', self.before_commit),
+                               ('after_commit', self.after_commit), ('after_rollback', self.after_rollback)):
+            if not event.contains(db.session, name, listener):
+                event.listen(db.session, name, listener)
+    
+    def after_flush(self, session, flush_context):
+        item_ids = set()
+        for obj in session.new:
+            if isinstance(obj, StockMovement) and obj.inventory_item_id:
+                item_ids.add(obj.inventory_item_id)
+            elif isinstance(obj, InventoryItem):
+                item_ids.add(obj.id)
+        
+        for obj in session.dirty:
+            if isinstance(obj, InventoryItem):
+                attrs = inspect(obj).attrs
+                if any(attrs[field].history.has_changes() for field in WATCHED_ITEM_FIELDS):
+                    item_ids.add(obj.id)
+        
+        if item_ids:
+            session.info.setdefault(PENDING_ITEMS_KEY, set()).update(item_ids)
+    
+    def before_commit(self, session):
+        # Commit flushes after this hook; flush now so pending stock changes are collected
+        session.flush()
+        item_ids = session.info.pop(PENDING_ITEMS_KEY, set())
+        if not item_ids:
+            return
+        
+        dialect = session.get_bind().dialect
+        changes = [] if dialect.update_returning and dialect.insert_returning else None
+        result = InventoryAlertService.reconcile_alerts(InventoryItem.id.in_(item_ids), changes=changes)
+        logger.debug(f"Stock change on {len(item_ids)} items: {result['alerts_created']} alerts created, "
+                     f"{result['alerts_updated']} updated, {result['alerts_resolved']} resolved")
+        
+        if changes:
+            session.info.setdefault(PENDING_NOTIFICATIONS_KEY, []).extend(self._notifications(session, changes))
+    
+    def after_commit(self, session):
+        notifications = session.info.pop(PENDING_NOTIFICATIONS_KEY, None)
+        if not notifications:
+            return
+        
+        try:
+            socketio = current_app.extensions['socketio']
+            from chat.presence import user_room
+            for user_id, alerts in notifications:
+                socketio.emit('low_stock_alerts', {'alerts': alerts}, room=user_room(user_id))
+        except Exception as e:
+            logger.warning(f"Failed to publish low stock alerts: {str(e)}")
+    
+    def after_rollback(self, session):
+        session.info.pop(PENDING_ITEMS_KEY, None)
+        session.info.pop(PENDING_NOTIFICATIONS_KEY, None)
+    
+    def _notifications(self, session, changes):
+        """Group alert changes into (user_id, alerts) for admins and each location's manager and staff"""
+        items = {
+            item.id: item for item in session.query(InventoryItem).options(
+                selectinload(InventoryItem.product),
+                selectinload(InventoryItem.jewelry_item),
+                selectinload(InventoryItem.location)
+            ).filter(InventoryItem.id.in_({change['inventory_item_id'] for change in changes}))
+        }
+        
+        alerts_by_location = {}
+        for change in changes:
+            item = items[change['inventory_item_id']]
+            alerts_by_location.setdefault(item.location_id, []).append({
+                'alert_id': change['id'],
+                'event': change['event'],
+                'inventory_item_id': item.id,
+                'item_name': item.get_item_name(),
+                'location_id': item.location_id,
+                'location_name': item.location.name if item.location else None,
+                'alert_level': change['alert_level'],
+                'current_stock': change['current_stock'],
+                'reorder_point': change['reorder_point'],
+                'status': change['status']
+            })
+        
+        location_ids = list(alerts_by_location)
+        recipients = {}
+        for location_id, manager_id in session.query(InventoryLocation.id, InventoryLocation.manager_id).filter(
+            InventoryLocation.id.in_(location_ids), InventoryLocation.manager_id.isnot(None)
+        ):
+            recipients.setdefault(manager_id, set()).add(location_id)
+        for location_id, staff_id in session.query(StaffLocationAssignment.location_id, StaffLocationAssignment.staff_id).filter(
+            StaffLocationAssignment.location_id.in_(location_ids), StaffLocationAssignment.is_active == True
+        ):
+            recipients.setdefault(staff_id, set()).add(location_id)
+        for (admin_id,) in session.query(User.id).filter_by(role='admin', is_active=True):
+            recipients[admin_id] = set(location_ids)
+        
+        return [
+            (user_id, [alert for location_id in location_ids if location_id in user_locations
+                       for alert in alerts_by_location[location_id]])
+            for user_id, user_locations in recipients.items()
+        ]
+
 def schedule_inventory_alerts():
     """Schedule inventory alert checks (call this from your task scheduler)"""
     try:
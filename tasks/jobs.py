@@ -0,0 +1,292 @@
+"""
+Background Jobs
+Persistent queue for long-running imports and exports. Web requests enqueue a
+BackgroundJob row; `flask run-jobs` workers claim rows with SELECT ... FOR UPDATE
+SKIP LOCKED, record progress on the row and store the outcome
+"""
+from models.admin import BackgroundJob
+from database import db
+from flask import current_app
+from sqlalchemy import update, and_, or_
+from datetime import datetime, timedelta
+import logging
+import os
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Rows of a stock import error report kept on the job
+MAX_REPORTED_ERRORS = 1000
+
+JOB_HANDLERS = {}
+
+def job_handler(job_type):
+    """Register a function(job, progress) as the handler for a job type"""
+    def register(func):
+        JOB_HANDLERS[job_type] = func
+        return func
+    return register
+
+class BackgroundJobService:
+    """Service for queueing, claiming and finishing background jobs"""
+    
+    @staticmethod
+    def job_dir(*parts):
+        """A directory under BACKGROUND_JOB_DIR, created if needed"""
+        path = os.path.join(current_app.config.get('BACKGROUND_JOB_DIR', 'logs/jobs'), *parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    @staticmethod
+    def enqueue(job_type, parameters=None, requested_by_id=None, max_attempts=None, job_id=None):
+        """Queue a job for the workers and return it; job_id is generated unless given"""
+        if job_type not in JOB_HANDLERS:
+            raise ValueError(f'Unknown job type: {job_type}')
+        
+        job = BackgroundJob(
+            job_id=job_id,
+            job_type=job_type,
+            parameters=parameters or {},
+            requested_by_id=requested_by_id,
+            status='pending',
+            max_attempts=max_attempts or current_app.config.get('BACKGROUND_JOB_MAX_ATTEMPTS', 3),
+            run_after=datetime.utcnow()
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job
+    
+    @staticmethod
+    def claim(worker_id):
+        """
+        Lock and start the next runnable job, or return None.
+        Jobs left 'processing' by a worker that stopped sending heartbeats are picked up again.
+        """
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=current_app.config.get('BACKGROUND_JOB_STALE_AFTER', 300))
+        
+        while True:
+            job = BackgroundJob.query.filter(or_(
+                and_(BackgroundJob.status == 'pending', BackgroundJob.run_after <= now),
+                and_(BackgroundJob.status == 'processing', BackgroundJob.heartbeat_at < stale_before)
+            )).order_by(BackgroundJob.run_after, BackgroundJob.id).limit(1).with_for_update(
+                skip_locked=True
+            ).first()
+            
+            if job is None:
+                db.session.rollback()
+                return None
+            
+            if job.status == 'processing':
+                logger.warning(f"Recovering job {job.job_id} abandoned by {job.locked_by}")
+                if job.attempts >= job.max_attempts:
+                    job.status = 'failed'
+                    job.error_message = f'Worker {job.locked_by} stopped while running the job'
+                    job.completed_at = now
+                    job.locked_by = None
+                    db.session.commit()
+                    continue
+            
+            job.status = 'processing'
+            job.locked_by = worker_id
+            job.heartbeat_at = now
+            job.attempts = (job.attempts or 0) + 1
+            job.started_at = job.started_at or now
+            db.session.commit()
+            return job
+    
+    @staticmethod
+    def progress_reporter(job_id, interval=None):
+        """
+        Progress callback for handlers: progress(processed, total=None).
+        Writes at most once per interval seconds, on its own connection so it never
+        commits the handler's transaction, and doubles as the job heartbeat.
+        """
+        if interval is None:
+            interval = current_app.config.get('BACKGROUND_JOB_PROGRESS_INTERVAL', 2.0)
+        last_written = {'at': 0.0}
+        
+        def progress(processed, total=None):
+            now = time.monotonic()
+            if now - last_written['at'] < interval and processed != total:
+                return
+            last_written['at'] = now
+            
+            values = {'processed_records': processed, 'heartbeat_at': datetime.utcnow()}
+            if total is not None:
+                values['total_records'] = total
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(update(BackgroundJob).where(BackgroundJob.id == job_id).values(**values))
+            except Exception as e:
+                logger.warning(f"Failed to record progress of job {job_id}: {str(e)}")
+        
+        return progress
+    
+    @staticmethod
+    def run_job(job):
+        """Run a claimed job's handler and record the outcome; returns True on success"""
+        job_id = job.id
+        handler = JOB_HANDLERS.get(job.job_type)
+        try:
+            if handler is None:
+                raise ValueError(f'Unknown job type: {job.job_type}')
+            result = handler(job, BackgroundJobService.progress_reporter(job_id)) or {}
+        except Exception as e:
+            db.session.rollback()
+            # Bad input (ValueError) fails for good; anything else is retried
+            BackgroundJobService.fail(job_id, e, retry=not isinstance(e, ValueError))
+            return False
+        
+        BackgroundJobService.complete(job_id, result)
+        return True
+    
+    @staticmethod
+    def complete(job_id, result):
+        """Mark a job completed; a 'file_path' entry in result becomes the job's download"""
+        # Progress was written on other connections; reload rather than trust the identity map
+        job = db.session.get(BackgroundJob, job_id, populate_existing=True)
+        file_path = result.pop('file_path', None)
+        
+        job.status = 'completed'
+        job.result = result
+        job.file_path = file_path
+        job.file_size = os.path.getsize(file_path) if file_path else None
+        if job.total_records is not None:
+            job.processed_records = job.total_records
+        job.completed_at = datetime.utcnow()
+        job.locked_by = None
+        job.error_message = None
+        db.session.commit()
+        logger.info(f"Job {job.job_id} ({job.job_type}) completed")
+    
+    @staticmethod
+    def fail(job_id, error, retry=True):
+        """Record a failed run; the job is retried with backoff until max_attempts is reached"""
+        job = db.session.get(BackgroundJob, job_id, populate_existing=True)
+        job.error_message = str(error)
+        job.locked_by = None
+        
+        if retry and job.attempts < job.max_attempts:
+            job.status = 'pending'
+            job.run_after = datetime.utcnow() + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+            logger.warning(f"Job {job.job_id} failed (attempt {job.attempts}), retrying: {str(error)}")
+        else:
+            job.status = 'failed'
+            job.completed_at = datetime.utcnow()
+            logger.error(f"Job {job.job_id} ({job.job_type}) failed: {str(error)}")
+        db.session.commit()
+    
+    @staticmethod
+    def run_worker(worker_id=None, poll_interval=None, max_jobs=None, burst=False, stop_event=None):
+        """
+        Claim and run jobs until stop_event is set.
+        With burst=True the worker returns as soon as the queue is empty.
+        Returns the number of jobs run.
+        """
+        worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        if poll_interval is None:
+            poll_interval = current_app.config.get('BACKGROUND_JOB_POLL_INTERVAL', 2.0)
+        stop_event = stop_event or threading.Event()
+        
+        jobs_run = 0
+        while not stop_event.is_set() and (max_jobs is None or jobs_run < max_jobs):
+            try:
+                job = BackgroundJobService.claim(worker_id)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Failed to claim a job: {str(e)}")
+                job = None
+            
+            if job is None:
+                if burst:
+                    break
+                stop_event.wait(poll_interval)
+                continue
+            
+            logger.info(f"Worker {worker_id} running job {job.job_id} ({job.job_type})")
+            BackgroundJobService.run_job(job)
+            jobs_run += 1
+            # Start every job with an empty identity map
+            db.session.remove()
+        
+        return jobs_run
+
+@job_handler('stock_import')
+def run_stock_import(job, progress):
+    """Import an uploaded stock file saved under BACKGROUND_JOB_DIR/uploads"""
+    from tasks.stock_import import StockImportService
+    from utils.activity_logger import ActivityLogger
+    
+    parameters = job.parameters
+    file_path = parameters['file_path']
+    try:
+        df = StockImportService.read_file(file_path, file_path)
+        progress(0, len(df))
+        report = StockImportService.import_stock(df, job.requested_by_id, parameters['location_id'], progress=progress)
+    finally:
+        # Imports are not retried (stock would be added twice), so the upload is no longer needed
+        os.remove(file_path)
+    
+    ActivityLogger.log_activity(
+        user_id=job.requested_by_id,
+        action='bulk_stock_upload',
+        description=f'Uploaded stock from file: {parameters["filename"]} - {report["imported"]} successful, {report["failed"]} errors',
+        metadata={
+            'filename': parameters['filename'],
+            'location_id': parameters['location_id'],
+            'reference_id': report['reference_id'],
+            'job_id': job.job_id,
+            'success_count': report['imported'],
+            'error_count': report['failed']
+        }
+    )
+    
+    report['errors_truncated'] = len(report['errors']) > MAX_REPORTED_ERRORS
+    report['errors'] = report['errors'][:MAX_REPORTED_ERRORS]
+    return report
+
+@job_handler('activity_export')
+def run_activity_export(job, progress):
+    """Write an activity log export to BACKGROUND_JOB_DIR/exports"""
+    from utils.activity_logger import ActivityLogger
+    
+    parameters = job.parameters
+    start_date = datetime.fromisoformat(parameters['start_date']) if parameters.get('start_date') else None
+    end_date = datetime.fromisoformat(parameters['end_date']) if parameters.get('end_date') else None
+    
+    activities = ActivityLogger.export_query(start_date, end_date)
+    total = activities.order_by(None).count()
+    progress(0, total)
+    exported = {'count': 0}
+    
+    def counted():
+        for activity in activities:
+            exported['count'] += 1
+            if exported['count'] % 1000 == 0:
+                progress(exported['count'], total)
+            yield activity
+    
+    chunks, content_type, extension = ActivityLogger.export_chunks(
+        counted(), parameters.get('format', 'json'), parameters.get('gzip', False)
+    )
+    file_path = os.path.join(BackgroundJobService.job_dir('exports'), f'activity_log_{job.job_id}.{extension}')
+    temp_path = f'{file_path}.part'
+    
+    try:
+        with open(temp_path, 'wb') as export_file:
+            for chunk in chunks:
+                export_file.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    
+    os.replace(temp_path, file_path)
+    return {
+        'records': exported['count'],
+        'content_type': content_type,
+        'file_path': file_path
+    }
@@ -0,0 +1,303 @@
+"""
+Bulk Stock Import
+Validates supplier stock files with vectorized pandas and loads them in batches:
+one lookup per batch for existing SKUs, executemany inserts and updates for
+products, inventory items and stock movements
+"""
+from models.inventory import InventoryItem, StockMovement
+from models.ecommerce import Product, ProductCategory
+from tasks.inventory_alerts import InventoryAlertService
+from database import db
+from sqlalchemy import select, insert, update
+from datetime import datetime
+import pandas as pd
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['name', 'sku', 'category', 'unit_cost', 'selling_price', 'current_stock', 'reorder_point']
+OPTIONAL_COLUMNS = ['description', 'supplier']
+TEXT_LIMITS = {'name': 200, 'sku': 50, 'category': 100}
+PRICE_COLUMNS = ['unit_cost', 'selling_price']
+QUANTITY_COLUMNS = ['current_stock', 'reorder_point']
+
+BATCH_SIZE = 1000
+
+def _slugify(value):
+    return re.sub(r'[^a-z0-9]+', '-', value.lower()).strip('-') or 'item'
+
+class StockImportService:
+    """Service for importing inventory stock from CSV and Excel files"""
+    
+    @staticmethod
+    def read_file(file, filename):
+        """Load an uploaded .csv, .xlsx or .xls file with every cell as text"""
+        if filename.lower().endswith('.csv'):
+            return pd.read_csv(file, dtype=str, keep_default_na=False)
+        return pd.read_excel(file, dtype=str)
+    
+    @staticmethod
+    def prepare(df):
+        """
+        Validate and coerce a stock file.
+        Returns (rows, errors): the valid rows as a typed DataFrame with their file row
+        numbers, and a list of {'row', 'sku', 'errors'} for every rejected row.
+        Raises ValueError if required columns are missing.
+        """
+        df = df.rename(columns=lambda column: str(column).strip().lower())
+        missing_columns = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+        if missing_columns:
+            raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+        
+        # Row numbers as shown in a spreadsheet (header is row 1)
+        rows = pd.DataFrame({'row': range(2, len(df) + 2)}, index=df.index)
+        problems = []
+        
+        for column in ['name', 'sku', 'category'] + OPTIONAL_COLUMNS:
+            if column in df.columns:
+                rows[column] = df[column].fillna('').astype(str).str.strip()
+            else:
+                rows[column] = ''
+        
+        for column, limit in TEXT_LIMITS.items():
+            problems.append((rows[column] == '', f'{column} is required'))
+            problems.append((rows[column].str.len() > limit, f'{column} is longer than {limit} characters'))
+        
+        for column in PRICE_COLUMNS + QUANTITY_COLUMNS:
+            text = df[column].fillna('').astype(str).str.strip().str.replace(',', '', regex=False)
+            values = pd.to_numeric(text, errors='coerce')
+            problems.append((values.isna(), f'{column} must be a number'))
+            problems.append((values < 0, f'{column} cannot be negative'))
+            if column in QUANTITY_COLUMNS:
+                problems.append((values.notna() & (values % 1 != 0), f'{column} must be a whole number'))
+            rows[column] = values
+        
+        duplicates = rows['sku'].ne('') & rows.duplicated('sku', keep='first')
+        first_rows = rows.groupby('sku')['row'].transform('first')
+        problems.append((duplicates, 'duplicate SKU, first listed on row ' + first_rows.astype(str)))
+        
+        messages = {}
+        for mask, message in problems:
+            mask = mask.fillna(False).astype(bool)
+            if not mask.any():
+                continue
+            texts = message[mask] if isinstance(message, pd.Series) else [message] * int(mask.sum())
+            for index, text in zip(rows.index[mask], texts):
+                messages.setdefault(index, []).append(text)
+        
+        errors = [
+            {'row': int(rows.at[index, 'row']), 'sku': rows.at[index, 'sku'], 'errors': row_messages}
+            for index, row_messages in sorted(messages.items(), key=lambda item: rows.at[item[0], 'row'])
+        ]
+        
+        valid = rows.drop(index=list(messages)).reset_index(drop=True)
+        for column in QUANTITY_COLUMNS:
+            valid[column] = valid[column].astype('int64')
+        for column in PRICE_COLUMNS:
+            valid[column] = valid[column].round(2)
+        return valid, errors
+    
+    @staticmethod
+    def import_stock(df, user_id, location_id, progress=None):
+        """
+        Import a stock file into the inventory at location_id.
+        Unknown SKUs become new products and inventory items; known SKUs have their details
+        updated and the file quantity added to their stock. Each batch of BATCH_SIZE rows is
+        committed on its own, and a failed batch is reported without stopping the import.
+        progress, if given, is called as progress(rows_processed, total_rows) after each batch.
+        Returns a summary with a per-row error report.
+        """
+        rows, errors = StockImportService.prepare(df)
+        total_rows = len(df)
+        reference_id = f'UPLOAD-{datetime.now().strftime("%Y%m%d%H%M%S")}'
+        summary = {
+            'reference_id': reference_id,
+            'total_rows': total_rows,
+            'created': 0,
+            'updated': 0,
+            'errors': errors
+        }
+        
+        if not rows.empty:
+            category_ids = StockImportService._category_ids(rows['category'].unique().tolist())
+            rows['category_id'] = rows['category'].map(category_ids)
+        
+        processed = len(errors)
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows.iloc[start:start + BATCH_SIZE].copy()
+            try:
+                created, updated = StockImportService._import_batch(batch, user_id, location_id, reference_id)
+                db.session.commit()
+                summary['created'] += created
+                summary['updated'] += updated
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Stock import batch starting at row {batch['row'].iloc[0]} failed: {str(e)}")
+                errors.extend(
+                    {'row': int(row), 'sku': sku, 'errors': [f'batch failed: {str(e)}']}
+                    for row, sku in zip(batch['row'], batch['sku'])
+                )
+            
+            processed += len(batch)
+            if progress:
+                progress(processed, total_rows)
+        
+        errors.sort(key=lambda error: error['row'])
+        summary['imported'] = summary['created'] + summary['updated']
+        summary['failed'] = len(errors)
+        return summary
+    
+    @staticmethod
+    def _category_ids(names):
+        """Map category names to ids, creating the missing categories"""
+        category_ids = dict(db.session.execute(
+            select(ProductCategory.name, ProductCategory.id).where(ProductCategory.name.in_(names))
+        ).all())
+        
+        missing = [name for name in names if name not in category_ids]
+        if missing:
+            slugs = StockImportService._unique_slugs(ProductCategory, [_slugify(name) for name in missing])
+            created = db.session.execute(
+                insert(ProductCategory).returning(ProductCategory.name, ProductCategory.id),
+                [{'name': name, 'slug': slug, 'is_active': True} for name, slug in zip(missing, slugs)]
+            )
+            category_ids.update(created.all())
+            db.session.commit()
+        return category_ids
+    
+    @staticmethod
+    def _unique_slugs(model, bases):
+        """Suffix slugs that are taken, in the table or earlier in bases"""
+        taken = set(db.session.execute(
+            select(model.slug).where(model.slug.in_(set(bases)))
+        ).scalars()) if bases else set()
+        for base in taken & set(bases):
+            taken.update(db.session.execute(
+                select(model.slug).where(model.slug.like(f'{base}-%'))
+            ).scalars())
+        
+        slugs = []
+        for base in bases:
+            slug = base
+            suffix = 2
+            while slug in taken:
+                slug = f'{base}-{suffix}'
+                suffix += 1
+            taken.add(slug)
+            slugs.append(slug)
+        return slugs
+    
+    @staticmethod
+    def _import_batch(batch, user_id, location_id, reference_id):
+        """Upsert products and inventory items for one batch and record their stock movements"""
+        now = datetime.utcnow()
+        product_ids = dict(db.session.execute(
+            select(Product.sku, Product.id).where(Product.sku.in_(batch['sku'].tolist()))
+        ).all())
+        batch['product_id'] = batch['sku'].map(product_ids)
+        
+        new_products = batch[batch['product_id'].isna()]
+        if not new_products.empty:
+            slugs = StockImportService._unique_slugs(
+                Product, [_slugify(f'{name}-{sku}') for name, sku in zip(new_products['name'], new_products['sku'])]
+            )
+            created = db.session.execute(
+                insert(Product).returning(Product.sku, Product.id),
+                [{
+                    'name': record['name'],
+                    'sku': record['sku'],
+                    'slug': slug,
+                    'category_id': record['category_id'],
+                    'price': record['selling_price'],
+                    'cost_price': record['unit_cost'],
+                    'description': record['description'] or None,
+                    'status': 'active'
+                } for record, slug in zip(new_products.to_dict('records'), slugs)]
+            )
+            product_ids.update(created.all())
+        
+        existing_products = batch[batch['product_id'].notna()]
+        if not existing_products.empty:
+            db.session.execute(update(Product), [{
+                'id': int(record['product_id']),
+                'name': record['name'],
+                'category_id': record['category_id'],
+                'price': record['selling_price'],
+                'cost_price': record['unit_cost'],
+                'updated_at': now
+            } for record in existing_products.to_dict('records')])
+        batch['product_id'] = batch['sku'].map(product_ids).astype('int64')
+        
+        # Lock the stock rows being added to so stock_before/stock_after stay exact
+        items = {}
+        for item_id, product_id, current_stock, reserved_stock in db.session.execute(
+            select(InventoryItem.id, InventoryItem.product_id, InventoryItem.current_stock,
+                   InventoryItem.reserved_stock)
+            .where(InventoryItem.product_id.in_(batch['product_id'].tolist()),
+                   InventoryItem.location_id == location_id)
+            .order_by(InventoryItem.id).with_for_update()
+        ):
+            items.setdefault(product_id, (item_id, current_stock, reserved_stock or 0))
+        
+        batch['item_id'] = batch['product_id'].map(lambda product_id: items.get(product_id, (None,))[0])
+        batch['stock_before'] = batch['product_id'].map(lambda product_id: items.get(product_id, (None, 0))[1])
+        batch['reserved_stock'] = batch['product_id'].map(lambda product_id: items.get(product_id, (None, 0, 0))[2])
+        batch['stock_after'] = batch['stock_before'] + batch['current_stock']
+        batch['available_stock'] = (batch['stock_after'] - batch['reserved_stock']).clip(lower=0)
+        batch['total_value'] = (batch['stock_after'] * batch['unit_cost']).round(2)
+        is_new = batch['item_id'].isna()
+        
+        new_items = batch[is_new]
+        if not new_items.empty:
+            created = db.session.execute(
+                insert(InventoryItem).returning(InventoryItem.product_id, InventoryItem.id),
+                [{
+                    'product_id': record['product_id'],
+                    'location_id': location_id,
+                    'current_stock': record['stock_after'],
+                    'reserved_stock': 0,
+                    'available_stock': record['available_stock'],
+                    'reorder_point': record['reorder_point'],
+                    'unit_cost': record['unit_cost'],
+                    'total_value': record['total_value'],
+                    'status': 'active'
+                } for record in new_items.to_dict('records')]
+            )
+            created_ids = dict(created.all())
+            batch.loc[is_new, 'item_id'] = batch.loc[is_new, 'product_id'].map(created_ids)
+        
+        existing_items = batch[~is_new]
+        if not existing_items.empty:
+            db.session.execute(update(InventoryItem), [{
+                'id': int(record['item_id']),
+                'current_stock': record['stock_after'],
+                'available_stock': record['available_stock'],
+                'reorder_point': record['reorder_point'],
+                'unit_cost': record['unit_cost'],
+                'total_value': record['total_value'],
+                'updated_at': now
+            } for record in existing_items.to_dict('records')])
+        
+        movements = batch[batch['current_stock'] > 0]
+        if not movements.empty:
+            db.session.execute(insert(StockMovement), [{
+                'inventory_item_id': int(record['item_id']),
+                'location_id': location_id,
+                'user_id': user_id,
+                'movement_type': 'initial_stock' if new else 'adjustment',
+                'quantity': record['current_stock'],
+                'unit_cost': record['unit_cost'],
+                'stock_before': record['stock_before'],
+                'stock_after': record['stock_after'],
+                'reference_type': 'stock_upload',
+                'reference_id': reference_id,
+                'notes': ('Initial stock - file import' if new else 'Stock upload - file import')
+                         + (f" (supplier: {record['supplier']})" if record['supplier'] else ''),
+                'movement_date': now
+            } for record, new in zip(movements.to_dict('records'), is_new[movements.index])])
+        
+        # Bulk statements skip ORM events; reconcile this batch's alerts at commit
+        InventoryAlertService.stock_changed(batch['item_id'].tolist())
+        
+        return int(is_new.sum()), int((~is_new).sum())
@@ -0,0 +1,225 @@
+"""
+Usage Statistics Rollup
+Aggregates ActivityLog into hourly and daily UsageStatistics rows
+"""
+from models.activity_tracking import ActivityLog, UsageStatistics
+from models.admin import SystemConfiguration
+from database import db
+from datetime import datetime, timedelta
+from sqlalchemy import func, distinct, case, extract
+import logging
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = 'usage_rollup_watermark'
+
+# Rows can reach activity_logs a few seconds late through the write-behind
+# buffer, so the watermark trails the clock by this much.
+LATENESS_ALLOWANCE = timedelta(minutes=5)
+
+# Number of most active users kept per day in metrics_data
+TOP_USERS_PER_DAY = 25
+
+# Daily counters incremented live by ActivityLogger._update_usage_stats. The rollup
+# only fills them on hourly rows so the two writers never overwrite each other.
+LIVE_DAILY_COUNTERS = ('total_logins', 'new_registrations')
+
+class UsageRollupService:
+    """Service for rolling activity logs up into usage statistics"""
+    
+    @staticmethod
+    def _metric_columns():
+        """Aggregate expressions shared by the hourly and daily rollups"""
+        def count_where(condition):
+            return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+        
+        return [
+            func.count(ActivityLog.id).label('total_activities'),
+            func.count(distinct(ActivityLog.user_id)).label('active_users'),
+            func.count(distinct(ActivityLog.ip_address)).label('unique_visitors'),
+            count_where(ActivityLog.action == 'login').label('total_logins'),
+            count_where(ActivityLog.action == 'login_failed').label('failed_logins'),
+            count_where(ActivityLog.action == 'user_registered').label('new_registrations'),
+            count_where(ActivityLog.action.like('post_services.%')).label('service_requests'),
+            func.count(distinct(ActivityLog.performed_by_id)).label('active_staff'),
+            func.count(ActivityLog.performed_by_id).label('staff_actions'),
+            func.avg(ActivityLog.duration_ms).label('avg_response_time_ms'),
+            count_where(ActivityLog.success.isnot(True)).label('error_count'),
+        ]
+    
+    @staticmethod
+    def _apply_metrics(stats, row):
+        """Copy aggregate values from a result row onto a UsageStatistics row"""
+        stats.total_activities = row.total_activities
+        stats.active_users = row.active_users
+        stats.unique_visitors = row.unique_visitors
+        if stats.hour is not None:
+            for counter in LIVE_DAILY_COUNTERS:
+                setattr(stats, counter, int(getattr(row, counter)))
+        stats.failed_logins = int(row.failed_logins)
+        stats.service_requests = int(row.service_requests)
+        stats.active_staff = row.active_staff
+        stats.staff_actions = row.staff_actions
+        stats.avg_response_time_ms = float(row.avg_response_time_ms) if row.avg_response_time_ms is not None else None
+        stats.error_count = int(row.error_count)
+        stats.updated_at = datetime.utcnow()
+    
+    @staticmethod
+    def rollup_day(day, end=None):
+        """
+        Recompute the hourly and daily statistics for one day.
+        Distinct counts cannot be merged incrementally, so the whole day
+        (up to ``end`` if given) is re-aggregated and existing rows overwritten,
+        except the live counters on the daily row.
+        """
+        day_start = datetime.combine(day, datetime.min.time())
+        day_end = day_start + timedelta(days=1)
+        if end is not None and end < day_end:
+            day_end = end
+        
+        filters = [ActivityLog.timestamp >= day_start, ActivityLog.timestamp < day_end]
+        hour = extract('hour', ActivityLog.timestamp)
+        
+        hourly_rows = db.session.query(
+            hour.label('hour'), *UsageRollupService._metric_columns()
+        ).filter(*filters).group_by(hour).all()
+        
+        daily_row = db.session.query(
+            *UsageRollupService._metric_columns()
+        ).filter(*filters).one()
+        
+        top_users = db.session.query(
+            ActivityLog.user_id, func.count(ActivityLog.id)
+        ).filter(
+            *filters, ActivityLog.user_id.isnot(None)
+        ).group_by(ActivityLog.user_id).order_by(
+            func.count(ActivityLog.id).desc()
+        ).limit(TOP_USERS_PER_DAY).all()
+        
+        existing = {
+            stats.hour: stats
+            for stats in UsageStatistics.query.filter_by(date=day).all()
+        }
+        
+        def get_or_create(hour_value):
+            stats = existing.get(hour_value)
+            if stats is None:
+                stats = UsageStatistics(date=day, hour=hour_value)
+                db.session.add(stats)
+                existing[hour_value] = stats
+            return stats
+        
+        peak_hour = None
+        peak_count = 0
+        for row in hourly_rows:
+            hour_value = int(row.hour)
+            UsageRollupService._apply_metrics(get_or_create(hour_value), row)
+            if row.total_activities > peak_count:
+                peak_hour, peak_count = hour_value, row.total_activities
+        
+        daily = get_or_create(None)
+        UsageRollupService._apply_metrics(daily, daily_row)
+        daily.metrics_data = {
+            'peak_activity_hour': peak_hour,
+            'top_users': {str(user_id): count for user_id, count in top_users},
+            'rolled_up_to': day_end.isoformat()
+        }
+        
+        db.session.commit()
+        
+        return len(hourly_rows)
+    
+    @staticmethod
+    def rollup_range(start, end):
+        """Recompute every day touched by [start, end)"""
+        day = start.date()
+        hours_written = 0
+        
+        while datetime.combine(day, datetime.min.time()) < end:
+            hours_written += UsageRollupService.rollup_day(day, end=end)
+            day += timedelta(days=1)
+        
+        return hours_written
+    
+    @staticmethod
+    def get_watermark():
+        """Return the timestamp up to which activity logs are fully rolled up"""
+        config = SystemConfiguration.query.filter_by(key=WATERMARK_KEY).first()
+        if config and config.value:
+            return datetime.fromisoformat(config.value)
+        return None
+    
+    @staticmethod
+    def set_watermark(value):
+        """Persist the rollup watermark"""
+        config = SystemConfiguration.query.filter_by(key=WATERMARK_KEY).first()
+        if not config:
+            config = SystemConfiguration(
+                key=WATERMARK_KEY,
+                category='system',
+                data_type='string',
+                description='Activity logs before this timestamp are rolled up into usage_statistics'
+            )
+            db.session.add(config)
+        
+        config.value = value.isoformat()
+        db.session.commit()
+    
+    @staticmethod
+    def run_incremental(now=None):
+        """Roll up everything logged since the watermark and advance it"""
+        try:
+            now = now or datetime.utcnow()
+            watermark = UsageRollupService.get_watermark()
+            
+            if watermark is None:
+                # First run only covers today; use backfill for history
+                watermark = datetime.combine(now.date(), datetime.min.time())
+            
+            hours_written = UsageRollupService.rollup_range(watermark, now)
+            
+            new_watermark = (now - LATENESS_ALLOWANCE).replace(minute=0, second=0, microsecond=0)
+            if new_watermark > watermark:
+                UsageRollupService.set_watermark(new_watermark)
+            
+            logger.info(f"Usage rollup completed from {watermark.isoformat()}: {hours_written} hourly rows")
+            
+            return {
+                'from': watermark,
+                'to': now,
+                'hours_written': hours_written
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error rolling up usage statistics: {str(e)}")
+            raise e
+    
+    @staticmethod
+    def backfill(start_date, end_date):
+        """Recompute statistics for the inclusive date range without moving the watermark"""
+        try:
+            start = datetime.combine(start_date, datetime.min.time())
+            end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+            
+            hours_written = UsageRollupService.rollup_range(start, end)
+            
+            logger.info(f"Usage backfill {start_date} - {end_date} completed: {hours_written} hourly rows")
+            
+            return {
+                'days': (end_date - start_date).days + 1,
+                'hours_written': hours_written
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error backfilling usage statistics: {str(e)}")
+            raise e
+
+def schedule_usage_rollup():
+    """Run the incremental usage rollup (call this from your task scheduler)"""
+    try:
+        return UsageRollupService.run_incremental()
+    except Exception as e:
+        logger.error(f"Error in scheduled usage rollup: {str(e)}")
+        return {'error': str(e)}
@@ -0,0 +1,191 @@
+"""
+Activity Log Write-Behind Buffer
+Queues ActivityLog rows in-process and bulk inserts them on a separate connection
+"""
+from database import db
+from models.activity_tracking import ActivityLog, UsageStatistics
+import atexit
+import os
+import queue
+import threading
+import time
+
+class ActivityLogBuffer:
+    """
+    Batches activity log rows off the request path.
+    
+    Rows are plain column dicts pushed onto a bounded queue. A worker thread
+    flushes them with a single executemany INSERT whenever the batch fills up
+    or the flush interval elapses. When the queue is full the caller gets
+    False back and is expected to write the row synchronously instead.
+    
+    Daily usage counters are also coalesced here and written as one upsert
+    per date on each flush interval.
+    """
+    
+    _STOP = object()
+    
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.flush_size = 200
+        self.flush_interval = 2.0
+        self.put_timeout = 0.05
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._counter_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Initialize the buffer with Flask app"""
+        self.app = app
+        self.enabled = app.config.get('ACTIVITY_LOG_ASYNC', False)
+        self.flush_size = app.config.get('ACTIVITY_LOG_FLUSH_SIZE', 200)
+        self.flush_interval = app.config.get('ACTIVITY_LOG_FLUSH_INTERVAL', 2.0)
+        self.put_timeout = app.config.get('ACTIVITY_LOG_PUT_TIMEOUT', 0.05)
+        self._queue = queue.Queue(maxsize=app.config.get('ACTIVITY_LOG_QUEUE_SIZE', 10000))
+        
+        app.extensions['activity_log_buffer'] = self
+        atexit.register(self.stop)
+    
+    def enqueue(self, row):
+        """
+        Queue a row for the next batch.
+        Returns False if the buffer is disabled or stays full past put_timeout.
+        """
+        if not self.enabled:
+            return False
+        
+        self._ensure_worker()
+        
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.app.logger.warning("Activity log buffer full, writing synchronously")
+            return False
+    
+    def increment_counter(self, day, metric, amount=1):
+        """
+        Add to a daily UsageStatistics counter in memory.
+        Returns False if the buffer is disabled.
+        """
+        if not self.enabled:
+            return False
+        
+        self._ensure_worker()
+        
+        with self._counter_lock:
+            key = (day, metric)
+            self._counters[key] = self._counters.get(key, 0) + amount
+        return True
+    
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        rows = self._drain()
+        for start in range(0, len(rows), self.flush_size):
+            self._write_batch(rows[start:start + self.flush_size])
+        self._flush_counters()
+        
+        return len(rows)
+    
+    def stop(self, timeout=10):
+        """Stop the worker and drain any queued rows"""
+        thread = self._thread
+        if thread and thread.is_alive() and self._pid == os.getpid():
+            self._queue.put(self._STOP)
+            thread.join(timeout)
+        self._thread = None
+        
+        if self._queue is not None:
+            self.flush()
+    
+    def _ensure_worker(self):
+        """Start the worker lazily so each forked gunicorn worker gets its own"""
+        if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='activity-log-writer', daemon=True)
+            self._thread.start()
+    
+    def _run(self):
+        """Worker loop: collect rows until the batch is full or the interval expires"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            timeout = max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            
+            if item is self._STOP:
+                batch.extend(self._drain())
+                self._write_batch(batch)
+                self._flush_counters()
+                return
+            
+            if item is not None:
+                batch.append(item)
+            
+            if len(batch) >= self.flush_size:
+                self._write_batch(batch)
+                batch = []
+            
+            if time.monotonic() >= deadline:
+                self._write_batch(batch)
+                self._flush_counters()
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+    
+    def _drain(self):
+        """Pull every remaining row off the queue without blocking"""
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return rows
+            if item is not self._STOP:
+                rows.append(item)
+    
+    def _write_batch(self, rows):
+        """Bulk insert a batch of rows on a dedicated connection"""
+        if not rows:
+            return
+        
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(ActivityLog.__table__.insert(), rows)
+        except Exception as e:
+            self.app.logger.error(f"Failed to flush {len(rows)} activity logs: {str(e)}")
+    
+    def _flush_counters(self):
+        """Write coalesced usage counters, one upsert per date"""
+        with self._counter_lock:
+            counters, self._counters = self._counters, {}
+        
+        if not counters:
+            return
+        
+        increments_by_day = {}
+        for (day, metric), amount in counters.items():
+            increments_by_day.setdefault(day, {})[metric] = amount
+        
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as connection:
+                    for day, increments in increments_by_day.items():
+                        UsageStatistics.increment(connection, day, increments)
+        except Exception as e:
+            self.app.logger.error(f"Failed to flush usage counters {counters}: {str(e)}")
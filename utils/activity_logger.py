@@ -4,8 +4,12 @@ Helper functions for logging user activities and system events
 """
 from database import db
 from models.activity_tracking import ActivityLog, UserRegistration, StaffOnboarding, UsageStatistics, LoginSession
+from utils.export_stream import csv_chunks, ndjson_chunks, json_array_chunks, gzip_chunks
 from flask import request, current_app
+from sqlalchemy import func, distinct, case, extract, or_, text
+from sqlalchemy.orm import aliased
 from datetime import datetime, date
+import base64
 import json
 import uuid
 
@@ -25,10 +29,13 @@ class ActivityLogger:
         metadata=None,
         success=True,
         error_message=None,
-        duration_ms=None
+        duration_ms=None,
+        buffered=True
     ):
         """
-        Log any user or system activity
+        Log any user or system activity.
+        Returns the saved ActivityLog, or None when the row went to the write-behind
+        buffer or logging failed; pass buffered=False to write it now and get the row back.
         """
         try:
             # Capture request information if available
@@ -43,23 +50,30 @@ class ActivityLogger:
                 request_method = request.method
                 request_url = request.url
             
-            activity_log = ActivityLog(
-                user_id=user_id,
-                performed_by_id=performed_by_id,
-                activity_type=activity_type,
-                action=action,
-                description=description,
-                category=category,
-                ip_address=ip_address,
-                user_agent=user_agent,
-                request_method=request_method,
-                request_url=request_url,
-                additional_data=metadata,
-                success=success,
-                error_message=error_message,
-                duration_ms=duration_ms
-            )
+            row = {
+                'user_id': user_id,
+                'performed_by_id': performed_by_id,
+                'activity_type': activity_type,
+                'action': action,
+                'description': description,
+                'category': category,
+                'ip_address': ip_address,
+                'user_agent': user_agent,
+                'request_method': request_method,
+                'request_url': request_url,
+                'additional_data': metadata,
+                'success': success,
+                'error_message': error_message,
+                'timestamp': datetime.utcnow(),
+                'duration_ms': duration_ms
+            }
+            
+            # Write-behind mode: hand the row to the buffer and skip the commit
+            buffer = current_app.extensions.get('activity_log_buffer') if buffered else None
+            if buffer and buffer.enqueue(row):
+                return None
             
+            activity_log = ActivityLog(**row)
             db.session.add(activity_log)
             db.session.commit()
             
@@ -286,22 +300,17 @@ class ActivityLogger:
     @staticmethod
     def _update_usage_stats(metric, increment=1):
         """
-        Update daily usage statistics
+        Atomically increment a daily usage counter
         """
         try:
             today = date.today()
             
-            # Get or create today's stats
-            stats = UsageStatistics.query.filter_by(date=today, hour=None).first()
-            if not stats:
-                stats = UsageStatistics(date=today)
-                db.session.add(stats)
-            
-            # Update the specific metric
-            current_value = getattr(stats, metric, 0) or 0
-            setattr(stats, metric, current_value + increment)
-            stats.updated_at = datetime.utcnow()
+            # Write-behind mode: coalesce in memory, the buffer flushes every few seconds
+            buffer = current_app.extensions.get('activity_log_buffer')
+            if buffer and buffer.increment_counter(today, metric, increment):
+                return
             
+            UsageStatistics.increment(db.session, today, {metric: increment})
             db.session.commit()
             
         except Exception as e:
@@ -327,7 +336,7 @@ class ActivityLogger:
         return query.order_by(ActivityLog.timestamp.desc()).limit(limit).all()
     
     @staticmethod
-    def get_staff_monitoring_data(staff_user_id, start_date=None, end_date=None):
+    def get_staff_monitoring_data(staff_user_id, start_date=None, end_date=None, limit=None):
         """
         Get data for staff monitoring dashboard
         """
@@ -345,10 +354,75 @@ class ActivityLogger:
         if end_date:
             activities = activities.filter(ActivityLog.timestamp <= end_date)
         
-        return activities.order_by(ActivityLog.timestamp.desc()).all()
+        activities = activities.order_by(ActivityLog.timestamp.desc())
+        
+        if limit:
+            activities = activities.limit(limit)
+        
+        return activities.all()
+    
+    @staticmethod
+    def get_staff_activity_summaries(staff_members, start_date=None, end_date=None, per_staff_limit=50):
+        """
+        Latest activities performed by each staff member plus their onboarding record.
+        Uses one windowed query for the activities and one for the onboarding records,
+        however many staff members are passed in.
+        """
+        if start_date is None:
+            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        summaries = {
+            staff.id: {
+                'staff': staff,
+                'activities': [],
+                'total_count': 0,
+                'onboarding_record': None
+            }
+            for staff in staff_members
+        }
+        if not summaries:
+            return summaries
+        
+        filters = [
+            ActivityLog.performed_by_id.in_(list(summaries)),
+            ActivityLog.timestamp >= start_date
+        ]
+        if end_date:
+            filters.append(ActivityLog.timestamp <= end_date)
+        
+        # Rank each staff member's activities newest first and count them in the same pass
+        ranked = db.session.query(
+            ActivityLog,
+            func.row_number().over(
+                partition_by=ActivityLog.performed_by_id,
+                order_by=(ActivityLog.timestamp.desc(), ActivityLog.id.desc())
+            ).label('row_number'),
+            func.count(ActivityLog.id).over(partition_by=ActivityLog.performed_by_id).label('total_count')
+        ).filter(*filters).subquery()
+        
+        ranked_activity = aliased(ActivityLog, ranked)
+        rows = db.session.query(ranked_activity, ranked.c.total_count).filter(
+            ranked.c.row_number <= per_staff_limit
+        ).order_by(ranked.c.performed_by_id, ranked.c.row_number).all()
+        
+        for activity, total_count in rows:
+            summary = summaries[activity.performed_by_id]
+            summary['activities'].append(activity)
+            summary['total_count'] = total_count
+        
+        onboarding_records = StaffOnboarding.query.filter(
+            StaffOnboarding.staff_user_id.in_(list(summaries))
+        ).order_by(StaffOnboarding.id).all()
+        
+        for record in onboarding_records:
+            # Keep the first record per staff member, as .first() did
+            if summaries[record.staff_user_id]['onboarding_record'] is None:
+                summaries[record.staff_user_id]['onboarding_record'] = record
+        
+        return summaries
     
     @staticmethod
-    def get_admin_monitoring_data(start_date=None, end_date=None):
+    def get_admin_monitoring_data(start_date=None, end_date=None, limit=None):
         """
         Get comprehensive data for admin monitoring dashboard
         """
@@ -362,4 +436,183 @@ class ActivityLogger:
         if end_date:
             activities = activities.filter(ActivityLog.timestamp <= end_date)
         
-        return activities.order_by(ActivityLog.timestamp.desc()).all()
\ No newline at end of file
+        activities = activities.order_by(ActivityLog.timestamp.desc())
+        
+        if limit:
+            activities = activities.limit(limit)
+        
+        return activities.all()
+    
+    @staticmethod
+    def get_activity_summary(start_date=None, end_date=None):
+        """
+        Aggregate activity counts for a date range in the database
+        """
+        if start_date is None:
+            start_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        filters = [ActivityLog.timestamp >= start_date]
+        if end_date:
+            filters.append(ActivityLog.timestamp <= end_date)
+        
+        # Totals in a single pass
+        total_activities, unique_users, failed_activities = db.session.query(
+            func.count(ActivityLog.id),
+            func.count(distinct(ActivityLog.user_id)),
+            func.coalesce(func.sum(case((ActivityLog.success.is_(True), 0), else_=1)), 0)
+        ).filter(*filters).one()
+        
+        # Breakdowns by type, category and hour of day
+        activity_types = dict(
+            db.session.query(ActivityLog.activity_type, func.count(ActivityLog.id))
+            .filter(*filters)
+            .group_by(ActivityLog.activity_type)
+            .all()
+        )
+        
+        category_breakdown = dict(
+            db.session.query(ActivityLog.category, func.count(ActivityLog.id))
+            .filter(*filters)
+            .group_by(ActivityLog.category)
+            .all()
+        )
+        
+        hour = extract('hour', ActivityLog.timestamp)
+        hourly_distribution = {
+            int(hour_value): count
+            for hour_value, count in db.session.query(hour, func.count(ActivityLog.id))
+            .filter(*filters)
+            .group_by(hour)
+            .all()
+        }
+        
+        return {
+            'total_activities': total_activities,
+            'unique_users': unique_users,
+            'failed_activities': int(failed_activities),
+            'activity_types': activity_types,
+            'category_breakdown': category_breakdown,
+            'hourly_distribution': hourly_distribution
+        }
+    
+    @staticmethod
+    def encode_cursor(activity):
+        """
+        Build an opaque pagination cursor from an activity's (timestamp, id)
+        """
+        payload = json.dumps([activity.timestamp.isoformat(), activity.id])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def decode_cursor(cursor):
+        """
+        Decode a pagination cursor, raising ValueError if it is malformed
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, activity_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return datetime.fromisoformat(timestamp), int(activity_id)
+        except Exception:
+            raise ValueError('Invalid cursor')
+    
+    @staticmethod
+    def get_activities_page(query, cursor=None, limit=50):
+        """
+        Keyset pagination over activities ordered newest first.
+        Returns (activities, next_cursor); next_cursor is None on the last page.
+        """
+        if cursor:
+            timestamp, activity_id = ActivityLogger.decode_cursor(cursor)
+            # The plain timestamp bound lets the *_timestamp indexes drive the scan
+            query = query.filter(
+                ActivityLog.timestamp <= timestamp,
+                or_(ActivityLog.timestamp < timestamp, ActivityLog.id < activity_id)
+            )
+        
+        activities = query.order_by(
+            ActivityLog.timestamp.desc(), ActivityLog.id.desc()
+        ).limit(limit + 1).all()
+        
+        next_cursor = None
+        if len(activities) > limit:
+            activities = activities[:limit]
+            next_cursor = ActivityLogger.encode_cursor(activities[-1])
+        
+        return activities, next_cursor
+    
+    @staticmethod
+    def estimate_count(query):
+        """
+        Planner row estimate for a query, or None where statistics are unavailable
+        """
+        if db.engine.dialect.name != 'postgresql':
+            return None
+        
+        try:
+            statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+            plan = db.session.execute(text(f'EXPLAIN (FORMAT JSON) {statement}')).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+        except Exception as e:
+            current_app.logger.error(f"Failed to estimate activity count: {str(e)}")
+            return None
+    
+    @staticmethod
+    def export_query(start_date=None, end_date=None):
+        """
+        Activities between start_date and end_date, newest first, fetched 1000 rows at a time
+        """
+        query = ActivityLog.query
+        if start_date:
+            query = query.filter(ActivityLog.timestamp >= start_date)
+        if end_date:
+            query = query.filter(ActivityLog.timestamp <= end_date)
+        
+        # Server-side cursor: rows are fetched and written in batches
+        return query.order_by(ActivityLog.timestamp.desc()).yield_per(1000)
+    
+    @staticmethod
+    def export_chunks(activities, format_type='json', use_gzip=False):
+        """
+        Serialize activities as csv, ndjson or json (the default).
+        Returns (chunks, content_type, file extension).
+        """
+        if format_type == 'csv':
+            chunks = csv_chunks(
+                ['ID', 'User ID', 'Activity Type', 'Action', 'Category',
+                 'Success', 'Timestamp', 'IP Address', 'Description'],
+                ([activity.id, activity.user_id, activity.activity_type,
+                  activity.action, activity.category, activity.success,
+                  activity.timestamp, activity.ip_address, activity.description]
+                 for activity in activities)
+            )
+            content_type = 'text/csv'
+            extension = 'csv'
+        
+        elif format_type == 'ndjson':
+            chunks = ndjson_chunks(activity.to_dict() for activity in activities)
+            content_type = 'application/x-ndjson'
+            extension = 'ndjson'
+        
+        else:
+            exported = {'count': 0}
+            
+            def records():
+                for activity in activities:
+                    exported['count'] += 1
+                    yield activity.to_dict()
+            
+            chunks = json_array_chunks(records(), 'activities', extra=lambda: {
+                'exported_at': datetime.utcnow().isoformat(),
+                'total_records': exported['count']
+            })
+            content_type = 'application/json'
+            extension = 'json'
+        
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+            content_type = 'application/gzip'
+            extension += '.gz'
+        
+        return chunks, content_type, extension
@@ -5,7 +5,10 @@ Automatically tracks user activities and page views
 from flask import request, g, current_app
 from flask_login import current_user
 from utils.activity_logger import ActivityLogger
+from utils.activity_policy import PageViewPolicy, SKIP, AGGREGATE
+from utils.request_metrics import RequestMetrics
 from datetime import datetime
+import atexit
 import time
 
 class ActivityTrackingMiddleware:
@@ -15,6 +18,8 @@ class ActivityTrackingMiddleware:
     
     def __init__(self, app=None):
         self.app = app
+        self.page_view_policy = PageViewPolicy()
+        self.request_metrics = RequestMetrics()
         if app is not None:
             self.init_app(app)
     
@@ -23,6 +28,10 @@ class ActivityTrackingMiddleware:
         app.before_request(self.before_request)
         app.after_request(self.after_request)
         app.teardown_appcontext(self.teardown_request)
+        
+        self.page_view_policy.init_app(app)
+        self.request_metrics.init_app(app)
+        atexit.register(self._flush_page_view_aggregates, app)
     
     def before_request(self):
         """Track request start time and user activity"""
@@ -34,7 +43,8 @@ class ActivityTrackingMiddleware:
             'static',
             'favicon.ico',
             '_debug_toolbar',
-            'debug-toolbar'
+            'debug-toolbar',
+            'metrics'
         ]
         
         if request.endpoint in skip_routes or request.path.startswith('/static/'):
@@ -53,7 +63,11 @@ class ActivityTrackingMiddleware:
         # Calculate request duration
         duration_ms = None
         if hasattr(g, 'start_time'):
-            duration_ms = int((time.time() - g.start_time) * 1000)
+            duration = time.time() - g.start_time
+            duration_ms = int(duration * 1000)
+            
+            # Latency and DB usage histograms for every tracked request
+            self.request_metrics.observe(response, duration)
         
         # Log significant activities
         if current_user and current_user.is_authenticated:
@@ -87,6 +101,20 @@ class ActivityTrackingMiddleware:
             if request.method != 'GET':
                 return
             
+            # Apply sampling, deduplication and aggregate-only rules
+            decision, sample_rate = self.page_view_policy.decide(
+                current_user.id, request.endpoint, request.path
+            )
+            
+            if decision == SKIP:
+                return
+            
+            if decision == AGGREGATE:
+                window = self.page_view_policy.count(request.endpoint)
+                if window:
+                    self._log_page_view_aggregates(window)
+                return
+            
             activity_type = 'page_view'
             action = f'viewed_{request.endpoint or "unknown"}'
             description = f'User viewed {request.path}'
@@ -100,13 +128,39 @@ class ActivityTrackingMiddleware:
                 metadata={
                     'endpoint': request.endpoint,
                     'path': request.path,
-                    'args': dict(request.args) if request.args else None
+                    'args': dict(request.args) if request.args else None,
+                    'sample_rate': sample_rate
                 }
             )
             
         except Exception as e:
             current_app.logger.error(f"Failed to log page view: {str(e)}")
     
+    def _log_page_view_aggregates(self, window):
+        """Write one summary row per aggregate-only endpoint for a finished window"""
+        window_start, window_end, counts = window
+        
+        for endpoint, count in counts.items():
+            ActivityLogger.log_activity(
+                activity_type='page_view_aggregate',
+                action=f'viewed_{endpoint}',
+                description=f'{count} views of {endpoint}',
+                category='navigation',
+                metadata={
+                    'endpoint': endpoint,
+                    'count': count,
+                    'window_start': window_start.isoformat(),
+                    'window_end': window_end.isoformat()
+                }
+            )
+    
+    def _flush_page_view_aggregates(self, app):
+        """Write the partial aggregate window on shutdown"""
+        window = self.page_view_policy.take_aggregates()
+        if window:
+            with app.app_context():
+                self._log_page_view_aggregates(window)
+    
     def _log_request_activity(self, response, duration_ms):
         """Log significant user activities"""
         try:
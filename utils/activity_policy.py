@@ -0,0 +1,130 @@
+"""
+Page View Logging Policy
+Decides which page views become ActivityLog rows, which are sampled,
+deduplicated or only counted
+"""
+from collections import OrderedDict
+from datetime import datetime
+from fnmatch import fnmatch
+import random
+import threading
+import time
+
+LOG = 'log'
+SKIP = 'skip'
+AGGREGATE = 'aggregate'
+
+class PageViewPolicy:
+    """
+    Rule-based filter for page view logging.
+    
+    Rules are checked in order:
+    1. always_log patterns are logged in full (admin, staff, loans, auth, ...)
+    2. aggregate_only patterns only bump an in-memory counter per endpoint
+    3. a repeat view of the same path by the same user within the dedup window is skipped
+    4. everything else is sampled at the rate of the first matching sample_rates
+       pattern, falling back to default_sample_rate
+    
+    Endpoint patterns use shell-style wildcards, e.g. 'admin.*' or '*loan*'.
+    """
+    
+    def __init__(self, app=None):
+        self.always_log = []
+        self.aggregate_only = []
+        self.sample_rates = {}
+        self.default_sample_rate = 1.0
+        self.dedup_window = 300
+        self.dedup_max_entries = 10000
+        self.aggregate_flush_seconds = 60
+        self._recent_views = OrderedDict()
+        self._aggregates = {}
+        self._window_start = time.time()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Load the policy from ACTIVITY_PAGE_VIEW_POLICY"""
+        policy = app.config.get('ACTIVITY_PAGE_VIEW_POLICY', {})
+        self.always_log = policy.get('always_log', [])
+        self.aggregate_only = policy.get('aggregate_only', [])
+        self.sample_rates = policy.get('sample_rates', {})
+        self.default_sample_rate = policy.get('default_sample_rate', 1.0)
+        self.dedup_window = policy.get('dedup_window_seconds', 300)
+        self.dedup_max_entries = policy.get('dedup_max_entries', 10000)
+        self.aggregate_flush_seconds = policy.get('aggregate_flush_seconds', 60)
+    
+    @staticmethod
+    def _matches(endpoint, patterns):
+        return any(fnmatch(endpoint, pattern) for pattern in patterns)
+    
+    def sample_rate_for(self, endpoint):
+        """Sample rate of the first matching pattern, else the default"""
+        for pattern, rate in self.sample_rates.items():
+            if fnmatch(endpoint, pattern):
+                return rate
+        return self.default_sample_rate
+    
+    def decide(self, user_id, endpoint, path):
+        """
+        Return (decision, sample_rate) for a page view.
+        decision is one of LOG, SKIP or AGGREGATE.
+        """
+        endpoint = endpoint or 'unknown'
+        
+        if self._matches(endpoint, self.always_log):
+            return LOG, 1.0
+        
+        if self._matches(endpoint, self.aggregate_only):
+            return AGGREGATE, None
+        
+        if self.dedup_window and self._seen_recently(user_id, path):
+            return SKIP, None
+        
+        rate = self.sample_rate_for(endpoint)
+        if rate >= 1.0 or random.random() < rate:
+            return LOG, rate
+        return SKIP, rate
+    
+    def _seen_recently(self, user_id, path):
+        """Record the view and report whether it repeats one inside the dedup window"""
+        key = (user_id, path)
+        now = time.time()
+        
+        with self._lock:
+            last_seen = self._recent_views.pop(key, None)
+            duplicate = last_seen is not None and now - last_seen < self.dedup_window
+
+            # The window runs from the last view that was let through
+            self._recent_views[key] = last_seen if duplicate else now
+
+            # Bounded LRU: drop the oldest entries
+            while len(self._recent_views) > self.dedup_max_entries:
+                self._recent_views.popitem(last=False)
+
+        return duplicate
+    
+    def count(self, endpoint):
+        """
+        Count a view of an aggregate-only endpoint.
+        Returns the finished window's counts when it is time to write them, else None.
+        """
+        with self._lock:
+            self._aggregates[endpoint] = self._aggregates.get(endpoint, 0) + 1
+            
+            if time.time() - self._window_start < self.aggregate_flush_seconds:
+                return None
+        
+        return self.take_aggregates()
+    
+    def take_aggregates(self):
+        """Return and reset the current window as (window_start, window_end, counts)"""
+        with self._lock:
+            counts, self._aggregates = self._aggregates, {}
+            window_start = self._window_start
+            self._window_start = time.time()
+        
+        if not counts:
+            return None
+        
+        return datetime.utcfromtimestamp(window_start), datetime.utcnow(), counts
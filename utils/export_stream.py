@@ -0,0 +1,58 @@
+"""
+Streaming Export Helpers
+Generators for writing CSV, JSON Lines and gzip output chunk by chunk
+"""
+import csv
+import io
+import json
+import zlib
+
+def csv_chunks(header, rows):
+    """Yield a CSV document one row at a time"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate(0)
+    
+    # Header only when there are no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def ndjson_chunks(records):
+    """Yield one JSON document per line"""
+    for record in records:
+        yield json.dumps(record, default=str) + '\n'
+
+def json_array_chunks(records, key, extra=None):
+    """
+    Yield a JSON object whose ``key`` holds the records as an array.
+    ``extra`` is a callable returning fields added after the array
+    (evaluated once the records are exhausted, so it can report counts).
+    """
+    yield '{' + json.dumps(key) + ': ['
+    
+    first = True
+    for record in records:
+        yield ('' if first else ', ') + json.dumps(record, default=str)
+        first = False
+    
+    yield ']'
+    for name, value in (extra() if extra else {}).items():
+        yield ', ' + json.dumps(name) + ': ' + json.dumps(value, default=str)
+    yield '}\n'
+
+def gzip_chunks(chunks, level=6):
+    """Compress a stream of text chunks into a gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    
+    yield compressor.flush()
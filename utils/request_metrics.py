@@ -0,0 +1,121 @@
+"""
+Request Metrics
+Per-endpoint latency and database usage histograms exposed in Prometheus format
+"""
+from flask import g, request, current_app, has_request_context, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import time
+
+try:
+    from prometheus_client import (
+        CollectorRegistry, Histogram, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
+    )
+    from prometheus_client import multiprocess
+except ImportError:
+    Histogram = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+class RequestMetrics:
+    """
+    Records request latency, DB query count and DB time per endpoint.
+    
+    With gunicorn, set PROMETHEUS_MULTIPROC_DIR so every worker writes its
+    samples to memory-mapped files in that directory; /metrics then merges
+    all workers. Without it, /metrics reports the current process only.
+    """
+    
+    # Histograms are registered once per process and shared by every app instance
+    _metrics = None
+    
+    def __init__(self, app=None):
+        self.enabled = False
+        self.request_latency = None
+        self.db_queries = None
+        self.db_time = None
+        if app is not None:
+            self.init_app(app)
+    
+    def init_app(self, app):
+        """Create the histograms and register the /metrics endpoint"""
+        if Histogram is None:
+            app.logger.warning("prometheus_client is not installed, request metrics disabled")
+            return
+        
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        
+        self.enabled = True
+        self._create_metrics()
+        
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view)
+    
+    def _create_metrics(self):
+        """Create the histograms on first use"""
+        if RequestMetrics._metrics is None:
+            RequestMetrics._metrics = (
+                Histogram(
+                    'gm_http_request_duration_seconds',
+                    'Request latency by endpoint, method and status class',
+                    ['endpoint', 'method', 'status'],
+                    buckets=LATENCY_BUCKETS
+                ),
+                Histogram(
+                    'gm_db_queries_per_request',
+                    'Number of SQL statements executed per request',
+                    ['endpoint'],
+                    buckets=QUERY_COUNT_BUCKETS
+                ),
+                Histogram(
+                    'gm_db_time_per_request_seconds',
+                    'Time spent in SQL statements per request',
+                    ['endpoint'],
+                    buckets=LATENCY_BUCKETS
+                ),
+            )
+        
+        self.request_latency, self.db_queries, self.db_time = RequestMetrics._metrics
+    
+    def observe(self, response, duration_seconds):
+        """Record a finished request"""
+        if not self.enabled:
+            return
+        
+        # Unmatched URLs share one label so 404 scans cannot blow up cardinality
+        endpoint = request.endpoint or 'unmatched'
+        status = f'{response.status_code // 100}xx'
+        
+        self.request_latency.labels(endpoint, request.method, status).observe(duration_seconds)
+        self.db_queries.labels(endpoint).observe(g.get('db_query_count', 0))
+        self.db_time.labels(endpoint).observe(g.get('db_query_time', 0.0))
+    
+    def metrics_view(self):
+        """Prometheus scrape endpoint"""
+        token = current_app.config.get('METRICS_AUTH_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(403)
+        
+        if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        
+        return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('query_start_time', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and conn.info.get('query_start_time'):
+        elapsed = time.perf_counter() - conn.info['query_start_time'].pop()
+        g.db_query_count = g.get('db_query_count', 0) + 1
+        g.db_query_time = g.get('db_query_time', 0.0) + elapsed